@@ -40,6 +40,52 @@ def reset_engineer_availability():
     except Exception as e:
         print(f"Error resetting engineer availability: {e}")
 
+# Scheduled task: Repair drift in the per-user unread notification counters
+def reconcile_notification_counters():
+    try:
+        from services.notification_counters import reconcile_unread_counters
+        result = reconcile_unread_counters()
+        print(f"[{datetime.now()}] Notification counters reconciled: {result}")
+    except Exception as e:
+        print(f"Error reconciling notification counters: {e}")
+
+# Scheduled task: Compact old unread notifications into digests
+def notification_retention():
+    try:
+        from services.notification_retention import run_retention
+        result = run_retention()
+        print(f"[{datetime.now()}] Notification retention: {result}")
+    except Exception as e:
+        print(f"Error running notification retention: {e}")
+
+# Scheduled task: Make future-dated imported prices current once due, then
+# re-price hub stock when prices changed (or daily)
+def revalue_hub_stock():
+    try:
+        from services.price_history import promote_due_prices
+        promoted = promote_due_prices()
+        if promoted:
+            print(f"[{datetime.now()}] Due prices made current: {promoted}")
+    except Exception as e:
+        print(f"Error promoting due prices: {e}")
+    try:
+        from services.revaluation import revaluation_due, revalue_stock
+        if revaluation_due():
+            result = revalue_stock()
+            print(f"[{datetime.now()}] Hub stock revalued: {result}")
+    except Exception as e:
+        print(f"Error revaluing hub stock: {e}")
+
+# Scheduled task: Store missing payable amounts and refresh unpaid ones after price changes
+def refresh_pickup_valuations():
+    try:
+        from services.valuation import refresh_valuations
+        refreshed = refresh_valuations()
+        if refreshed:
+            print(f"[{datetime.now()}] Pickup valuations refreshed: {refreshed}")
+    except Exception as e:
+        print(f"Error refreshing pickup valuations: {e}")
+
 def create_app():
     app = Flask(__name__)
 
@@ -50,11 +96,26 @@ def create_app():
     # Initialize MongoDB
     mongo.init_app(app)
 
+    # Ensure query indexes exist (idempotent)
+    try:
+        from services.indexes import ensure_indexes
+        ensure_indexes(mongo.db)
+    except Exception as e:
+        print(f"Failed to ensure indexes: {e}")
+
     # Initialize APScheduler for background tasks (optional)
     if SCHEDULER_AVAILABLE and BackgroundScheduler is not None:
         try:
             scheduler = BackgroundScheduler()
             scheduler.add_job(func=reset_engineer_availability, trigger="cron", hour=0, minute=0)
+            # Also brings unread counters in line with existing notifications right after start-up
+            scheduler.add_job(func=reconcile_notification_counters, trigger="interval", minutes=30,
+                              next_run_time=datetime.now())
+            scheduler.add_job(func=notification_retention, trigger="cron", hour=3, minute=0)
+            scheduler.add_job(func=revalue_hub_stock, trigger="interval", minutes=60)
+            # First run right after start-up, in the background
+            scheduler.add_job(func=refresh_pickup_valuations, trigger="interval", minutes=60,
+                              next_run_time=datetime.now())
             scheduler.start()
         except Exception as e:
             print(f"Failed to start scheduler: {e}")
@@ -0,0 +1,214 @@
+"""
+Micro-benchmarks of the pricing and geo kernels.
+
+Each case runs a kernel on generated data (fixed seed) at several sizes and
+records the best time per call over a few repeats. Results are compared with a
+JSON baseline; any case slower than the baseline by more than --threshold
+fails the run (exit status 1), so it can gate a change in CI. Baselines are
+machine specific: save one on the machine that will run the comparison.
+
+No database is needed: pricing runs against the built-in price tables.
+
+Usage:
+  python benchmarks/run_benchmarks.py                  # compare with benchmarks/baseline.json
+  python benchmarks/run_benchmarks.py --save           # (re)write the baseline
+  python benchmarks/run_benchmarks.py --only pricing --threshold 0.5
+  python benchmarks/run_benchmarks.py --json           # machine-readable output
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.clustering import form_clusters, nearest_hub  # noqa: E402
+from services.geo import haversine_km, haversine_matrix  # noqa: E402
+from services.price_tables import DEFAULT_CATEGORY_RATES, PriceTables  # noqa: E402
+from services.pricing_engine import CONDITION_FACTORS, calculate_final_price, price_batch, price_pickups  # noqa: E402
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+DEFAULT_THRESHOLD = 0.25
+REPEATS = 5
+
+# Mumbai-sized box around the hubs
+LAT_RANGE = (18.90, 19.30)
+LNG_RANGE = (72.80, 73.00)
+HUBS = [
+    {"name": "North Warehouse (Borivali)", "lat": 19.2300, "lng": 72.8567},
+    {"name": "West Warehouse (Andheri)", "lat": 19.1136, "lng": 72.8697},
+    {"name": "East Warehouse (Thane)", "lat": 19.2183, "lng": 72.9781},
+    {"name": "South Warehouse (Colaba)", "lat": 18.9067, "lng": 72.8147},
+    {"name": "CENTRAL HUB (Ghatkopar)", "lat": 19.0860, "lng": 72.9090},
+]
+TABLES = PriceTables(0, DEFAULT_CATEGORY_RATES, {'copper': 850.0, 'aluminum': 150.0})
+
+
+def _points(rng, n):
+    return [(rng.uniform(*LAT_RANGE), rng.uniform(*LNG_RANGE)) for _ in range(n)]
+
+
+def _items(rng, n):
+    categories = list(DEFAULT_CATEGORY_RATES) + ['Unknown']
+    return (
+        [rng.choice(categories) for _ in range(n)],
+        [rng.uniform(0.1, 40) for _ in range(n)],
+        [rng.choice(list(CONDITION_FACTORS)) for _ in range(n)],
+        [rng.randint(0, 12) for _ in range(n)],
+    )
+
+
+def _pickups(rng, n):
+    categories = list(DEFAULT_CATEGORY_RATES)
+    return [
+        {
+            '_id': i,
+            'latitude': lat,
+            'longitude': lng,
+            'approx_weight': rng.randint(500, 30000),
+            'items': [{'type': rng.choice(categories), 'weight': rng.randint(100, 10000)}
+                      for _ in range(rng.randint(1, 4))],
+        }
+        for i, (lat, lng) in enumerate(_points(rng, n))
+    ]
+
+
+# ---------------- cases: name -> (sizes, setup(rng, n) -> callable) ----------------
+def _pricing_per_item(rng, n):
+    rows = list(zip(*_items(rng, n)))
+    return lambda: [calculate_final_price(c, w, k, a, TABLES) for c, w, k, a in rows]
+
+
+def _pricing_batch(rng, n):
+    columns = _items(rng, n)
+    return lambda: price_batch(*columns, tables=TABLES)
+
+
+def _pricing_pickups(rng, n):
+    pickups = _pickups(rng, n)
+    return lambda: price_pickups(pickups, tables=TABLES)
+
+
+def _haversine_loop(rng, n):
+    origin = _points(rng, 1)[0]
+    points = _points(rng, n)
+    return lambda: [haversine_km(origin[0], origin[1], lat, lng) for lat, lng in points]
+
+
+def _haversine_matrix(rng, n):
+    points = _points(rng, n)
+    lats, lngs = [p[0] for p in points], [p[1] for p in points]
+    return lambda: haversine_matrix(lats, lngs, lats, lngs)
+
+
+def _nearest_hub(rng, n):
+    points = _points(rng, n)
+    return lambda: [nearest_hub(lat, lng, HUBS) for lat, lng in points]
+
+
+def _clustering(rng, n):
+    pickups = _pickups(rng, n)
+    # Radius small enough that clusters stay local, as in a dense city
+    return lambda: form_clusters(pickups, HUBS[:4], radius_km=3)
+
+
+CASES = {
+    'pricing.per_item': ((100, 1000, 10000), _pricing_per_item),
+    'pricing.batch': ((100, 1000, 10000, 100000), _pricing_batch),
+    'pricing.pickups': ((100, 1000, 10000), _pricing_pickups),
+    'geo.haversine_loop': ((100, 1000, 10000), _haversine_loop),
+    'geo.haversine_matrix': ((10, 100, 500), _haversine_matrix),
+    'geo.nearest_hub': ((100, 1000, 10000), _nearest_hub),
+    'clustering.form_clusters': ((50, 200, 500), _clustering),
+}
+
+
+def run(only=None):
+    """Seconds per call of every case, keyed "<case>[<size>]" """
+    results = {}
+    for name, (sizes, setup) in CASES.items():
+        if only and not any(o in name for o in only):
+            continue
+        for size in sizes:
+            fn = setup(random.Random(42), size)
+            # Enough calls per repeat for ~0.2 s, so timer noise stays small
+            number, _ = timeit.Timer(fn).autorange()
+            best = min(timeit.repeat(fn, number=number, repeat=REPEATS)) / number
+            results[f'{name}[{size}]'] = best
+    return results
+
+
+def compare(results, baseline):
+    """List of (key, seconds, baseline seconds, ratio) for every case with a baseline"""
+    rows = []
+    for key, seconds in results.items():
+        base = baseline.get(key)
+        if base:
+            rows.append((key, seconds, base, seconds / base))
+    return rows
+
+
+def _format(seconds):
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return f'{seconds / scale:8.2f} {unit}'
+    return f'{seconds / 1e-9:8.2f} ns'
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--save', action='store_true', help='Write the results as the new baseline')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='Baseline JSON file')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Allowed slowdown before failing (0.25 = 25%%)')
+    parser.add_argument('--only', action='append', help='Run cases whose name contains this (repeatable)')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    results = run(args.only)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f).get('results', {})
+    rows = {key: (base, ratio) for key, _, base, ratio in compare(results, baseline)}
+    regressions = [key for key, (_, ratio) in rows.items() if ratio > 1 + args.threshold]
+
+    if args.json:
+        print(json.dumps({
+            'results': results,
+            'baseline': {key: base for key, (base, _) in rows.items()},
+            'regressions': regressions,
+            'threshold': args.threshold,
+        }, indent=2))
+    else:
+        for key, seconds in results.items():
+            line = f'{key:<36} {_format(seconds)}'
+            if key in rows:
+                base, ratio = rows[key]
+                flag = '  REGRESSION' if key in regressions else ''
+                line += f'   baseline {_format(base)}   {ratio:5.2f}x{flag}'
+            print(line)
+
+    if args.save:
+        # Keep baselines of cases that were not run this time
+        saved = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                saved = json.load(f).get('results', {})
+        saved.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump({'python': sys.version.split()[0], 'results': saved}, f, indent=2, sort_keys=True)
+        print(f'Baseline written to {args.baseline}')
+        return 0
+
+    if regressions:
+        print(f'{len(regressions)} case(s) slower than baseline by more than {args.threshold:.0%}', file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
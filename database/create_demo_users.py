@@ -17,7 +17,9 @@ def create_demo_user(name, email, mobile, address, age, password, role):
             'address': address,
             'age': age,
             'password': generate_password_hash(password),
-            'role': role
+            'role': role,
+            'name_lower': name.lower(),
+            'email_lower': email.lower()
         })
 
 # Demo users
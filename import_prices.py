@@ -0,0 +1,48 @@
+"""
+Import a daily price file into the effective-dated price history.
+
+The file is CSV with a header of `name,price_per_kg` and optional `kind`
+(category or metal, default category) and `date` (ISO date) columns. Rows
+without a date take --date (default: today). Re-importing a file overwrites
+the same versions instead of duplicating them; rows that are the newest
+effective version also become the current rate, and running app workers pick
+the change up on their next price-table version check. Rows dated in the
+future become current when the app's hourly job finds them due.
+
+Usage:
+  python import_prices.py prices-2024-06-10.csv                  # dry-run: parse and summarise
+  python import_prices.py prices-2024-06-10.csv --date 2024-06-10 --apply
+"""
+from pymongo import MongoClient
+from datetime import datetime, date
+import os
+import argparse
+
+from services.price_history import InvalidPriceFile, import_prices, parse_price_file
+
+MONGO_URI = os.getenv('MONGO_URI', 'mongodb://localhost:27017/ewaste_db')
+
+parser = argparse.ArgumentParser()
+parser.add_argument('file', help='CSV price file')
+parser.add_argument('--date', help='Effective date of rows without one (YYYY-MM-DD, default today)')
+parser.add_argument('--apply', action='store_true', help='Write to the database (otherwise dry-run)')
+args = parser.parse_args()
+
+file_date = datetime.fromisoformat(args.date) if args.date else datetime.combine(date.today(), datetime.min.time())
+
+try:
+    with open(args.file, newline='', encoding='utf-8-sig') as f:
+        rows = parse_price_file(f, file_date)
+except InvalidPriceFile as e:
+    raise SystemExit(f'Invalid price file: {e}')
+
+print(f'Parsed {len(rows)} price rows.')
+if not args.apply:
+    print('Dry run mode. Use --apply to import.')
+    for row in rows[:20]:
+        print(f"{row['effective_from']:%Y-%m-%d} {row['kind']:<8} {row['name']:<20} {row['price_per_kg']:>10.2f}")
+else:
+    client = MongoClient(MONGO_URI)
+    db = client['ewaste_db']
+    result = import_prices(rows, db=db)
+    print(f"Imported {result['imported']} rows; {result['current']} rates are now current.")
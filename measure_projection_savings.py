@@ -0,0 +1,95 @@
+"""
+Measure bytes transferred per page with and without the view projections.
+
+For each page, the representative reads are run twice, once fetching whole
+documents and once with the registered projection, and the BSON size of the
+returned documents is summed.
+
+Usage:
+  python measure_projection_savings.py
+  python measure_projection_savings.py --json     # machine-readable output
+"""
+import argparse
+import json
+import os
+
+import bson
+from pymongo import MongoClient
+
+from services.projections import projection
+
+MONGO_URI = os.getenv('MONGO_URI', 'mongodb://localhost:27017/ewaste_db')
+
+# page -> list of (collection, filter, projection name, limit)
+PAGES = {
+    'warehouse dashboard': [
+        ('collection_clusters', {}, 'cluster_card', 0),
+        ('users', {'role': 'engineer'}, 'roster_entry', 0),
+        ('users', {'role': 'driver'}, 'roster_entry', 0),
+        ('users', {'role': 'recycler'}, 'roster_entry', 0),
+        ('pickup_requests', {'status': 'collected'}, 'inventory_row', 10),
+        ('pickup_requests', {'cluster_id': {'$ne': None}}, 'cluster_member', 0),
+    ],
+    'engineer / driver dashboard': [
+        ('collection_clusters', {'status': {'$in': ['assigned', 'scheduled', 'in_progress']}}, 'cluster_card', 0),
+        ('pickup_requests', {'cluster_id': {'$ne': None}}, 'pickup_card', 0),
+    ],
+    'route map': [
+        ('pickup_requests', {'cluster_id': {'$ne': None}}, 'route_waypoint', 20),
+    ],
+    'user dashboard': [
+        ('pickup_requests', {}, 'pickup_card', 20),
+    ],
+    'inspection page': [
+        ('pickup_requests', {}, 'pickup_inspection', 1),
+    ],
+    'admin user directory': [
+        ('users', {}, 'user_directory', 50),
+    ],
+    'recycler queue': [
+        ('pickup_requests', {'status': 'collected'}, 'recycler_item', 25),
+        ('pickup_requests', {'status': 'recycled'}, 'recycler_item', 6),
+    ],
+    'invoices': [
+        ('invoices', {}, 'invoice_row', 25),
+    ],
+}
+
+
+def _bytes(cursor):
+    return sum(len(bson.encode(doc)) for doc in cursor)
+
+
+def measure(db):
+    results = []
+    for page, reads in PAGES.items():
+        before = after = 0
+        for collection, query, view, limit in reads:
+            before += _bytes(db[collection].find(query).limit(limit))
+            after += _bytes(db[collection].find(query, projection(view)).limit(limit))
+        saved = (1 - after / before) * 100 if before else 0
+        results.append({'page': page, 'bytes_before': before, 'bytes_after': after, 'saved_pct': round(saved, 1)})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    client = MongoClient(MONGO_URI)
+    db = client.get_default_database(default='ewaste_db')
+    results = measure(db)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'Page':<30}{'Before (B)':>14}{'After (B)':>14}{'Saved':>9}")
+    print('-' * 67)
+    for r in results:
+        print(f"{r['page']:<30}{r['bytes_before']:>14}{r['bytes_after']:>14}{r['saved_pct']:>8}%")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Migration: convert legacy driver notifications to the common notification schema.
+
+Older driver route updates were stored as
+  {engineer_id: ObjectId, type, driver_id, message, route_data, timestamp, read}
+while everything else uses
+  {recipient_id: str, title, message, type, read, related_data, created_at}.
+The conversion runs server-side as a single update_many with a pipeline.
+
+Usage:
+  python migrate_notifications_schema.py        # dry-run: shows how many documents match
+  python migrate_notifications_schema.py --apply
+
+Unread counters pick up the migrated documents on the next reconciliation
+(the app schedules one right after start-up).
+"""
+from pymongo import MongoClient
+import os
+import argparse
+
+MONGO_URI = os.getenv('MONGO_URI', 'mongodb://localhost:27017/ewaste_db')
+client = MongoClient(MONGO_URI)
+db = client['ewaste_db']
+notifications = db.notifications
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--apply', action='store_true', help='Apply changes (otherwise dry-run)')
+args = parser.parse_args()
+
+legacy = {'recipient_id': {'$exists': False}, 'engineer_id': {'$exists': True}}
+
+TITLES = {
+    'route_update': 'Driver Route Update',
+    'trip_complete': 'Trip Completed',
+}
+
+pipeline = [
+    {'$set': {
+        'recipient_id': {'$toString': '$engineer_id'},
+        'created_at': {'$ifNull': ['$created_at', '$timestamp']},
+        'title': {'$ifNull': ['$title', {'$switch': {
+            'branches': [{'case': {'$eq': ['$type', t]}, 'then': title} for t, title in TITLES.items()],
+            'default': 'Notification'
+        }}]},
+        'related_data': {'driver_id': '$driver_id', 'route': '$route_data'},
+        'read': {'$ifNull': ['$read', False]},
+    }},
+    {'$unset': ['engineer_id', 'timestamp', 'driver_id', 'route_data']},
+]
+
+count = notifications.count_documents(legacy)
+print(f'Found {count} legacy notifications keyed by engineer_id.')
+if not args.apply:
+    print('Dry run mode. Use --apply to perform updates.')
+    for doc in notifications.find(legacy).limit(20):
+        print(f"DOC {doc['_id']} engineer_id={doc.get('engineer_id')} type={doc.get('type')} -> recipient_id={doc.get('engineer_id')}")
+else:
+    print('Applying updates...')
+    result = notifications.update_many(legacy, pipeline)
+    print(f'Updated {result.modified_count} notifications.')
+
+print('Done.')
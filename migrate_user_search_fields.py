@@ -0,0 +1,42 @@
+"""
+Migration: store the lower-cased name and email the admin directory searches on.
+
+Accounts created before case-insensitive search have no `name_lower` /
+`email_lower` and do not show up in directory searches until this runs. The
+fields are filled server-side with a single update_many with a pipeline.
+
+Usage:
+  python migrate_user_search_fields.py        # dry-run: shows how many users match
+  python migrate_user_search_fields.py --apply
+"""
+from pymongo import MongoClient
+import os
+import argparse
+
+MONGO_URI = os.getenv('MONGO_URI', 'mongodb://localhost:27017/ewaste_db')
+client = MongoClient(MONGO_URI)
+db = client['ewaste_db']
+users = db.users
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--apply', action='store_true', help='Apply changes (otherwise dry-run)')
+args = parser.parse_args()
+
+missing = {'$or': [{'name_lower': {'$exists': False}}, {'email_lower': {'$exists': False}}]}
+
+pipeline = [
+    {'$set': {
+        'name_lower': {'$toLower': {'$ifNull': ['$name', '']}},
+        'email_lower': {'$toLower': {'$ifNull': ['$email', '']}},
+    }},
+]
+
+count = users.count_documents(missing)
+print(f'Found {count} users without search fields.')
+if not args.apply:
+    print('Dry run mode. Use --apply to perform updates.')
+else:
+    result = users.update_many(missing, pipeline)
+    print(f'Updated {result.modified_count} users.')
+
+print('Done.')
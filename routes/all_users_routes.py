@@ -1,9 +1,16 @@
-from flask import Blueprint, render_template, session, redirect, url_for
+from flask import Blueprint, render_template, session, redirect, request
 from routes.auth_routes import login_required
 from mongo import mongo
+from services.projections import projection
+from services.user_directory import prefix_filter
+from bson import ObjectId
 
 all_users_bp = Blueprint('all_users', __name__)
 
+PAGE_SIZE = 50
+ROLES = ['user', 'engineer', 'driver', 'recycler', 'warehouse', 'admin']
+
+
 @all_users_bp.route('/users')
 @login_required
 def all_users_page():
@@ -11,5 +18,46 @@ def all_users_page():
     if session.get('role') not in ['admin', 'warehouse']:
         return redirect('/')
 
-    users = list(mongo.db.users.find())
-    return render_template('all_users.html', users=users, user_role=session.get('role'))
+    role = request.args.get('role', '').strip()
+    search = request.args.get('q', '').strip()
+    after = request.args.get('after')
+    before = request.args.get('before')
+
+    query = {}
+    if role in ROLES:
+        query['role'] = role
+    if search:
+        # Case-insensitive prefix on the lower-cased copies
+        query.update(prefix_filter(search))
+
+    # Keyset pagination on _id keeps every page an index range scan
+    direction = 1
+    if after and ObjectId.is_valid(after):
+        query['_id'] = {'$gt': ObjectId(after)}
+    elif before and ObjectId.is_valid(before):
+        query['_id'] = {'$lt': ObjectId(before)}
+        direction = -1
+
+    # Walk the index in _id order and apply the search as a filter: a page stops
+    # after PAGE_SIZE + 1 matches and never sorts the prefix matches in memory
+    index = [('role', 1), ('_id', 1)] if 'role' in query else [('_id', 1)]
+    users = list(mongo.db.users.find(query, projection('user_directory'))
+                 .sort('_id', direction).hint(index).limit(PAGE_SIZE + 1))
+    has_more = len(users) > PAGE_SIZE
+    users = users[:PAGE_SIZE]
+    if direction == -1:
+        users.reverse()
+
+    next_after = str(users[-1]['_id']) if users and (has_more or direction == -1) else None
+    prev_before = str(users[0]['_id']) if users and (has_more or direction == 1) and (after or before) else None
+
+    return render_template(
+        'all_users.html',
+        users=users,
+        user_role=session.get('role'),
+        roles=ROLES,
+        selected_role=role,
+        search=search,
+        next_after=next_after,
+        prev_before=prev_before
+    )
@@ -1,5 +1,6 @@
 from flask import Blueprint, render_template, request, redirect, session, flash, url_for
 from mongo import mongo
+from services.projections import projection
 from functools import wraps
 from werkzeug.security import check_password_hash
 
@@ -23,7 +24,7 @@ def login():
     email = request.form.get('email')
     password = request.form.get('password')
     
-    user = mongo.db.users.find_one({'email': email})
+    user = mongo.db.users.find_one({'email': email}, projection('user_login'))
     
     # Check password using werkzeug (handles both hashed and plain text)
     if user:
@@ -101,16 +102,18 @@ def register():
     password = request.form.get('password')
     role = 'user' # Default role for self-registration
 
-    if mongo.db.users.find_one({'email': email}):
+    if mongo.db.users.find_one({'email': email}, {'_id': 1}):
         flash('Email already registered', 'error')
         return redirect(url_for('auth.register'))
 
     from werkzeug.security import generate_password_hash
+    from services.user_directory import search_fields
     mongo.db.users.insert_one({
         'name': name,
         'email': email,
         'password': generate_password_hash(password),
-        'role': role
+        'role': role,
+        **search_fields(name, email)
     })
     flash('Registration successful! Please login.', 'success')
     return redirect(url_for('auth.login'))
\ No newline at end of file
@@ -2,6 +2,14 @@ from flask import Blueprint, render_template, session, redirect, url_for, jsonif
 from bson import ObjectId
 from datetime import timedelta, datetime
 from mongo import mongo
+from services.projections import projection
+from services.location_ingest import ClusterNotAssigned, InvalidBatch, decode_batch, normalize_fixes, ingest_fixes
+from services.roster_cache import driver_name, assigned_engineer_ids
+from services.sampling import next_sampling
+from services.position_store import get_position_store
+from services.eta import get_eta_engine
+from services.geofence import get_geofence_monitor
+from services.trajectory import save_trajectory
 
 driver_bp = Blueprint('driver', __name__)
 
@@ -14,14 +22,17 @@ def dashboard():
     driver_id = session.get('user_id')
 
     # Find clusters assigned to this driver
-    clusters = list(mongo.db.collection_clusters.find({'driver_id': driver_id}))
+    clusters = list(mongo.db.collection_clusters.find({'driver_id': driver_id}, projection('cluster_card')))
+
+    # Fetch all pickups of these clusters in one query
+    pickup_ids = [u['user_id'] for c in clusters for u in c.get('users', [])]
+    pickups_by_id = {
+        p['_id']: p for p in mongo.db.pickup_requests.find({'_id': {'$in': pickup_ids}}, projection('pickup_card'))
+    } if pickup_ids else {}
 
     clusters_with_pickups = []
     for c in clusters:
-        u_ids = [u['user_id'] for u in c.get('users', [])]
-        pickup_docs = []
-        if u_ids:
-            pickup_docs = list(mongo.db.pickup_requests.find({'_id': {'$in': u_ids}}))
+        pickup_docs = [pickups_by_id[u['user_id']] for u in c.get('users', []) if u['user_id'] in pickups_by_id]
 
         # compute schedule times
         scheduled_for = c.get('scheduled_for')
@@ -55,7 +66,7 @@ def route_view(cluster_id):
     cluster = mongo.db.collection_clusters.find_one({
         '_id': ObjectId(cluster_id),
         'driver_id': driver_id
-    })
+    }, projection('cluster_route'))
     
     if not cluster:
         return redirect(url_for('driver.dashboard'))
@@ -65,7 +76,10 @@ def route_view(cluster_id):
     pickup_docs = []
     
     if u_ids:
-        pickup_docs = list(mongo.db.pickup_requests.find({'_id': {'$in': u_ids}}))
+        pickup_docs = list(mongo.db.pickup_requests.find({'_id': {'$in': u_ids}}, projection('route_waypoint')))
+        # Keep the cluster's stop order (stop numbers match the server-side geofences)
+        order = {pid: i for i, pid in enumerate(u_ids)}
+        pickup_docs.sort(key=lambda p: order.get(p['_id'], len(order)))
     
     # Prepare waypoints with coordinates
     waypoints = []
@@ -78,7 +92,7 @@ def route_view(cluster_id):
             'contact': pickup.get('phone_number', '')
         })
     
-    return render_template('driver/route.html', waypoints=waypoints)
+    return render_template('driver/route.html', waypoints=waypoints, cluster_id=cluster_id)
 
 
 @driver_bp.route('/api/driver/share-route', methods=['POST'])
@@ -93,31 +107,30 @@ def share_route():
     try:
         route_data = {
             'driver_id': driver_id,
-            'driver_name': mongo.db.users.find_one({'_id': ObjectId(driver_id)}, {'name': 1}).get('name', 'Unknown'),
+            'driver_name': driver_name(driver_id),
             'route': data.get('route', {}),
             'timestamp': datetime.fromisoformat(data.get('timestamp', datetime.now().isoformat())),
             'status': 'active'
         }
         
-        # Store route in real-time tracking collection
-        mongo.db.active_routes.insert_one(route_data)
+        # One route-state document per active trip, updated in place
+        mongo.db.active_routes.update_one(
+            {'driver_id': driver_id, 'status': 'active'},
+            {'$set': route_data, '$setOnInsert': {'started_at': datetime.utcnow()}},
+            upsert=True
+        )
+        # Every update is kept in the history collection (expires by TTL)
+        mongo.db.route_history.insert_one(dict(route_data, created_at=datetime.utcnow()))
         
         # Notify engineers assigned to this driver
-        engineers = list(mongo.db.users.find(
-            {'role': 'engineer', 'assigned_drivers': driver_id},
-            {'_id': 1}
-        ))
-        
-        for engineer in engineers:
-            mongo.db.notifications.insert_one({
-                'engineer_id': engineer['_id'],
-                'type': 'route_update',
-                'driver_id': driver_id,
-                'message': f"Driver {route_data['driver_name']} is at Stop {route_data['route'].get('stopNumber', 0)}",
-                'route_data': route_data['route'],
-                'timestamp': datetime.now(),
-                'read': False
-            })
+        from routes.notification_routes import create_notifications
+        create_notifications([{
+            'recipient_id': engineer_id,
+            'title': 'Driver Route Update',
+            'message': f"Driver {route_data['driver_name']} is at Stop {route_data['route'].get('stopNumber', 0)}",
+            'notification_type': 'route_update',
+            'related_data': {'driver_id': driver_id, 'route': route_data['route']}
+        } for engineer_id in assigned_engineer_ids(driver_id)])
         
         return jsonify({'success': True}), 200
     except Exception as e:
@@ -134,21 +147,48 @@ def update_location():
     data = request.get_json()
     
     try:
-        # Update driver location in database
-        mongo.db.driver_locations.update_one(
-            {'driver_id': driver_id},
-            {
-                '$set': {
-                    'lat': data.get('lat'),
-                    'lng': data.get('lng'),
-                    'stopNumber': data.get('stopNumber', 0),
-                    'timestamp': datetime.fromisoformat(data.get('timestamp', datetime.now().isoformat()))
-                }
-            },
-            upsert=True
-        )
+        # A single fix is stored like a batch of one
+        fixes = normalize_fixes([{'lat': data.get('lat'), 'lng': data.get('lng'), 't': data.get('timestamp')}])
+        ingest_fixes(driver_id, fixes, cluster_id=data.get('cluster_id'), stop_number=data.get('stopNumber', 0))
         
         return jsonify({'success': True}), 200
+    except InvalidBatch as e:
+        return jsonify({'error': str(e)}), 400
+    except ClusterNotAssigned as e:
+        return jsonify({'error': str(e)}), 403
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@driver_bp.route('/api/driver/locations', methods=['POST'])
+def ingest_locations():
+    """Store a batch of timestamped GPS fixes (JSON or msgpack, optionally gzip)"""
+    if session.get('role') != 'driver':
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    driver_id = session.get('user_id')
+    
+    try:
+        batch = decode_batch(
+            request.get_data(),
+            content_type=request.content_type,
+            content_encoding=request.headers.get('Content-Encoding', '')
+        )
+        fixes = normalize_fixes(batch['fixes'])
+        result = ingest_fixes(driver_id, fixes, cluster_id=batch.get('cluster_id'), stop_number=batch.get('stop_number'))
+        
+        return jsonify({
+            'success': True,
+            'accepted': result['accepted'],
+            'current_stop': result['current_stop'],
+            'events': [{'event': e['event'], 'pickup_id': e['pickup_id']} for e in result['events']],
+            # How the app should sample and upload from now on
+            'sampling': next_sampling(driver_id, batch.get('cluster_id'), fixes)
+        }), 200
+    except InvalidBatch as e:
+        return jsonify({'error': str(e)}), 400
+    except ClusterNotAssigned as e:
+        return jsonify({'error': str(e)}), 403
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -168,25 +208,27 @@ def trip_complete():
             {'driver_id': driver_id, 'status': 'active'},
             {'$set': {'status': 'completed', 'completed_at': datetime.now()}}
         )
-        
-        # Get driver name
-        driver = mongo.db.users.find_one({'_id': ObjectId(driver_id)}, {'name': 1})
+
+        # Drop the cached estimates and stop fences of the trip's cluster
+        position = get_position_store().get(driver_id)
+        if position and position.get('cluster_id'):
+            get_eta_engine().forget(position['cluster_id'])
+            get_geofence_monitor().forget(position['cluster_id'])
+            # Keep the driven trajectory before the raw GPS history expires
+            try:
+                save_trajectory(position['cluster_id'])
+            except Exception as e:
+                print(f"Saving trajectory of cluster {position['cluster_id']} failed: {e}")
         
         # Notify engineers
-        engineers = list(mongo.db.users.find(
-            {'role': 'engineer', 'assigned_drivers': driver_id},
-            {'_id': 1}
-        ))
-        
-        for engineer in engineers:
-            mongo.db.notifications.insert_one({
-                'engineer_id': engineer['_id'],
-                'type': 'trip_complete',
-                'driver_id': driver_id,
-                'message': f"Driver {driver.get('name', 'Unknown')} completed all {data.get('completedStops', 0)} stops",
-                'timestamp': datetime.now(),
-                'read': False
-            })
+        from routes.notification_routes import create_notifications
+        create_notifications([{
+            'recipient_id': engineer_id,
+            'title': 'Trip Completed',
+            'message': f"Driver {driver_name(driver_id)} completed all {data.get('completedStops', 0)} stops",
+            'notification_type': 'trip_complete',
+            'related_data': {'driver_id': driver_id}
+        } for engineer_id in assigned_engineer_ids(driver_id)])
         
         return jsonify({'success': True}), 200
     except Exception as e:
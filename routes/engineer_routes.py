@@ -2,11 +2,14 @@ from flask import Blueprint, render_template, request, jsonify, session, redirec
 from bson import ObjectId
 from datetime import datetime
 from mongo import mongo
-try:
-    from services.pricing_engine import calculate_final_price
-except Exception:
-    # Fallback to top-level pricing_engine if services package import fails
-    from pricing_engine import calculate_final_price
+from services.projections import projection
+from services.position_store import get_position_store
+from services.eta import get_eta_engine
+from services.geofence import get_geofence_monitor
+from services.trajectory import save_trajectory
+from services.pricing_engine import calculate_final_price, price_batch, price_pickups
+from services.price_tables import weight_kg
+from services.valuation import store_valuation
 
 engineer_bp = Blueprint("engineer", __name__)
 
@@ -21,29 +24,35 @@ def dashboard():
     # 1. Find clusters assigned to this engineer
     assigned_clusters = list(mongo.db.collection_clusters.find({
         "engineer_id": engineer_id
-    }))
+    }, projection("cluster_card")))
     
-    # 2. Get individual pickups from these clusters
+    # 2. Get individual pickups from these clusters (one query)
     pickup_ids = []
     for c in assigned_clusters:
         for u in c.get("users", []):
             pickup_ids.append(u["user_id"])
+    pickups_by_id = {
+        p['_id']: p for p in mongo.db.pickup_requests.aggregate([
+            {'$match': {'_id': {'$in': pickup_ids}}},
+            {'$project': projection('engineer_pickup_card')},
+        ])
+    } if pickup_ids else {}
+
+    # Driver and doctor names (one query)
+    staff_oids = [ObjectId(c[k]) for c in assigned_clusters for k in ('driver_id', 'doctor_id')
+                  if c.get(k) and ObjectId.is_valid(c[k])]
+    staff = {
+        str(u['_id']): u for u in mongo.db.users.find({'_id': {'$in': staff_oids}}, projection('user_name'))
+    } if staff_oids else {}
             
-    # 3. Fetch pickup details grouped by cluster
+    # 3. Group pickup details by cluster
     clusters_with_pickups = []
     for c in assigned_clusters:
-        u_ids = [u['user_id'] for u in c.get('users', [])]
-        pickup_docs = []
-        if u_ids:
-            pickup_docs = list(mongo.db.pickup_requests.find({'_id': {'$in': u_ids}}))
+        pickup_docs = [pickups_by_id[u['user_id']] for u in c.get('users', []) if u['user_id'] in pickups_by_id]
 
         # Attach driver and doctor info
-        driver = None
-        doctor = None
-        if c.get('driver_id'):
-            driver = mongo.db.users.find_one({'_id': ObjectId(c['driver_id'])}) if ObjectId.is_valid(c['driver_id']) else None
-        if c.get('doctor_id'):
-            doctor = mongo.db.users.find_one({'_id': ObjectId(c['doctor_id'])}) if ObjectId.is_valid(c['doctor_id']) else None
+        driver = staff.get(c.get('driver_id'))
+        doctor = staff.get(c.get('doctor_id'))
 
         c['_id_str'] = str(c.get('_id'))
         clusters_with_pickups.append({
@@ -83,7 +92,7 @@ def availability_settings():
         return redirect(url_for("engineer.dashboard"))
     
     # Fetch current engineer availability
-    engineer = mongo.db.users.find_one({"_id": ObjectId(engineer_id)})
+    engineer = mongo.db.users.find_one({"_id": ObjectId(engineer_id)}, projection("user_availability"))
     is_available = engineer.get("available_tomorrow", True) if engineer else True
     
     return render_template("engineer/availability.html", is_available=is_available)
@@ -92,7 +101,7 @@ def availability_settings():
 # ---------------- INSPECTION PAGE ----------------
 @engineer_bp.route("/engineer/inspect/<pickup_id>")
 def inspect_pickup(pickup_id):
-    pickup = mongo.db.pickup_requests.find_one({"_id": ObjectId(pickup_id)})
+    pickup = mongo.db.pickup_requests.find_one({"_id": ObjectId(pickup_id)}, projection("pickup_inspection"))
     return render_template(
         "engineer/inspect_new.html",
         pickup=pickup
@@ -102,41 +111,70 @@ def inspect_pickup(pickup_id):
 # ---------------- LIVE PRICE API ----------------
 @engineer_bp.route("/engineer/calculate-price", methods=["POST"])
 def calculate_price_api():
-    data = request.json
-    
-    # Convert grams to kg for pricing engine
-    weight_kg = float(data["weight"]) / 1000 if float(data["weight"]) > 0 else 0
+    data = request.json or {}
+    try:
+        age_years = int(data.get("age_years") or 0)
+    except (TypeError, ValueError):
+        return jsonify({"error": "age_years must be a whole number"}), 400
 
     pricing = calculate_final_price(
-        category=data["category"],
-        weight=weight_kg,
-        condition=data["condition"],
-        age_years=int(data["age_years"])
+        category=data.get("category"),
+        weight=weight_kg(data.get("weight")),
+        condition=data.get("condition"),
+        age_years=age_years
     )
 
     return jsonify(pricing)
 
 
-# ---------------- FINAL SUBMISSION ----------------
-@engineer_bp.route("/engineer/submit/<pickup_id>", methods=["POST"])
-def submit_inspection(pickup_id):
-    if session.get("role") != "engineer":
-        return jsonify({"error": "Unauthorized"}), 401
-
-    payload = request.json
-    final_price = payload.get("total_price")
+@engineer_bp.route("/engineer/calculate-price-batch", methods=["POST"])
+def calculate_price_batch_api():
+    """
+    Price many items in one call.
+
+    Body is either {"items": [{category, weight (g), condition, age_years}, ...]}
+    or {"pickup_ids": [...], "condition": ..., "age_years": ...} to value whole
+    pickups from their stored items; "as_of_inspection": true values each
+    pickup at the rates effective on its inspection date.
+    """
+    data = request.json or {}
+
+    if data.get("pickup_ids"):
+        if session.get("role") not in ["engineer", "warehouse", "admin"]:
+            return jsonify({"error": "Unauthorized"}), 401
+        try:
+            oids = [ObjectId(pid) for pid in data["pickup_ids"]]
+        except Exception:
+            return jsonify({"error": "Invalid pickup id"}), 400
+        try:
+            age_years = int(data.get("age_years") or 0)
+        except (TypeError, ValueError):
+            return jsonify({"error": "age_years must be a whole number"}), 400
+        pickups = list(mongo.db.pickup_requests.find({"_id": {"$in": oids}}, projection("pickup_valuation")))
+        values = price_pickups(
+            pickups,
+            condition=data.get("condition", "scrap"),
+            age_years=age_years,
+            as_of_field="inspected_at" if data.get("as_of_inspection") else None
+        )
+        return jsonify({
+            "pickups": [{"pickup_id": str(p["_id"]), "estimated_value": v} for p, v in zip(pickups, values)],
+            "total_value": round(sum(values), 2),
+            "currency": "INR"
+        })
 
-    # Update pickup request with final price and status
-    mongo.db.pickup_requests.update_one(
-        {"_id": ObjectId(pickup_id)},
-        {"$set": {
-            "status": "collected", # Mark as collected after inspection
-            "engineer_price": final_price,
-            "inspected_at": datetime.utcnow()
-        }}
-    )
+    items = data.get("items") or []
+    try:
+        pricing = price_batch(
+            [i.get("category") for i in items],
+            [weight_kg(i.get("weight")) for i in items],
+            [i.get("condition") for i in items],
+            [int(i.get("age_years") or 0) for i in items]
+        )
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid item"}), 400
+    return jsonify(pricing)
 
-    return jsonify({"success": True})
 
 # ---------------- COMPLETE CLUSTER (Legacy Support) ----------------
 @engineer_bp.route('/engineer/complete-cluster/<cluster_id>')
@@ -146,6 +184,12 @@ def complete_job(cluster_id):
         {'_id': ObjectId(cluster_id)},
         {'$set': {'status': 'completed'}}
     )
+    get_eta_engine().forget(cluster_id)
+    get_geofence_monitor().forget(cluster_id)
+    try:
+        save_trajectory(cluster_id)
+    except Exception as e:
+        print(f"Saving trajectory of cluster {cluster_id} failed: {e}")
     return redirect(url_for('engineer.dashboard'))
 
 
@@ -166,12 +210,15 @@ def accept_inspection(pickup_id):
             'inspection_status': 'accepted',
             'engineer_price': estimated_price,
             'engineer_id': engineer_id,
-            'accepted_at': datetime.utcnow()
+            'accepted_at': datetime.utcnow(),
+            # Date the price was set; as-of valuations use the rates of this day
+            'inspected_at': datetime.utcnow()
         }}
     )
+    store_valuation(pickup_id)
     
     # Fetch user and notify them
-    pickup = mongo.db.pickup_requests.find_one({'_id': ObjectId(pickup_id)})
+    pickup = mongo.db.pickup_requests.find_one({'_id': ObjectId(pickup_id)}, projection('pickup_owner'))
     if pickup:
         from routes.notification_routes import create_notification
         create_notification(
@@ -206,7 +253,7 @@ def reject_inspection(pickup_id):
     )
     
     # Fetch user and notify them
-    pickup = mongo.db.pickup_requests.find_one({'_id': ObjectId(pickup_id)})
+    pickup = mongo.db.pickup_requests.find_one({'_id': ObjectId(pickup_id)}, projection('pickup_owner'))
     if pickup:
         from routes.notification_routes import create_notification
         create_notification(
@@ -238,18 +285,20 @@ def mark_collected(pickup_id):
             'engineer_id': engineer_id,
             'final_weight': final_weight,
             'final_quality': final_quality,
-            'collected_at': datetime.utcnow()
+            'collected_at': datetime.utcnow(),
+            'updated_at': datetime.utcnow()
         }}
     )
+    store_valuation(pickup_id)
     
     # Notify user that collection is complete
-    pickup = mongo.db.pickup_requests.find_one({'_id': ObjectId(pickup_id)})
+    pickup = mongo.db.pickup_requests.find_one({'_id': ObjectId(pickup_id)}, projection('pickup_owner'))
     if pickup:
         from routes.notification_routes import create_notification
         create_notification(
             recipient_id=str(pickup.get('user_id')),
             title='Item Collected',
-            message=f'Your e-waste has been successfully collected (Weight: {final_weight}kg). It is now at our warehouse.',
+            message=f'Your e-waste has been successfully collected (Weight: {weight_kg(final_weight):g}kg). It is now at our warehouse.',
             notification_type='item_collected',
             related_data={'pickup_id': str(pickup_id), 'weight': final_weight}
         )
@@ -264,7 +313,7 @@ def route_view(cluster_id):
     if session.get("role") != "engineer":
         return redirect("/")
     
-    cluster = mongo.db.collection_clusters.find_one({'_id': ObjectId(cluster_id)})
+    cluster = mongo.db.collection_clusters.find_one({'_id': ObjectId(cluster_id)}, projection('cluster_route'))
     if not cluster:
         return redirect(url_for('engineer.dashboard'))
     
@@ -272,7 +321,7 @@ def route_view(cluster_id):
     u_ids = [u['user_id'] for u in cluster.get('users', [])]
     pickup_docs = []
     if u_ids:
-        pickup_docs = list(mongo.db.pickup_requests.find({'_id': {'$in': u_ids}}))
+        pickup_docs = list(mongo.db.pickup_requests.find({'_id': {'$in': u_ids}}, projection('route_waypoint')))
     
     waypoints = []
     for pickup in pickup_docs:
@@ -295,7 +344,7 @@ def track_driver(driver_id):
     engineer_id = session.get("user_id")
     
     # Verify engineer can track this driver
-    driver = mongo.db.users.find_one({'_id': ObjectId(driver_id)})
+    driver = mongo.db.users.find_one({'_id': ObjectId(driver_id)}, projection('roster_entry'))
     if not driver or driver.get('role') != 'driver':
         return redirect(url_for('engineer.dashboard'))
     
@@ -305,9 +354,7 @@ def track_driver(driver_id):
     ).sort('timestamp', -1).limit(10))
     
     # Get current location
-    current_location = mongo.db.driver_locations.find_one(
-        {'driver_id': driver_id}
-    )
+    current_location = get_position_store().get(driver_id)
     
     return render_template(
         'engineer/track_driver.html',
@@ -324,9 +371,8 @@ def get_driver_location(driver_id):
         return jsonify({'error': 'Unauthorized'}), 403
     
     try:
-        location = mongo.db.driver_locations.find_one({'driver_id': driver_id})
-        if location:
-            location['_id'] = str(location['_id'])
+        # Served from memory; no database read per poll
+        location = get_position_store().get(driver_id)
         return jsonify(location or {}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
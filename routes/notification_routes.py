@@ -1,69 +1,236 @@
-from flask import Blueprint, jsonify, session, redirect, request
+from flask import Blueprint, jsonify, session, redirect, request, Response, stream_with_context
 from mongo import mongo
+from services.projections import projection
+from services.notification_broker import get_broker
+from services.notification_outbox import NotificationOutbox
+from services.notification_counters import increment_unread, decrement_unread, get_unread
 from bson import ObjectId
+from pymongo.errors import BulkWriteError
 from datetime import datetime
+import json
+import queue
 
 notification_bp = Blueprint('notification', __name__, url_prefix='/notifications')
 
+# Seconds between keep-alive comments on an idle stream
+STREAM_HEARTBEAT_SECONDS = 15
+
+
+def _serialize(notif):
+    """Make a notification document JSON serializable"""
+    notif = dict(notif)
+    notif['_id'] = str(notif['_id'])
+    notif['created_at'] = notif['created_at'].isoformat() if notif.get('created_at') else None
+    return notif
+
+
+def _count_unread(user_id):
+    # Maintained counter: one lookup by key instead of counting documents
+    return get_unread(user_id)
+
+
+def _publish_unread(user_id):
+    """Keep the badge of the user's other open tabs in sync"""
+    if get_broker().has_subscribers(user_id):
+        get_broker().publish(user_id, {'unread': _count_unread(user_id)})
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
 @notification_bp.route('/my', methods=['GET'])
 def my_notifications():
     """Fetch all notifications for current user"""
     if not session.get('user_id'):
         return jsonify({'error': 'Unauthorized'}), 401
-    
+
     user_id = session['user_id']
     notifs = list(mongo.db.notifications.find({
         'recipient_id': user_id
-    }).sort('created_at', -1).limit(20))
-    
+    }, projection('notification_feed')).sort('created_at', -1).limit(20))
+
     # Convert ObjectId to string for JSON serialization
-    for n in notifs:
-        n['_id'] = str(n['_id'])
-        n['created_at'] = n['created_at'].isoformat() if n.get('created_at') else None
-    
-    return jsonify(notifs)
+    return jsonify([_serialize(n) for n in notifs])
 
 @notification_bp.route('/<notif_id>/read', methods=['POST'])
 def mark_read(notif_id):
     """Mark notification as read"""
     if not session.get('user_id'):
         return jsonify({'error': 'Unauthorized'}), 401
-    
-    mongo.db.notifications.update_one(
-        {'_id': ObjectId(notif_id)},
+
+    user_id = session['user_id']
+    result = mongo.db.notifications.update_one(
+        {'_id': ObjectId(notif_id), 'recipient_id': user_id, 'read': False},
         {'$set': {'read': True, 'read_at': datetime.utcnow()}}
     )
-    
+
+    # Only an actual unread -> read transition moves the counter
+    if result.modified_count:
+        decrement_unread(user_id)
+        _publish_unread(user_id)
+
     return jsonify({'success': True})
 
+@notification_bp.route('/read-all', methods=['POST'])
+def mark_all_read():
+    """Mark every notification of the current user as read"""
+    if not session.get('user_id'):
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    user_id = session['user_id']
+    result = mongo.db.notifications.update_many(
+        {'recipient_id': user_id, 'read': False},
+        {'$set': {'read': True, 'read_at': datetime.utcnow()}}
+    )
+
+    # Subtract what was flipped rather than zeroing, so a notification
+    # written in between is not lost from the badge
+    decrement_unread(user_id, result.modified_count)
+    _publish_unread(user_id)
+
+    return jsonify({'success': True, 'marked': result.modified_count})
+
 @notification_bp.route('/unread-count', methods=['GET'])
 def unread_count():
     """Get count of unread notifications for current user"""
     if not session.get('user_id'):
         return jsonify({'unread': 0})
-    
+
+    return jsonify({'unread': _count_unread(session['user_id'])})
+
+@notification_bp.route('/outbox-stats', methods=['GET'])
+def outbox_stats():
+    """Queue depth and delivery counters of the notification outbox"""
+    if session.get('role') not in ['admin', 'warehouse']:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    return jsonify(notification_outbox.stats())
+
+@notification_bp.route('/stream', methods=['GET'])
+def stream():
+    """
+    Server-sent event stream of new notifications for current user.
+
+    Sends the unread count once on connect, then only pushes when
+    create_notification writes something for this user.
+    """
+    if not session.get('user_id'):
+        return jsonify({'error': 'Unauthorized'}), 401
+
     user_id = session['user_id']
-    count = mongo.db.notifications.count_documents({
-        'recipient_id': user_id,
-        'read': False
-    })
-    
-    return jsonify({'unread': count})
+    broker = get_broker()
+
+    def events():
+        subscription = broker.subscribe(user_id)
+        try:
+            yield _sse('unread', {'unread': _count_unread(user_id)})
+            while True:
+                try:
+                    event = subscription.get(timeout=STREAM_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event.get('notification'):
+                    yield _sse('notification', event['notification'])
+                if 'unread' in event:
+                    yield _sse('unread', {'unread': event['unread']})
+        finally:
+            broker.unsubscribe(user_id, subscription)
+
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def _build_notification(recipient_id, title, message, notification_type, related_data=None):
+    return {
+        'recipient_id': recipient_id,
+        'title': title,
+        'message': message,
+        'type': notification_type,  # 'cluster_assigned', 'engineer_coming', 'inspection_accepted', etc.
+        'read': False,
+        'related_data': related_data or {},
+        'created_at': datetime.utcnow()
+    }
+
+
+def _publish(notifs):
+    """Push freshly written notifications to their recipients' open streams"""
+    broker = get_broker()
+    for notif in notifs:
+        recipient_id = notif.get('recipient_id')
+        # No work when nobody is listening
+        if recipient_id and broker.has_subscribers(recipient_id):
+            broker.publish(recipient_id, {
+                'notification': _serialize(notif),
+                'unread': _count_unread(recipient_id)
+            })
+
+
+def _store_notifications(docs):
+    """Outbox step 1: store a batch; returns it with the documents this write added"""
+    already_written = set()
+    try:
+        mongo.db.notifications.insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        # A retried batch may be partly written already; anything but a duplicate _id is a real failure
+        errors = e.details.get('writeErrors', [])
+        if any(err.get('code') != 11000 for err in errors):
+            raise
+        already_written = {err.get('index') for err in errors}
+    return docs, [doc for i, doc in enumerate(docs) if i not in already_written]
+
+
+def _count_notifications(stored):
+    """Outbox step 2: bump unread counters for the newly written documents only"""
+    docs, written = stored
+    increment_unread(doc.get('recipient_id') for doc in written if not doc.get('read'))
+    return docs
+
+
+def _dead_letter_notifications(docs, step, error):
+    """Keep notifications the outbox gave up on, with the step that failed, for inspection or replay"""
+    now = datetime.utcnow()
+    mongo.db.notification_dead_letters.insert_many([
+        {'notification': doc, 'failed_step': step, 'error': str(error), 'failed_at': now}
+        for doc in docs
+    ])
+
+
+# Request handlers enqueue notifications; background workers write them in batches.
+# Each step is retried on its own, so a failed counter update never re-inserts.
+notification_outbox = NotificationOutbox(persist=[_store_notifications, _count_notifications, _publish],
+                                         dead_letter=_dead_letter_notifications)
+
 
 def create_notification(recipient_id, title, message, notification_type, related_data=None):
     """Helper to create a notification"""
     try:
-        notif = {
-            'recipient_id': recipient_id,
-            'title': title,
-            'message': message,
-            'type': notification_type,  # 'cluster_assigned', 'engineer_coming', 'inspection_accepted', etc.
-            'read': False,
-            'related_data': related_data or {},
-            'created_at': datetime.utcnow()
-        }
-        result = mongo.db.notifications.insert_one(notif)
-        return str(result.inserted_id)
+        notif = _build_notification(recipient_id, title, message, notification_type, related_data)
+        return str(notification_outbox.enqueue(notif))
     except Exception as e:
         print(f"Error creating notification: {e}")
         return None
+
+
+def create_notifications(notifications):
+    """
+    Queue many notifications at once (written in batches by the outbox).
+
+    Args:
+        notifications (list): dicts with the create_notification arguments
+            (recipient_id, title, message, notification_type, related_data)
+
+    Returns:
+        list: notification ids as strings (empty on failure)
+    """
+    docs = [_build_notification(**n) for n in notifications]
+    if not docs:
+        return []
+    try:
+        return [str(i) for i in notification_outbox.enqueue_many(docs)]
+    except Exception as e:
+        print(f"Error creating notifications: {e}")
+        return []
@@ -2,28 +2,30 @@ from flask import Blueprint, render_template, request, jsonify, session, redirec
 from mongo import mongo
 from bson import ObjectId
 from services.payment_service import PaymentService
+from services.earnings import pending_earnings
+from services.pagination import fetch_page
+from services.projections import projection
+from services.valuation import get_valuation
 import uuid
 
 payment_bp = Blueprint('payment', __name__)
 payment_service = PaymentService()
 
+INVOICE_PAGE_SIZE = 25
+PENDING_ITEMS_LIMIT = 50
+
 @payment_bp.route('/payment/initiate/<pickup_id>', methods=['POST'])
 def initiate_payment(pickup_id):
     """Create a payment order for a pickup request"""
     if session.get('role') != 'recycler':
         return jsonify({'error': 'Unauthorized'}), 403
 
-    pickup = mongo.db.pickup_requests.find_one({'_id': ObjectId(pickup_id)})
+    pickup = mongo.db.pickup_requests.find_one({'_id': ObjectId(pickup_id)}, projection('pickup_payment'))
     if not pickup:
         return jsonify({'error': 'Pickup not found'}), 404
 
-    # Determine amount (use engineer_price or calculate fallback)
-    amount = pickup.get('engineer_price')
-    if not amount:
-        # Fallback logic if no price set (e.g. 50 INR per kg)
-        weight = pickup.get('final_weight') or pickup.get('approx_weight') or 0
-        amount = weight * 0.05 # Assuming weight is in grams, 50 INR/kg = 0.05 INR/g
-        if amount < 1: amount = 100 # Minimum amount
+    # Stored payable amount (engineer_price or weight-based fallback)
+    amount = get_valuation(pickup)['amount']
 
     order = payment_service.create_order(amount, pickup_id)
     
@@ -61,8 +63,10 @@ def verify_payment():
         # Calculate total amount from order (convert paise to INR)
         # In a real scenario, fetch order details from Razorpay to confirm amount
         # Here we trust the passed amount or re-fetch from DB
-        pickup = mongo.db.pickup_requests.find_one({'_id': ObjectId(pickup_id)})
-        amount = pickup.get('engineer_price') or 100 # Fallback
+        pickup = mongo.db.pickup_requests.find_one({'_id': ObjectId(pickup_id)}, projection('pickup_payment'))
+        if not pickup:
+            return jsonify({'error': 'Pickup not found'}), 404
+        amount = get_valuation(pickup)['amount']
 
         # Distribute Funds & Generate Invoices
         success = payment_service.distribute_and_generate_invoices(
@@ -83,24 +87,14 @@ def preview_payment(pickup_id):
     if session.get('role') != 'recycler':
         return jsonify({'error': 'Unauthorized'}), 403
 
-    pickup = mongo.db.pickup_requests.find_one({'_id': ObjectId(pickup_id)})
+    pickup = mongo.db.pickup_requests.find_one({'_id': ObjectId(pickup_id)}, projection('pickup_payment'))
     if not pickup:
         return jsonify({'error': 'Pickup not found'}), 404
 
-    # Determine amount (Automated price logic)
-    amount = pickup.get('engineer_price')
-    if not amount:
-        weight = pickup.get('final_weight') or pickup.get('approx_weight') or 0
-        amount = weight * 0.05 # Fallback calculation
-        if amount < 1: amount = 100
-
-    # Calculate splits for display
-    splits = {
-        'user': round(amount * 0.50, 2),
-        'driver': round(amount * 0.10, 2),
-        'engineer': round(amount * 0.15, 2),
-        'warehouse': round(amount * 0.25, 2)
-    }
+    # Stored amount and split
+    valuation = get_valuation(pickup)
+    amount = valuation['amount']
+    splits = valuation['splits']
 
     return jsonify({
         'pickup_id': str(pickup_id),
@@ -145,67 +139,32 @@ def my_invoices():
     if role == 'warehouse':
         # Warehouse sees their own + can see all (optional)
         query = {'$or': [{'recipient_id': user_id}, {'recipient_role': 'warehouse'}]}
-        
-    invoices = list(mongo.db.invoices.find(query).sort('created_at', -1))
-    
-    # 2. Pending / In-Process Items (Not yet recycled/paid)
-    pending_items = []
-    
-    if role == 'user':
-        # Handle both ObjectId and string user_id
-        try:
-            user_query = {'$or': [{'user_id': user_id}, {'user_id': ObjectId(user_id)}]}
-        except:
-            user_query = {'user_id': user_id}
-            
-        # Add status filter (anything not recycled is technically pending payment if it's in the system)
-        user_query['status'] = {'$ne': 'recycled'}
-        pending_items = list(mongo.db.pickup_requests.find(user_query).sort('created_at', -1))
-
-    elif role == 'engineer':
-        # Engineers see requests assigned to them
-        pending_items = list(mongo.db.pickup_requests.find({
-            'engineer_id': user_id,
-            'status': {'$ne': 'recycled'}
-        }).sort('created_at', -1))
-
-    elif role == 'driver':
-        # Drivers see requests in their clusters
-        clusters = list(mongo.db.collection_clusters.find({'driver_id': user_id}))
-        pickup_ids = []
-        for c in clusters:
-            for u in c.get('users', []):
-                pickup_ids.append(u['user_id'])
-        
-        if pickup_ids:
-            pending_items = list(mongo.db.pickup_requests.find({
-                '_id': {'$in': pickup_ids},
-                'status': {'$ne': 'recycled'}
-            }).sort('created_at', -1))
-
-    elif role == 'warehouse':
-        # Warehouse sees items collected but not yet recycled (waiting for payment)
-        pending_items = list(mongo.db.pickup_requests.find({
-            'status': 'collected'
-        }).sort('updated_at', -1))
-
-    # Calculate estimated earnings for pending items
-    for item in pending_items:
-        # Determine base amount
-        amount = item.get('engineer_price')
-        if not amount:
-            weight = item.get('final_weight') or item.get('approx_weight') or 0
-            try:
-                weight = float(weight)
-            except (ValueError, TypeError):
-                weight = 0
-            amount = weight * 0.05 # Fallback: 50 INR/kg -> 0.05 INR/g
-            if amount < 100: amount = 100
-        
-        # Calculate share based on role
-        shares = {'user': 0.50, 'driver': 0.10, 'engineer': 0.15, 'warehouse': 0.25}
-        role_key = role if role in shares else 'user'
-        item['estimated_share'] = round(amount * shares.get(role_key, 0), 2)
-        item['share_percentage'] = f"{int(shares.get(role_key, 0) * 100)}%"
-            
-    return render_template('payment/invoices.html', invoices=invoices, pending_items=pending_items, role=role)
\ No newline at end of file
+
+    # 1. Paid invoices, one page at a time (total earnings summed server-side)
+    cursor = request.args.get('after')
+    invoices, next_cursor = fetch_page(
+        mongo.db.invoices, query, 'created_at',
+        cursor=cursor, page_size=INVOICE_PAGE_SIZE, projection=projection('invoice_row')
+    )
+    totals = list(mongo.db.invoices.aggregate([
+        {'$match': query},
+        {'$group': {'_id': None, 'total': {'$sum': '$amount'}}}
+    ]))
+    total_earnings = round(totals[0]['total'], 2) if totals else 0
+
+    # 2. Pending / In-Process Items (Not yet recycled/paid) with estimated shares
+    pending = pending_earnings(role, user_id, limit=PENDING_ITEMS_LIMIT)
+    for item in pending['items']:
+        item['share_percentage'] = pending['share_percentage']
+
+    return render_template(
+        'payment/invoices.html',
+        invoices=invoices,
+        pending_items=pending['items'],
+        pending_count=pending['count'],
+        pending_total=pending['total_share'],
+        total_earnings=total_earnings,
+        next_cursor=next_cursor,
+        is_first_page=not cursor,
+        role=role
+    )
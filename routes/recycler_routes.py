@@ -1,31 +1,58 @@
-from flask import Blueprint, render_template, redirect, session, flash, url_for
+from flask import Blueprint, render_template, redirect, session, flash, url_for, request
 from mongo import mongo
 from bson import ObjectId
+from datetime import datetime
+from services.pagination import fetch_page, sort_spec
+from services.projections import projection
+from services.recycling_rollup import get_rollup, record_recycled
 
 recycler_bp = Blueprint('recycler', __name__, url_prefix='/recycler')
 
+QUEUE_PAGE_SIZE = 25
+RECENT_HISTORY_SIZE = 6
+
+
 @recycler_bp.route('/dashboard')
 def dashboard():
     if session.get('role') != 'recycler':
         return redirect('/')
 
-    # Fetch items that have been collected by engineers (Ready for recycling)
-    collected_items = list(mongo.db.pickup_requests.find({'status': 'collected'}).sort('updated_at', -1))
-    
-    # Fetch history of recycled items
-    recycled_items = list(mongo.db.pickup_requests.find({'status': 'recycled'}).sort('updated_at', -1))
+    # Work queue: items collected by engineers (Ready for recycling), one page at a time
+    cursor = request.args.get('after')
+    collected_items, next_cursor = fetch_page(
+        mongo.db.pickup_requests, {'status': 'collected'}, 'updated_at',
+        cursor=cursor, page_size=QUEUE_PAGE_SIZE, projection=projection('recycler_item')
+    )
+
+    # History: rollup totals plus a handful of the most recent items
+    history = get_rollup()
+    recycled_items = list(
+        mongo.db.pickup_requests.find({'status': 'recycled'}, projection('recycler_item'))
+        .sort(sort_spec('updated_at'))
+        .limit(RECENT_HISTORY_SIZE)
+    )
 
-    return render_template('recycler/dashboard.html', collected=collected_items, recycled=recycled_items)
+    return render_template(
+        'recycler/dashboard.html',
+        collected=collected_items,
+        recycled=recycled_items,
+        history=history,
+        next_cursor=next_cursor,
+        is_first_page=not cursor
+    )
 
 @recycler_bp.route('/process/<request_id>')
 def process_item(request_id):
     if session.get('role') != 'recycler':
         return redirect('/')
-    
-    mongo.db.pickup_requests.update_one(
-        {'_id': ObjectId(request_id)},
-        {'$set': {'status': 'recycled'}}
+
+    pickup = mongo.db.pickup_requests.find_one_and_update(
+        {'_id': ObjectId(request_id), 'status': {'$ne': 'recycled'}},
+        {'$set': {'status': 'recycled', 'updated_at': datetime.utcnow()}},
+        projection=projection('pickup_payment')
     )
-    
+    if pickup:
+        record_recycled(pickup)
+
     flash('Item processed and recycled successfully.', 'success')
     return redirect(url_for('recycler.dashboard'))
@@ -1,5 +1,7 @@
 from flask import Blueprint, render_template, request, redirect, session, flash
 from mongo import mongo
+from services.projections import projection
+from services.valuation import compute_valuation
 from datetime import datetime
 from bson import ObjectId
 import math
@@ -21,7 +23,7 @@ def dashboard():
         user_query = {'user_id': user_id}
 
     # Fetch requests for this user, sorted by newest first
-    requests = list(mongo.db.pickup_requests.find(user_query).sort('created_at', -1))
+    requests = list(mongo.db.pickup_requests.find(user_query, projection('pickup_card')).sort('created_at', -1))
 
     # Calculate total weight for profile panel
     pipeline = [
@@ -79,7 +81,7 @@ def create_request():
     if request.method == 'GET':
         # Render the pickup request form (preserve existing behavior)
         # Ensure we pass a list (not a Cursor) so templates can use length/iteration safely
-        requests = list(mongo.db.pickup_requests.find(user_query).sort('created_at', -1))
+        requests = list(mongo.db.pickup_requests.find(user_query, projection('pickup_request_row')).sort('created_at', -1))
 
         pipeline = [
             {'$match': user_query},
@@ -147,6 +149,8 @@ def create_request():
             'inspection_status': None,  # pending, accepted, rejected
             'created_at': datetime.utcnow()
         }
+        # Payable amount from the estimated weight until inspected / weighed
+        data['valuation'] = compute_valuation(data)
 
         result = mongo.db.pickup_requests.insert_one(data)
         pickup_id = result.inserted_id
@@ -163,7 +167,7 @@ def create_request():
             nearby = list(mongo.db.pickup_requests.find({
                 'status': {'$in': ['pending', 'clustered']},
                 'cluster_id': {'$exists': False}
-            }))
+            }, projection('pickup_geo')))
             
             def haversine_km(lat1, lon1, lat2, lon2):
                 R = 6371
@@ -1,9 +1,22 @@
-from flask import Blueprint, render_template, request, redirect, url_for, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, jsonify, Response, stream_with_context, session
 from mongo import mongo
 from bson import ObjectId
+from bson.errors import InvalidId
 from datetime import datetime
 from datetime import timedelta
+import io
 import math
+import json
+from services.projections import projection
+from services.position_store import get_position_store
+from services.location_channel import get_location_channel
+from services.trajectory import FINISHED_STATUSES, get_trajectory, save_trajectory
+from services.eta import get_eta_engine
+from services.price_history import import_prices, parse_price_file
+from services.price_tables import get_price_tables, update_prices
+from services.pricing_engine import price_stock
+from services.revaluation import is_current, latest_hub_valuation, stock_weight
+from services.clustering import form_clusters
 
 warehouse_bp = Blueprint("warehouse", __name__)
 
@@ -34,7 +47,7 @@ def haversine_km(lat1, lon1, lat2, lon2):
 # ---------------- DASHBOARD ----------------
 @warehouse_bp.route("/dashboard")
 def dashboard():
-    clusters = list(mongo.db.collection_clusters.find().sort("created_at", -1))
+    clusters = list(mongo.db.collection_clusters.find({}, projection("cluster_card")).sort("created_at", -1))
 
     # ---------------- ANALYTICS & INSIGHTS ----------------
     # 1. KPI Cards Data
@@ -65,23 +78,23 @@ def dashboard():
 
     # 4. Workforce Monitoring
     # Fetch engineers and check if they are currently on a job AND available tomorrow
-    engineers = list(mongo.db.users.find({"role": "engineer"}))
+    engineers = list(mongo.db.users.find({"role": "engineer"}, projection("roster_entry")))
     active_engineer_ids = mongo.db.collection_clusters.distinct("engineer_id", {"status": "in_progress"})
     
     for eng in engineers:
         eng['status'] = 'On Route' if str(eng['_id']) in active_engineer_ids else 'Available'
         eng['available_tomorrow'] = eng.get('available_tomorrow', True)  # Default to available
         
-    drivers = list(mongo.db.users.find({"role": "driver"}))
+    drivers = list(mongo.db.users.find({"role": "driver"}, projection("roster_entry")))
     active_driver_ids = mongo.db.collection_clusters.distinct("driver_id", {"status": "in_progress"})
     
     for drv in drivers:
         drv['status'] = 'On Route' if str(drv['_id']) in active_driver_ids else 'Available'
 
-    recyclers = list(mongo.db.users.find({"role": "recycler"}))
+    recyclers = list(mongo.db.users.find({"role": "recycler"}, projection("roster_entry")))
 
     # 5. Warehouse Inventory (Collected items waiting for recycling)
-    inventory_items = list(mongo.db.pickup_requests.find({"status": "collected"}).sort("updated_at", -1).limit(10))
+    inventory_items = list(mongo.db.pickup_requests.find({"status": "collected"}, projection("inventory_row")).sort("updated_at", -1).limit(10))
 
     # 6. Leaderboard
     leaderboard_pipeline = [
@@ -91,16 +104,29 @@ def dashboard():
     ]
     leaderboard = list(mongo.db.pickup_requests.aggregate(leaderboard_pipeline))
 
+    # Fetch every cluster member's pickup in one query
+    member_ids = [u["user_id"] for cluster in clusters for u in cluster.get("users", [])]
+    members = {
+        p["_id"]: p for p in mongo.db.pickup_requests.find({"_id": {"$in": member_ids}}, projection("cluster_member"))
+    } if member_ids else {}
+
+    # Resolve assigned engineer/driver names in one query
+    staff_ids = {cluster.get(k) for cluster in clusters for k in ("engineer_id", "driver_id")}
+    staff_oids = [ObjectId(i) for i in staff_ids if i and ObjectId.is_valid(i)]
+    staff_names = {
+        str(u["_id"]): u.get("name") for u in mongo.db.users.find({"_id": {"$in": staff_oids}}, projection("user_name"))
+    } if staff_oids else {}
+
     # attach user details and category/type info for each cluster
     for cluster in clusters:
         users = []
         categories = set()
-        for u in cluster["users"]:
-            req = mongo.db.pickup_requests.find_one({"_id": u["user_id"]})
+        for u in cluster.get("users", []):
+            req = members.get(u["user_id"])
             if req:
                 users.append({
-                    "name": req["user_name"],
-                    "address": req["address"],
+                    "name": req.get("user_name"),
+                    "address": req.get("address"),
                     "weight": u["weight"],
                     "distance": u["distance_km"],
                     "type": req.get("ewaste_type", "Unknown")
@@ -112,24 +138,9 @@ def dashboard():
         cluster["user_details"] = users
         cluster["categories"] = ", ".join(list(categories)) if categories else "Mixed E-Waste"
         
-        # Fetch assigned engineer and driver names
-        engineer_name = None
-        driver_name = None
-        if cluster.get("engineer_id"):
-            try:
-                eng_doc = mongo.db.users.find_one({"_id": ObjectId(cluster["engineer_id"])})
-                engineer_name = eng_doc.get("name") if eng_doc else None
-            except Exception:
-                engineer_name = None
-        if cluster.get("driver_id"):
-            try:
-                drv_doc = mongo.db.users.find_one({"_id": ObjectId(cluster["driver_id"])})
-                driver_name = drv_doc.get("name") if drv_doc else None
-            except Exception:
-                driver_name = None
-        
-        cluster["engineer_name"] = engineer_name
-        cluster["driver_name"] = driver_name
+        # Assigned engineer and driver names
+        cluster["engineer_name"] = staff_names.get(cluster.get("engineer_id"))
+        cluster["driver_name"] = staff_names.get(cluster.get("driver_id"))
         
         # Ensure destination is set
         if not cluster.get("destination"):
@@ -190,18 +201,18 @@ def advanced_analytics():
     material_data = list(mongo.db.pickup_requests.aggregate(pipeline_material))
     
     # Engineer performance
-    engineers = list(mongo.db.users.find({"role": "engineer"}))
+    engineers = list(mongo.db.users.find({"role": "engineer"}, projection("roster_entry")))
     for eng in engineers:
         completed = mongo.db.pickup_requests.count_documents({"engineer_id": str(eng["_id"]), "status": "collected"})
         eng["jobs_completed"] = completed
         eng["available"] = eng.get("available_tomorrow", True)
     
     # Cluster efficiency
-    clusters = list(mongo.db.collection_clusters.find().sort("created_at", -1).limit(10))
+    clusters = list(mongo.db.collection_clusters.find({}, projection("cluster_card")).sort("created_at", -1).limit(10))
     
     # Recycler performance
     recycled_items = mongo.db.pickup_requests.count_documents({"status": "recycled"})
-    recyclers = list(mongo.db.users.find({"role": "recycler"}))
+    recyclers = list(mongo.db.users.find({"role": "recycler"}, projection("roster_entry")))
     
     # Time-based analytics
     from datetime import datetime, timedelta
@@ -240,90 +251,17 @@ def analyze_routes():
     users = list(mongo.db.pickup_requests.find({
         "status": "pending",
         "cluster_id": None
-    }))
+    }, projection("pickup_geo")))
 
     # Filter out requests with missing coordinates to prevent KeyError
     users = [u for u in users if u.get('latitude') is not None and u.get('longitude') is not None]
 
-    # Sort by weight (handle both field names for compatibility)
-    users.sort(key=lambda u: u.get("approx_weight", u.get("ewaste_weight", 0)), reverse=True)
-
-    used_users = set()
     created = []
 
-    for anchor in users:
-        if anchor["_id"] in used_users:
-            continue
-        
-        # Find nearest Regional Warehouse (1-4) for drop-off
-        nearest_wh = min(WAREHOUSES[:4], key=lambda wh: haversine_km(
-            anchor["latitude"], anchor["longitude"], wh["lat"], wh["lng"]
-        ))
-        
-        dist_to_wh = haversine_km(
-            anchor["latitude"], anchor["longitude"],
-            nearest_wh["lat"], nearest_wh["lng"]
-        )
-        
-        anchor_weight = anchor.get("approx_weight", anchor.get("ewaste_weight", 0))
-
-        cluster_users = [{
-            "user_id": anchor["_id"],
-            "weight": anchor_weight,
-            "distance_km": 0
-        }]
-        total_weight = anchor["ewaste_weight"]
-        max_distance = 0
-        used_users.add(anchor["_id"])
-
-        for u in users:
-            if u["_id"] in used_users:
-                continue
-
-            dist = haversine_km(
-                anchor["latitude"], anchor["longitude"],
-                u["latitude"], u["longitude"]
-            )
-
-            if dist <= 100:
-                u_weight = u.get("approx_weight", u.get("ewaste_weight", 0))
-                cluster_users.append({
-                    "user_id": u["_id"],
-                    "weight": u_weight,
-                    "distance_km": round(dist, 2)
-                })
-                
-                total_weight += u_weight
-                max_distance = max(max_distance, dist)
-                used_users.add(u["_id"])
-
-            if total_weight >= 100000: # 100kg limit for cluster
-                break
-
-        if total_weight >= 100000: # 100kg -> Ready
-            status = "ready"
-        elif total_weight >= 80000: # 80kg -> Almost Ready
-            status = "almost_ready"
-        else:
-            status = "pending"
-
-        cluster = {
-            "anchor_user_id": anchor["_id"],
-            "anchor_location": {
-                "lat": anchor["latitude"],
-                "lng": anchor["longitude"]
-            },
-            "destination": nearest_wh["name"],
-            "dist_to_hub": round(dist_to_wh, 2), # Distance to drop-off point
-            "radius_used_km": round(max_distance, 2),
-            "total_weight": total_weight,
-            "user_count": len(cluster_users),
-            "users": cluster_users,
-            "efficiency_score": round(total_weight / max_distance, 2) if max_distance else total_weight,
-            "status": status,
-            "admin_override": False,
-            "created_at": datetime.utcnow()
-        }
+    # Drop-off at the nearest Regional Warehouse (1-4)
+    for cluster in form_clusters(users, WAREHOUSES[:4]):
+        cluster["created_at"] = datetime.utcnow()
+        cluster_users = cluster["users"]
 
         cid = mongo.db.collection_clusters.insert_one(cluster).inserted_id
 
@@ -340,14 +278,14 @@ def analyze_routes():
 @warehouse_bp.route('/assign/<cluster_id>', methods=['GET'])
 def assign_cluster_page(cluster_id):
     # Render a simple assignment page for a cluster
-    cluster = mongo.db.collection_clusters.find_one({'_id': ObjectId(cluster_id)})
+    cluster = mongo.db.collection_clusters.find_one({'_id': ObjectId(cluster_id)}, projection('cluster_route'))
     if not cluster:
         return redirect(url_for('warehouse.dashboard'))
 
     # Fetch available engineers/drivers/doctors
-    engineers = list(mongo.db.users.find({'role': 'engineer'}))
-    drivers = list(mongo.db.users.find({'role': 'driver'}))
-    doctors = list(mongo.db.users.find({'role': 'doctor'}))
+    engineers = list(mongo.db.users.find({'role': 'engineer'}, projection('roster_entry')))
+    drivers = list(mongo.db.users.find({'role': 'driver'}, projection('roster_entry')))
+    doctors = list(mongo.db.users.find({'role': 'doctor'}, projection('roster_entry')))
 
     # Determine cluster centroid (anchor or centroid of users)
     lat = None
@@ -358,7 +296,7 @@ def assign_cluster_page(cluster_id):
     else:
         user_ids = [u['user_id'] for u in cluster.get('users', [])]
         if user_ids:
-            pickup_docs = list(mongo.db.pickup_requests.find({'_id': {'$in': user_ids}}))
+            pickup_docs = list(mongo.db.pickup_requests.find({'_id': {'$in': user_ids}}, projection('pickup_geo')))
             if pickup_docs:
                 lat = sum([p.get('latitude', 0) for p in pickup_docs]) / len(pickup_docs)
                 lng = sum([p.get('longitude', 0) for p in pickup_docs]) / len(pickup_docs)
@@ -426,7 +364,7 @@ def assign_cluster():
     }
 
     # compute and set destination if not present
-    cluster = mongo.db.collection_clusters.find_one({'_id': ObjectId(cluster_id)})
+    cluster = mongo.db.collection_clusters.find_one({'_id': ObjectId(cluster_id)}, projection('cluster_route'))
     lat = None
     lng = None
     if cluster:
@@ -436,7 +374,7 @@ def assign_cluster():
         else:
             user_ids = [u['user_id'] for u in cluster.get('users', [])]
             if user_ids:
-                pickup_docs = list(mongo.db.pickup_requests.find({'_id': {'$in': user_ids}}))
+                pickup_docs = list(mongo.db.pickup_requests.find({'_id': {'$in': user_ids}}, projection('pickup_geo')))
                 if pickup_docs:
                     lat = sum([p.get('latitude', 0) for p in pickup_docs]) / len(pickup_docs)
                     lng = sum([p.get('longitude', 0) for p in pickup_docs]) / len(pickup_docs)
@@ -477,7 +415,7 @@ def assign_fleet(cluster_id):
 
     if engineer_id and driver_id and destination_hub:
         # Use selected hub as destination (no need to compute nearest)
-        cluster = mongo.db.collection_clusters.find_one({"_id": ObjectId(cluster_id)})
+        cluster = mongo.db.collection_clusters.find_one({"_id": ObjectId(cluster_id)}, projection("cluster_route"))
         
         # Find the selected warehouse to get coordinates for distance calculation
         selected_warehouse = next((wh for wh in WAREHOUSES if wh['name'] == destination_hub), None)
@@ -493,7 +431,7 @@ def assign_fleet(cluster_id):
                 # compute centroid of users
                 user_ids = [u['user_id'] for u in cluster.get('users', [])]
                 if user_ids:
-                    pickup_docs = list(mongo.db.pickup_requests.find({'_id': {'$in': user_ids}}))
+                    pickup_docs = list(mongo.db.pickup_requests.find({'_id': {'$in': user_ids}}, projection('pickup_geo')))
                     if pickup_docs:
                         lat = sum([p.get('latitude', 0) for p in pickup_docs]) / len(pickup_docs)
                         lng = sum([p.get('longitude', 0) for p in pickup_docs]) / len(pickup_docs)
@@ -523,6 +461,20 @@ def assign_fleet(cluster_id):
     return redirect(url_for("warehouse.dashboard"))
 
 
+# ---------------- BATCH FLEET ASSIGNMENT ----------------
+@warehouse_bp.route("/optimize-assignments", methods=["POST"])
+def optimize_assignments():
+    """Assign all ready clusters to engineers and drivers in one optimized pass"""
+    from services.fleet_optimizer import optimize_fleet_assignment
+
+    # Staff without a GPS fix are assumed to start from the central hub
+    summary = optimize_fleet_assignment(default_location=WAREHOUSES[4])
+
+    if request.accept_mimetypes.best == "application/json":
+        return jsonify(summary), 200
+    return redirect(url_for("warehouse.dashboard"))
+
+
 # --------------- STATUS TRANSITIONS ---------------
 @warehouse_bp.route("/update-cluster-status/<cluster_id>", methods=["POST"])
 def update_cluster_status(cluster_id):
@@ -530,10 +482,10 @@ def update_cluster_status(cluster_id):
     Update cluster status with notifications to all stakeholders.
     Transitions: assigned → out_for_delivery → delivered
     """
-    from routes.notification_routes import create_notification
+    from routes.notification_routes import create_notifications
     
     new_status = request.json.get("status")
-    cluster = mongo.db.collection_clusters.find_one({"_id": ObjectId(cluster_id)})
+    cluster = mongo.db.collection_clusters.find_one({"_id": ObjectId(cluster_id)}, projection("cluster_card"))
     
     if not cluster:
         return {"error": "Cluster not found"}, 404
@@ -552,7 +504,16 @@ def update_cluster_status(cluster_id):
             }
         }
     )
+
+    # Keep the driven trajectory before the raw GPS history expires
+    if new_status in FINISHED_STATUSES:
+        try:
+            save_trajectory(cluster_id)
+        except Exception as e:
+            print(f"Saving trajectory of cluster {cluster_id} failed: {e}")
     
+    notifications = []
+
     # Notify all users in the cluster about status change
     if cluster.get("users"):
         status_msg = {
@@ -568,50 +529,42 @@ def update_cluster_status(cluster_id):
             "delivered": "✓"
         }
         
-        for user_info in cluster["users"]:
-            try:
-                create_notification(
-                    recipient_id=user_info["user_id"],
-                    title=f"{emoji.get(new_status, '●')} Collection {new_status.replace('_', ' ').title()}",
-                    message=message,
-                    type="status_update",
-                    related_data={"cluster_id": str(cluster_id), "status": new_status}
-                )
-            except:
-                pass
+        # Cluster members are pickup ids; resolve their owners in one query
+        pickup_ids = [u["user_id"] for u in cluster["users"]]
+        owners = {
+            str(p["user_id"]) for p in mongo.db.pickup_requests.find({"_id": {"$in": pickup_ids}}, projection("pickup_owner"))
+            if p.get("user_id")
+        }
+        for owner_id in owners:
+            notifications.append({
+                "recipient_id": owner_id,
+                "title": f"{emoji.get(new_status, '●')} Collection {new_status.replace('_', ' ').title()}",
+                "message": message,
+                "notification_type": "status_update",
+                "related_data": {"cluster_id": str(cluster_id), "status": new_status}
+            })
     
     # Notify engineer and driver
-    if cluster.get("engineer_id"):
-        try:
-            create_notification(
-                recipient_id=cluster["engineer_id"],
-                title="Cluster Status Update",
-                message=f"Cluster status changed to {new_status.replace('_', ' ')}",
-                type="status_update",
-                related_data={"cluster_id": str(cluster_id)}
-            )
-        except:
-            pass
+    for staff_id in (cluster.get("engineer_id"), cluster.get("driver_id")):
+        if staff_id:
+            notifications.append({
+                "recipient_id": staff_id,
+                "title": "Cluster Status Update",
+                "message": f"Cluster status changed to {new_status.replace('_', ' ')}",
+                "notification_type": "status_update",
+                "related_data": {"cluster_id": str(cluster_id)}
+            })
     
-    if cluster.get("driver_id"):
-        try:
-            create_notification(
-                recipient_id=cluster["driver_id"],
-                title="Cluster Status Update",
-                message=f"Cluster status changed to {new_status.replace('_', ' ')}",
-                type="status_update",
-                related_data={"cluster_id": str(cluster_id)}
-            )
-        except:
-            pass
+    # Single write for the whole fan-out
+    create_notifications(notifications)
     
     return {"success": True, "status": new_status}, 200
 
 
 # --------------- ROUTE VIEW ---------------
 @warehouse_bp.route('/route/<cluster_id>')
-def view_route(cluster_id):
-    cluster = mongo.db.collection_clusters.find_one({'_id': ObjectId(cluster_id)})
+def view_route(cluster_id, pickup_id=None):
+    cluster = mongo.db.collection_clusters.find_one({'_id': ObjectId(cluster_id)}, projection('cluster_route'))
     if not cluster:
         return redirect(url_for('warehouse.dashboard'))
     
@@ -619,7 +572,7 @@ def view_route(cluster_id):
     u_ids = [u['user_id'] for u in cluster.get('users', [])]
     pickup_docs = []
     if u_ids:
-        pickup_docs = list(mongo.db.pickup_requests.find({'_id': {'$in': u_ids}}))
+        pickup_docs = list(mongo.db.pickup_requests.find({'_id': {'$in': u_ids}}, projection('route_waypoint')))
     
     waypoints = []
     for pickup in pickup_docs:
@@ -630,13 +583,14 @@ def view_route(cluster_id):
         })
     
     driver_id = cluster.get('driver_id')
-    return render_template('engineer/route.html', waypoints=waypoints, driver_id=driver_id, view_only=True)
+    return render_template('engineer/route.html', waypoints=waypoints, driver_id=driver_id, view_only=True,
+                           pickup_id=pickup_id)
 
 
 @warehouse_bp.route('/track-order/<pickup_id>')
 def track_order(pickup_id):
     """Allow users to track the driver for their specific pickup"""
-    pickup = mongo.db.pickup_requests.find_one({'_id': ObjectId(pickup_id)})
+    pickup = mongo.db.pickup_requests.find_one({'_id': ObjectId(pickup_id)}, projection('pickup_cluster_ref'))
     if not pickup:
         return "Order not found", 404
     
@@ -644,13 +598,14 @@ def track_order(pickup_id):
     if not cluster_id:
         return render_template('engineer/route.html', waypoints=[], error="Not assigned to a route yet")
         
-    return view_route(cluster_id)
+    return view_route(cluster_id, pickup_id=pickup_id)
 
 
 @warehouse_bp.route('/api/public/driver-location/<driver_id>')
 def public_driver_location(driver_id):
     """Public API for frontend polling of driver location"""
-    location = mongo.db.driver_locations.find_one({'driver_id': driver_id})
+    # Served from memory; no database read per poll
+    location = get_position_store().get(driver_id)
     if location:
         return jsonify({
             'lat': location.get('lat'),
@@ -660,7 +615,138 @@ def public_driver_location(driver_id):
     return jsonify({}), 404
 
 
+@warehouse_bp.route('/api/public/eta/<pickup_id>')
+def public_pickup_eta(pickup_id):
+    """Precomputed arrival estimate for a pickup (refreshed by driver location ingest)"""
+    try:
+        estimate = get_eta_engine().pickup_eta(pickup_id)
+    except InvalidId:
+        return jsonify({}), 404
+    if not estimate:
+        return jsonify({}), 404
+    return jsonify({
+        'minutes': estimate['minutes'],
+        'eta': estimate['eta'].isoformat(),
+        'stops_before': estimate['stops_before'],
+        'computed_at': estimate['computed_at'].isoformat()
+    })
+
+
+# Seconds between keep-alive comments on an idle location stream
+LOCATION_STREAM_HEARTBEAT_SECONDS = 15
+
+
+def _location_event(position):
+    data = {
+        'lat': position.get('lat'),
+        'lng': position.get('lng'),
+        'timestamp': position['timestamp'].isoformat() if position.get('timestamp') else None
+    }
+    return f"event: location\ndata: {json.dumps(data)}\n\n"
+
+
+@warehouse_bp.route('/api/public/driver-location/<driver_id>/stream')
+def public_driver_location_stream(driver_id):
+    """
+    Server-sent event stream of a driver's position.
+
+    Sends the current position on connect, then one event per ingested batch.
+    Positions are coalesced: a viewer always gets the newest one.
+    """
+    channel = get_location_channel()
+
+    def events():
+        channel.add_viewer(driver_id)
+        try:
+            version = channel.version(driver_id)
+            location = get_position_store().get(driver_id)
+            if location:
+                yield _location_event(location)
+            while True:
+                version, position = channel.wait(driver_id, version, LOCATION_STREAM_HEARTBEAT_SECONDS)
+                if position is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield _location_event(position)
+        finally:
+            channel.remove_viewer(driver_id)
+
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@warehouse_bp.route('/api/trajectory/<cluster_id>')
+def cluster_trajectory(cluster_id):
+    """Simplified, polyline-encoded GPS trajectory of a cluster's trip"""
+    cluster = mongo.db.collection_clusters.find_one({'_id': ObjectId(cluster_id)}, {'status': 1})
+    if not cluster:
+        return jsonify({'error': 'Cluster not found'}), 404
+
+    return jsonify(get_trajectory(cluster_id, cluster.get('status')))
+
+
+# --------------- PRICE TABLES ---------------
+@warehouse_bp.route('/api/prices', methods=['GET'])
+def get_prices():
+    """Rates (INR per kg) of the current price-table version"""
+    prices = get_price_tables()
+    return jsonify({
+        'version': prices.version,
+        'categories': dict(prices.category_rates),
+        'metals': dict(prices.metal_rates)
+    })
+
+
+@warehouse_bp.route('/api/prices', methods=['PUT'])
+def put_prices():
+    """Update category and/or metal rates: {"categories": {...}, "metals": {...}}"""
+    if session.get('role') not in ['warehouse', 'admin']:
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    data = request.json or {}
+    try:
+        categories = {str(k): float(v) for k, v in (data.get('categories') or {}).items()}
+        metals = {str(k): float(v) for k, v in (data.get('metals') or {}).items()}
+    except (TypeError, ValueError, AttributeError):
+        return jsonify({'error': 'Rates must be numbers'}), 400
+    if not categories and not metals:
+        return jsonify({'error': 'No rates given'}), 400
+
+    version = update_prices(categories, metals)
+    return jsonify({'success': True, 'version': version})
+
+
+@warehouse_bp.route('/api/prices/import', methods=['POST'])
+def import_price_file():
+    """Import a daily price file (CSV upload `file`, optional `date` form field)"""
+    if session.get('role') not in ['warehouse', 'admin']:
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    upload = request.files.get('file')
+    if not upload:
+        return jsonify({'error': 'No file uploaded'}), 400
+    try:
+        file_date = datetime.fromisoformat(request.form['date']) if request.form.get('date') else None
+        rows = parse_price_file(io.TextIOWrapper(upload.stream, encoding='utf-8-sig'), file_date or datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify(dict(import_prices(rows), success=True))
+
+
 # --------------- HUB INVENTORY ---------------
+@warehouse_bp.route("/api/hub-valuation/<hub_name>", methods=["GET"])
+def hub_valuation(hub_name):
+    """Latest stored valuation snapshot of a hub (written by the revaluation job)"""
+    snapshot = latest_hub_valuation(hub_name)
+    if not snapshot:
+        return jsonify({"error": "No valuation yet"}), 404
+    return jsonify(snapshot)
+
+
 @warehouse_bp.route("/hub-inventory/<hub_name>", methods=["GET"])
 def hub_inventory(hub_name):
     """
@@ -668,59 +754,51 @@ def hub_inventory(hub_name):
     """
     # Find all clusters with this destination hub that are delivered
     clusters = list(mongo.db.collection_clusters.find(
-        {"destination": hub_name, "status": {"$in": ["delivered", "completed"]}}
+        {"destination": hub_name, "status": {"$in": ["delivered", "completed"]}},
+        projection("cluster_ref")
     ))
     
+    # All pickups of these clusters (one query); cluster_id is stored as a string or an ObjectId
+    cluster_ids = [c["_id"] for c in clusters]
+    pickups = list(mongo.db.pickup_requests.find({
+        "cluster_id": {"$in": cluster_ids + [str(cid) for cid in cluster_ids]}
+    }, projection("inventory_row"))) if clusters else []
+
+    # Values stored by the revaluation job are current unless prices moved since;
+    # the rest are priced together in one batch
+    prices = get_price_tables()
+    stale = [p for p in pickups if not is_current(p, prices)]
+    for pickup, value in zip(stale, price_stock(stale, prices)):
+        pickup["estimated_value"] = value
+
     hub_pickups = []
     total_weight = 0
     total_value = 0
     category_breakdown = {}
-    
-    for cluster in clusters:
-        # Get all pickups in this cluster
-        pickups = list(mongo.db.pickup_requests.find({
-            "cluster_id": str(cluster["_id"])
-        }))
+    for pickup in pickups:
+        category = pickup.get("ewaste_type", "Unknown")
+        category_breakdown[category] = category_breakdown.get(category, 0) + 1
+
+        estimated_value = pickup["estimated_value"]
+        total_weight += stock_weight(pickup)
+        total_value += estimated_value
         
-        for pickup in pickups:
-            category = pickup.get("ewaste_type", "Unknown")
-            category_breakdown[category] = category_breakdown.get(category, 0) + 1
-            
-            # Calculate estimated value
-            estimated_value = 0
-            if pickup.get("final_weight"):
-                # Check pricing engine for metal/category prices
-                weight = pickup.get("final_weight", 0)
-                metal_type = pickup.get("metal_type", "")
-                
-                if metal_type and mongo.db.metal_prices.find_one({"metal": metal_type}):
-                    price_doc = mongo.db.metal_prices.find_one({"metal": metal_type})
-                    estimated_value = weight * price_doc.get("price_per_kg", 0)
-                else:
-                    # Fallback to category pricing
-                    category_price = mongo.db.category_prices.find_one({"category": category})
-                    if category_price:
-                        estimated_value = weight * category_price.get("price_per_kg", 0)
-            
-            total_weight += pickup.get("final_weight", pickup.get("approx_weight", pickup.get("ewaste_weight", 0)))
-            total_value += estimated_value
-            
-            hub_pickups.append({
-                "_id": str(pickup["_id"]),
-                "user_name": pickup.get("user_name", "Unknown"),
-                "ewaste_type": category,
-                "status": pickup.get("status", "pending"),
-                "final_weight": pickup.get("final_weight"),
-                "approx_weight": pickup.get("approx_weight"),
-                "final_quality": pickup.get("final_quality"),
-                "collected_at": pickup.get("collected_at"),
-                "items": pickup.get("items", []),
-                "metal_type": pickup.get("metal_type"),
-                "estimated_value": round(estimated_value, 2),
-                "address": pickup.get("address"),
-                "area": pickup.get("area")
-            })
-    
+        hub_pickups.append({
+            "_id": str(pickup["_id"]),
+            "user_name": pickup.get("user_name", "Unknown"),
+            "ewaste_type": category,
+            "status": pickup.get("status", "pending"),
+            "final_weight": pickup.get("final_weight"),
+            "approx_weight": pickup.get("approx_weight"),
+            "final_quality": pickup.get("final_quality"),
+            "collected_at": pickup.get("collected_at"),
+            "items": pickup.get("items", []),
+            "metal_type": pickup.get("metal_type"),
+            "estimated_value": round(estimated_value, 2),
+            "address": pickup.get("address"),
+            "area": pickup.get("area")
+        })
+
     return {
         "hub": hub_name,
         "total_pickups": len(hub_pickups),
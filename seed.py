@@ -49,6 +49,10 @@ def reset_and_seed():
         { 'name': 'Local Doc', 'email': 'doctor1@example.com', 'password': 'doctorpass', 'role': 'doctor' }
     ]
 
+    # Lower-cased copies searched by the admin directory
+    for u in users:
+        u.update(name_lower=u['name'].lower(), email_lower=u['email'].lower())
+
     res = db.users.insert_many(users)
     user_ids = res.inserted_ids
     print(f'Inserted {len(user_ids)} users')
@@ -168,6 +172,9 @@ def reset_and_seed():
     })
     print('Inserted metal prices snapshot')
 
+    # New price-table version so running workers reload their cached rates
+    db.price_tables.update_one({'_id': 'current'}, {'$inc': {'version': 1}}, upsert=True)
+
     print('\nSeeding complete. Summary:')
     print('  users:', db.users.count_documents({}))
     print('  pickup_requests:', db.pickup_requests.count_documents({}))
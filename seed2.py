@@ -65,6 +65,10 @@ users = [
     }
 ]
 
+# Lower-cased copies searched by the admin directory
+for u in users:
+    u.update(name_lower=u.get('name', '').lower(), email_lower=u['email'].lower())
+
 db.users.insert_many(users)
 print(f"{len(users)} users inserted (Warehouse, Engineers, Drivers, Recycler).")
 
@@ -33,7 +33,9 @@ def create_user_if_missing(name, email, mobile, address, role):
             'mobile': mobile,
             'address': address,
             'password': generate_password_hash('password123'),
-            'role': role
+            'role': role,
+            'name_lower': name.lower(),
+            'email_lower': email.lower()
         })
 
 # Add 3 engineers
@@ -44,7 +46,7 @@ for i in range(1, 4):
 for i in range(1, 6):
     create_user_if_missing(f'Recycler {i}', f'recycler{i}@example.com', f'80000000{i}', f'Recycler Addr {i}', 'recycler')
 
-# Create many pickup requests (weights in grams)
+# Create many pickup requests (all weight fields in grams, final_weight included)
 ewaste_types = ['Mobile', 'Laptop', 'TV', 'Battery', 'Cables', 'Fridge']
 areas = ['Borivali', 'Andheri', 'Thane', 'Colaba', 'Ghatkopar', 'Dadar']
 
@@ -65,7 +67,7 @@ for i in range(1, 31):
         'ewaste_type': random.choice(ewaste_types),
         'created_at': created_at,
         'updated_at': created_at,
-        'items': [{'name': 'sample', 'qty': 1}],
+        'items': [{'type': 'sample', 'weight': wt, 'description': 'Sample item'}],
     }
     res = pickups.insert_one(doc)
     inserted_pickups.append(res.inserted_id)
@@ -255,8 +255,11 @@ def create_indexes(db):
         
         # Indexes on notifications
         if 'notifications' in db.list_collection_names():
-            db.notifications.create_index([('engineer_id', 1), ('read', 1)])
-            print("  ✓ notifications.engineer_id, read")
+            db.notifications.create_index([('recipient_id', 1), ('created_at', -1), ('_id', 1), ('read', 1),
+                                           ('type', 1), ('title', 1), ('message', 1)], name='notification_feed')
+            print("  ✓ notifications.recipient_id, created_at (feed)")
+            db.notifications.create_index([('recipient_id', 1), ('read', 1), ('created_at', -1)])
+            print("  ✓ notifications.recipient_id, read, created_at")
         
         # Indexes on active_routes
         if 'active_routes' in db.list_collection_names():
@@ -0,0 +1,103 @@
+"""
+Greedy grouping of unclustered pickups into collection clusters.
+
+Pickups are taken heaviest first as cluster anchors; each anchor collects the
+not yet used pickups within CLUSTER_RADIUS_KM until the cluster reaches the
+ready weight. Nothing here touches the database, so the same code runs in the
+analyze-routes endpoint and in the benchmarks.
+"""
+from services.geo import haversine_km
+
+CLUSTER_RADIUS_KM = 100
+# Cluster weights in grams
+READY_WEIGHT = 100000         # 100kg -> Ready
+ALMOST_READY_WEIGHT = 80000   # 80kg -> Almost Ready
+
+
+def _weight(pickup):
+    return pickup.get("approx_weight", pickup.get("ewaste_weight", 0))
+
+
+def nearest_hub(lat, lng, hubs):
+    """(hub, distance_km) of the closest hub"""
+    hub = min(hubs, key=lambda wh: haversine_km(lat, lng, wh["lat"], wh["lng"]))
+    return hub, haversine_km(lat, lng, hub["lat"], hub["lng"])
+
+
+def form_clusters(users, hubs, radius_km=CLUSTER_RADIUS_KM):
+    """
+    Group pickups (with latitude / longitude) into clusters.
+
+    Returns:
+        list of dict: cluster documents without created_at, users in pick order
+    """
+    users = sorted(users, key=_weight, reverse=True)
+    used_users = set()
+    clusters = []
+
+    for anchor in users:
+        if anchor["_id"] in used_users:
+            continue
+
+        # Nearest hub for drop-off
+        nearest_wh, dist_to_wh = nearest_hub(anchor["latitude"], anchor["longitude"], hubs)
+
+        anchor_weight = _weight(anchor)
+        cluster_users = [{
+            "user_id": anchor["_id"],
+            "weight": anchor_weight,
+            "distance_km": 0
+        }]
+        total_weight = anchor_weight
+        max_distance = 0
+        used_users.add(anchor["_id"])
+
+        for u in users:
+            if u["_id"] in used_users:
+                continue
+
+            dist = haversine_km(
+                anchor["latitude"], anchor["longitude"],
+                u["latitude"], u["longitude"]
+            )
+
+            if dist <= radius_km:
+                u_weight = _weight(u)
+                cluster_users.append({
+                    "user_id": u["_id"],
+                    "weight": u_weight,
+                    "distance_km": round(dist, 2)
+                })
+
+                total_weight += u_weight
+                max_distance = max(max_distance, dist)
+                used_users.add(u["_id"])
+
+            if total_weight >= READY_WEIGHT:
+                break
+
+        if total_weight >= READY_WEIGHT:
+            status = "ready"
+        elif total_weight >= ALMOST_READY_WEIGHT:
+            status = "almost_ready"
+        else:
+            status = "pending"
+
+        clusters.append({
+            "anchor_user_id": anchor["_id"],
+            "anchor_location": {
+                "lat": anchor["latitude"],
+                "lng": anchor["longitude"]
+            },
+            "destination": nearest_wh["name"],
+            "dist_to_hub": round(dist_to_wh, 2), # Distance to drop-off point
+            "radius_used_km": round(max_distance, 2),
+            "total_weight": total_weight,
+            "user_count": len(cluster_users),
+            "users": cluster_users,
+            "efficiency_score": round(total_weight / max_distance, 2) if max_distance else total_weight,
+            "status": status,
+            "admin_override": False
+        })
+
+    return clusters
@@ -0,0 +1,101 @@
+"""
+Pending (not yet paid) earnings per role.
+
+Everything is computed inside one aggregation: the role's pickups are selected
+(for drivers by joining their clusters to pickup_requests), the payable amount
+and the role's share are read from the stored valuation (services/valuation.py),
+and a $facet returns both the totals and the first page of items. Pickups not
+valued yet (created before the backfill ran) are valued here with
+`compute_valuation` instead of counting as 0.
+"""
+from bson import ObjectId
+
+from mongo import mongo
+from services.projections import projection
+from services.price_tables import get_price_tables
+from services.valuation import PAYOUT_SPLITS, compute_valuation
+
+
+def _amount_stages(role_key):
+    """Stages adding the stored `estimated_amount` and `estimated_share` to each pickup"""
+    return [
+        {'$addFields': {
+            'estimated_amount': {'$ifNull': ['$valuation.amount', 0]},
+            'estimated_share': {'$ifNull': [f'$valuation.splits.{role_key}', 0]},
+        }},
+    ]
+
+
+def _source(role, user_id):
+    """(collection, leading stages, sort field) selecting the role's unpaid pickups"""
+    if role == 'driver':
+        # Join the driver's clusters to their pickups (a pickup is counted once)
+        return mongo.db.collection_clusters, [
+            {'$match': {'driver_id': user_id}},
+            {'$project': {'pickup_ids': '$users.user_id'}},
+            {'$lookup': {'from': 'pickup_requests', 'localField': 'pickup_ids',
+                         'foreignField': '_id', 'as': 'pickups'}},
+            {'$unwind': '$pickups'},
+            {'$replaceRoot': {'newRoot': '$pickups'}},
+            {'$match': {'status': {'$ne': 'recycled'}}},
+            {'$group': {'_id': '$_id', 'doc': {'$first': '$$ROOT'}}},
+            {'$replaceRoot': {'newRoot': '$doc'}},
+        ], 'created_at'
+
+    if role == 'engineer':
+        match = {'engineer_id': user_id, 'status': {'$ne': 'recycled'}}
+    elif role == 'warehouse':
+        # Items collected but not yet recycled (waiting for payment)
+        return mongo.db.pickup_requests, [{'$match': {'status': 'collected'}}], 'updated_at'
+    else:
+        # Handle both ObjectId and string user_id
+        ids = [user_id, ObjectId(user_id)] if ObjectId.is_valid(user_id) else [user_id]
+        match = {'user_id': {'$in': ids}, 'status': {'$ne': 'recycled'}}
+    return mongo.db.pickup_requests, [{'$match': match}], 'created_at'
+
+
+def pending_earnings(role, user_id, limit=50):
+    """
+    Compute the pending items and total estimated share for a user.
+
+    Returns:
+        dict: items (newest first, at most `limit`), count, total_share and share_percentage
+    """
+    role_key = role if role in PAYOUT_SPLITS else 'user'
+    share = PAYOUT_SPLITS[role_key]
+    collection, stages, sort_field = _source(role, user_id)
+
+    pipeline = stages + [
+        {'$project': projection('pickup_pending_earning')},
+    ] + _amount_stages(role_key) + [
+        {'$facet': {
+            'items': [{'$sort': {sort_field: -1, '_id': -1}}, {'$limit': limit}],
+            'totals': [{'$group': {'_id': None, 'count': {'$sum': 1}, 'total_share': {'$sum': '$estimated_share'}}}],
+            'unvalued': [{'$match': {'valuation': None}},
+                         {'$project': {'engineer_price': 1, 'final_weight': 1, 'approx_weight': 1}}]
+        }}
+    ]
+
+    result = next(collection.aggregate(pipeline), {'items': [], 'totals': [], 'unvalued': []})
+    totals = result['totals'][0] if result['totals'] else {'count': 0, 'total_share': 0}
+    total_share = totals['total_share']
+
+    # Value the rows without a stored valuation the same way store_valuation would
+    fallback = {}
+    if result['unvalued']:
+        tables = get_price_tables()
+        for pickup in result['unvalued']:
+            fallback[pickup['_id']] = compute_valuation(pickup, tables)
+            total_share += fallback[pickup['_id']]['splits'][role_key]
+    for item in result['items']:
+        valuation = fallback.get(item['_id'])
+        if valuation:
+            item['estimated_amount'] = valuation['amount']
+            item['estimated_share'] = valuation['splits'][role_key]
+
+    return {
+        'items': result['items'],
+        'count': totals['count'],
+        'total_share': round(total_share, 2),
+        'share_percentage': f"{int(share * 100)}%"
+    }
@@ -0,0 +1,239 @@
+"""
+Arrival estimates for the stops of an active cluster.
+
+Estimates are recomputed when a new position of the cluster's driver is
+ingested (not when a customer polls) and cached per cluster; tracking pages
+only read the cache. A stop's ETA is the time to drive the remaining stops in
+route order plus a fixed dwell per stop. Travel time uses the average speed
+observed in the area (a ~5 km grid cell), learned from the GPS fixes
+themselves, and falls back to a city default where nothing has been
+observed yet.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from mongo import mongo
+from services.geo import haversine_km
+from services.projections import projection
+
+DEFAULT_SPEED_KMH = 20
+# Straight-line distance -> road distance
+ROAD_FACTOR = 1.3
+STOP_DWELL_MINUTES = 5
+# Size of an area speed cell in degrees (~5.5 km)
+AREA_CELL_DEG = 0.05
+# Fixes slower than this (m/s) are treated as stopped and not used for averages
+MIN_MOVING_SPEED_MS = 1.0
+# Stop lists are reloaded at most this often, so collected pickups drop out
+STOPS_TTL_SECONDS = 60
+# A new position only triggers a recompute after this much movement or time
+RECOMPUTE_MIN_METERS = 50
+RECOMPUTE_MIN_SECONDS = 30
+# Estimates no position has refreshed for this long are dropped (trip over, driver offline)
+ETA_TTL_SECONDS = 15 * 60
+# Expired cache entries are swept at most this often
+SWEEP_INTERVAL_SECONDS = 60
+DONE_STATUSES = ('collected', 'recycled', 'rejected')
+
+
+def _cell(lat, lng):
+    return f"{round(lat / AREA_CELL_DEG)}:{round(lng / AREA_CELL_DEG)}"
+
+
+class EtaEngine:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._etas = {}            # cluster_id -> cached estimate
+        self._stops = {}           # cluster_id -> (loaded_at, [stop, ...])
+        self._pickup_cluster = {}  # pickup_id -> (loaded_at, cluster_id)
+        self._speeds = None        # cell -> [sum_kmh, count]
+        self._swept_at = time.monotonic()
+
+    # ---------------- area speeds ----------------
+    def _area_speeds(self):
+        if self._speeds is None:
+            speeds = {
+                doc['_id']: [doc.get('sum_kmh', 0), doc.get('count', 0)]
+                for doc in mongo.db.area_speeds.find({}, {'sum_kmh': 1, 'count': 1})
+            }
+            with self._lock:
+                if self._speeds is None:
+                    self._speeds = speeds
+        return self._speeds
+
+    def record_speeds(self, fixes):
+        """Fold the moving fixes of a batch into the per-area averages (one bulk write)"""
+        totals = {}
+        for fix in fixes:
+            speed = fix.get('speed')
+            if speed is None or speed < MIN_MOVING_SPEED_MS:
+                continue
+            total = totals.setdefault(_cell(fix['lat'], fix['lng']), [0, 0])
+            total[0] += speed * 3.6
+            total[1] += 1
+        if not totals:
+            return
+
+        speeds = self._area_speeds()
+        with self._lock:
+            for cell, (sum_kmh, count) in totals.items():
+                current = speeds.setdefault(cell, [0, 0])
+                current[0] += sum_kmh
+                current[1] += count
+        mongo.db.area_speeds.bulk_write([
+            UpdateOne({'_id': cell}, {'$inc': {'sum_kmh': sum_kmh, 'count': count}}, upsert=True)
+            for cell, (sum_kmh, count) in totals.items()
+        ], ordered=False)
+
+    def _speed_kmh(self, lat, lng):
+        sum_kmh, count = self._area_speeds().get(_cell(lat, lng), (0, 0))
+        return sum_kmh / count if count else DEFAULT_SPEED_KMH
+
+    # ---------------- stops ----------------
+    def _load_stops(self, cluster_id):
+        cached = self._stops.get(cluster_id)
+        if cached and time.monotonic() - cached[0] < STOPS_TTL_SECONDS:
+            return cached[1]
+
+        cluster = mongo.db.collection_clusters.find_one({'_id': ObjectId(cluster_id)}, projection('cluster_route'))
+        member_ids = [u['user_id'] for u in cluster.get('users', [])] if cluster else []
+        pickups = {
+            p['_id']: p for p in mongo.db.pickup_requests.find({'_id': {'$in': member_ids}}, projection('pickup_stop'))
+        } if member_ids else {}
+
+        # Route order is the cluster's member order
+        stops = [
+            {
+                'pickup_id': str(pid),
+                'lat': pickups[pid].get('latitude'),
+                'lng': pickups[pid].get('longitude'),
+                'done': (pickups[pid].get('status') in DONE_STATUSES
+                         or pickups[pid].get('stop_status') == 'departed'),
+            }
+            for pid in member_ids
+            if pid in pickups and pickups[pid].get('latitude') is not None and pickups[pid].get('longitude') is not None
+        ]
+        now = time.monotonic()
+        with self._lock:
+            self._stops[cluster_id] = (now, stops)
+            for stop in stops:
+                self._pickup_cluster[stop['pickup_id']] = (now, cluster_id)
+        return stops
+
+    # ---------------- estimates ----------------
+    def compute(self, cluster_id, position):
+        """Recompute and cache the estimates of a cluster from a driver position"""
+        now = datetime.utcnow()
+        lat, lng = position['lat'], position['lng']
+        elapsed_min = 0.0
+        estimates = []
+        for stop in self._load_stops(cluster_id):
+            if stop['done']:
+                continue
+            distance = haversine_km(lat, lng, stop['lat'], stop['lng']) * ROAD_FACTOR
+            # Average the speed of the departure and arrival areas
+            speed = (self._speed_kmh(lat, lng) + self._speed_kmh(stop['lat'], stop['lng'])) / 2
+            elapsed_min += distance / speed * 60
+            estimates.append({
+                'pickup_id': stop['pickup_id'],
+                'minutes': round(elapsed_min),
+                'eta': now + timedelta(minutes=elapsed_min),
+                'stops_before': len(estimates),
+            })
+            elapsed_min += STOP_DWELL_MINUTES
+            lat, lng = stop['lat'], stop['lng']
+
+        estimate = {
+            'cluster_id': cluster_id,
+            'computed_at': now,
+            'position': {'lat': position['lat'], 'lng': position['lng']},
+            'stops': estimates,
+        }
+        with self._lock:
+            self._etas[cluster_id] = estimate
+        return estimate
+
+    def on_position(self, cluster_id, position, fixes=()):
+        """Ingest hook: learn speeds and refresh the cluster's estimates if the driver moved enough"""
+        self._sweep()
+        self.record_speeds(fixes)
+        cached = self._etas.get(cluster_id)
+        if cached:
+            moved_m = haversine_km(cached['position']['lat'], cached['position']['lng'],
+                                   position['lat'], position['lng']) * 1000
+            age = (datetime.utcnow() - cached['computed_at']).total_seconds()
+            if moved_m < RECOMPUTE_MIN_METERS and age < RECOMPUTE_MIN_SECONDS:
+                return cached
+        return self.compute(cluster_id, position)
+
+    def _sweep(self):
+        """Drop expired stop lists, pickup lookups and estimates (at most every SWEEP_INTERVAL_SECONDS)"""
+        now = time.monotonic()
+        if now - self._swept_at < SWEEP_INTERVAL_SECONDS:
+            return
+        oldest_eta = datetime.utcnow() - timedelta(seconds=ETA_TTL_SECONDS)
+        with self._lock:
+            self._swept_at = now
+            self._stops = {k: v for k, v in self._stops.items() if now - v[0] < STOPS_TTL_SECONDS}
+            self._pickup_cluster = {k: v for k, v in self._pickup_cluster.items() if now - v[0] < STOPS_TTL_SECONDS}
+            self._etas = {k: v for k, v in self._etas.items() if v['computed_at'] >= oldest_eta}
+
+    def forget(self, cluster_id):
+        """Drop everything cached for a cluster (its trip is over)"""
+        cluster_id = str(cluster_id)
+        with self._lock:
+            self._stops.pop(cluster_id, None)
+            self._etas.pop(cluster_id, None)
+            self._pickup_cluster = {
+                k: v for k, v in self._pickup_cluster.items() if str(v[1]) != cluster_id
+            }
+
+    def invalidate(self, cluster_id):
+        """Forget the cluster's stop list (a stop was reached or left)"""
+        with self._lock:
+            self._stops.pop(cluster_id, None)
+            self._etas.pop(cluster_id, None)
+
+    def cluster_eta(self, cluster_id):
+        return self._etas.get(cluster_id)
+
+    def pickup_eta(self, pickup_id):
+        """
+        Cached estimate for one pickup.
+
+        Returns:
+            dict or None: minutes, eta and stops_before, plus computed_at
+
+        Raises:
+            bson.errors.InvalidId: `pickup_id` is not an ObjectId
+        """
+        self._sweep()
+        cached = self._pickup_cluster.get(pickup_id)
+        if cached and time.monotonic() - cached[0] < STOPS_TTL_SECONDS:
+            cluster_id = cached[1]
+        else:
+            pickup = mongo.db.pickup_requests.find_one({'_id': ObjectId(pickup_id)}, projection('pickup_cluster_ref'))
+            cluster_id = pickup.get('cluster_id') if pickup else None
+            with self._lock:
+                self._pickup_cluster[pickup_id] = (time.monotonic(), cluster_id)
+        if not cluster_id:
+            return None
+
+        estimate = self._etas.get(str(cluster_id))
+        if not estimate:
+            return None
+        for stop in estimate['stops']:
+            if stop['pickup_id'] == pickup_id:
+                return dict(stop, computed_at=estimate['computed_at'])
+        return None
+
+
+_engine = EtaEngine()
+
+
+def get_eta_engine():
+    return _engine
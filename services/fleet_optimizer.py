@@ -0,0 +1,228 @@
+"""
+Batch fleet assignment for ready clusters.
+
+All `ready` clusters are matched to available engineers and drivers in a
+single pass. Each person contributes one column per free workload slot, the
+cost of a cell is the travel distance from the person's last known position
+(`driver_locations`) to the cluster anchor, and the Hungarian algorithm picks
+the assignment with the lowest total travel.
+"""
+from datetime import datetime
+
+import numpy as np
+from pymongo import UpdateOne
+
+from mongo import mongo
+from services.geo import haversine_matrix
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:
+    linear_sum_assignment = None
+
+# Maximum number of open (assigned / scheduled / in progress) clusters per person
+MAX_ACTIVE_CLUSTERS = 2
+ACTIVE_STATUSES = ['assigned', 'in_progress', 'scheduled']
+
+
+def _hungarian(cost):
+    """Shortest augmenting path Hungarian algorithm for a cost matrix with rows <= cols"""
+    n, m = cost.shape
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    p = np.zeros(m + 1, dtype=int)    # p[j] = row (1-based) matched to column j
+    way = np.zeros(m + 1, dtype=int)
+
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            free = ~used[1:]
+            cur = cost[i0 - 1] - u[i0] - v[1:]
+            better = free & (cur < minv[1:])
+            minv[1:][better] = cur[better]
+            way[1:][better] = j0
+
+            candidates = np.where(free, minv[1:], np.inf)
+            j1 = int(np.argmin(candidates)) + 1
+            delta = candidates[j1 - 1]
+
+            u[p[used]] += delta
+            v[used] -= delta
+            minv[1:][free] -= delta
+
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while True:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+            if j0 == 0:
+                break
+
+    cols = np.nonzero(p[1:])[0]
+    rows = p[1:][cols] - 1
+    order = np.argsort(rows)
+    return rows[order], cols[order]
+
+
+def solve_assignment(cost):
+    """Return (row_ind, col_ind) minimising total cost. Works for rectangular matrices."""
+    cost = np.asarray(cost, dtype=float)
+    if cost.size == 0:
+        return np.array([], dtype=int), np.array([], dtype=int)
+    if linear_sum_assignment is not None:
+        return linear_sum_assignment(cost)
+    if cost.shape[0] > cost.shape[1]:
+        cols, rows = _hungarian(cost.T)
+        order = np.argsort(rows)
+        return rows[order], cols[order]
+    return _hungarian(cost)
+
+
+def _active_counts(field):
+    """Open cluster count per engineer_id / driver_id in one aggregation"""
+    pipeline = [
+        {'$match': {'status': {'$in': ACTIVE_STATUSES}, field: {'$ne': None}}},
+        {'$group': {'_id': '$' + field, 'count': {'$sum': 1}}}
+    ]
+    return {d['_id']: d['count'] for d in mongo.db.collection_clusters.aggregate(pipeline)}
+
+
+def _load_people(role, default_location):
+    """Available staff of a role with their remaining slots and last known position"""
+    people = list(mongo.db.users.find(
+        {'role': role, 'available_tomorrow': {'$ne': False}},
+        {'_id': 1, 'name': 1}
+    ))
+    if not people:
+        return []
+
+    ids = [str(p['_id']) for p in people]
+    positions = {
+        loc['driver_id']: loc for loc in mongo.db.driver_locations.find(
+            {'driver_id': {'$in': ids}}, {'driver_id': 1, 'lat': 1, 'lng': 1}
+        )
+    }
+    counts = _active_counts('engineer_id' if role == 'engineer' else 'driver_id')
+
+    result = []
+    for pid in ids:
+        free_slots = MAX_ACTIVE_CLUSTERS - counts.get(pid, 0)
+        if free_slots <= 0:
+            continue
+        loc = positions.get(pid) or {}
+        lat = loc.get('lat') if loc.get('lat') is not None else default_location['lat']
+        lng = loc.get('lng') if loc.get('lng') is not None else default_location['lng']
+        result.append({'id': pid, 'lat': lat, 'lng': lng, 'slots': free_slots})
+    return result
+
+
+def _load_ready_clusters():
+    """Unassigned ready clusters with an anchor position (centroid fallback in one query)"""
+    clusters = list(mongo.db.collection_clusters.find(
+        {'status': 'ready', 'engineer_id': None, 'driver_id': None},
+        {'_id': 1, 'anchor_location': 1, 'users': 1}
+    ))
+
+    missing = [c for c in clusters if not (c.get('anchor_location') or {}).get('lat')]
+    if missing:
+        pickup_ids = [u['user_id'] for c in missing for u in c.get('users', [])]
+        coords = {
+            p['_id']: p for p in mongo.db.pickup_requests.find(
+                {'_id': {'$in': pickup_ids}}, {'latitude': 1, 'longitude': 1}
+            )
+        }
+        for c in missing:
+            pts = [coords[u['user_id']] for u in c.get('users', []) if u['user_id'] in coords]
+            pts = [p for p in pts if p.get('latitude') is not None and p.get('longitude') is not None]
+            if pts:
+                c['anchor_location'] = {
+                    'lat': sum(p['latitude'] for p in pts) / len(pts),
+                    'lng': sum(p['longitude'] for p in pts) / len(pts)
+                }
+
+    return [c for c in clusters if (c.get('anchor_location') or {}).get('lat') is not None]
+
+
+def _match(clusters, people):
+    """Match clusters to people (expanded into workload slots). Returns {cluster index: (person id, km)}"""
+    if not clusters or not people:
+        return {}
+
+    slot_owner = np.repeat(np.arange(len(people)), [p['slots'] for p in people])
+    person_lat = np.array([p['lat'] for p in people], dtype=float)
+    person_lng = np.array([p['lng'] for p in people], dtype=float)
+
+    # Distance is computed once per person and broadcast to that person's slots
+    dist = np.asarray(haversine_matrix(
+        [c['anchor_location']['lat'] for c in clusters],
+        [c['anchor_location']['lng'] for c in clusters],
+        person_lat, person_lng
+    ))
+    cost = dist[:, slot_owner]
+
+    rows, cols = solve_assignment(cost)
+    return {int(r): (people[slot_owner[c]]['id'], float(cost[r, c])) for r, c in zip(rows, cols)}
+
+
+def optimize_fleet_assignment(default_location):
+    """
+    Assign every ready cluster to an engineer and a driver in one pass.
+
+    Args:
+        default_location (dict): {'lat', 'lng'} used for staff without a known position
+
+    Returns:
+        dict: summary with assigned cluster count and total travel in km
+    """
+    clusters = _load_ready_clusters()
+    engineers = _load_people('engineer', default_location)
+    drivers = _load_people('driver', default_location)
+
+    engineer_match = _match(clusters, engineers)
+    # Drivers are only matched to clusters that actually received an engineer
+    staffed = sorted(engineer_match)
+    driver_match_sub = _match([clusters[i] for i in staffed], drivers)
+    driver_match = {staffed[k]: v for k, v in driver_match_sub.items()}
+
+    now = datetime.utcnow()
+    operations = []
+    assigned_ids = []
+    total_km = 0.0
+    for idx in sorted(set(engineer_match) & set(driver_match)):
+        eng_id, eng_km = engineer_match[idx]
+        drv_id, drv_km = driver_match[idx]
+        cluster_id = clusters[idx]['_id']
+        operations.append(UpdateOne(
+            {'_id': cluster_id, 'status': 'ready'},
+            {'$set': {
+                'status': 'assigned',
+                'engineer_id': eng_id,
+                'driver_id': drv_id,
+                'assigned_at': now,
+                'scheduled_for': now,
+                'assignment_travel_km': round(eng_km + drv_km, 2)
+            }}
+        ))
+        assigned_ids.append(cluster_id)
+        total_km += eng_km + drv_km
+
+    if operations:
+        mongo.db.collection_clusters.bulk_write(operations, ordered=False)
+        # Pickups reference clusters either by ObjectId or by its string form
+        mongo.db.pickup_requests.update_many(
+            {'cluster_id': {'$in': assigned_ids + [str(cid) for cid in assigned_ids]}},
+            {'$set': {'status': 'assigned'}}
+        )
+
+    return {
+        'ready_clusters': len(clusters),
+        'assigned': len(assigned_ids),
+        'total_travel_km': round(total_km, 2)
+    }
@@ -0,0 +1,37 @@
+import math
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+EARTH_RADIUS_KM = 6371
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km between two points"""
+    d_lat = math.radians(lat2 - lat1)
+    d_lon = math.radians(lon2 - lon1)
+    a = (math.sin(d_lat / 2) ** 2 +
+         math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(d_lon / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def haversine_matrix(lats1, lngs1, lats2, lngs2):
+    """
+    Pairwise distance matrix in km.
+
+    Returns an array of shape (len(lats1), len(lats2)) where cell [i, j] is the
+    distance from point i of the first set to point j of the second set.
+    """
+    if np is None:
+        return [[haversine_km(a, b, c, d) for c, d in zip(lats2, lngs2)] for a, b in zip(lats1, lngs1)]
+
+    lat1 = np.radians(np.asarray(lats1, dtype=float))[:, None]
+    lng1 = np.radians(np.asarray(lngs1, dtype=float))[:, None]
+    lat2 = np.radians(np.asarray(lats2, dtype=float))[None, :]
+    lng2 = np.radians(np.asarray(lngs2, dtype=float))[None, :]
+
+    a = (np.sin((lat2 - lat1) / 2) ** 2 +
+         np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
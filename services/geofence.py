@@ -0,0 +1,195 @@
+"""
+Stop arrival / departure detection on the location ingest path.
+
+The stops of an active cluster are loaded once into a `StopFences` index (a
+circle per stop plus a precomputed bounding box for a cheap reject) and each
+ingested fix is checked against the stops not yet left. Entering a stop's
+arrival radius marks the pickup as arrived and notifies the customer; leaving
+the larger departure radius (the gap avoids flapping on GPS jitter) marks it
+departed. Both transitions are written with a conditional update, so a
+transition is only acted on once even with several workers.
+"""
+import math
+import threading
+import time
+
+from bson import ObjectId
+
+from mongo import mongo
+from services.geo import haversine_km
+from services.projections import projection
+
+ARRIVAL_RADIUS_M = 75
+DEPARTURE_RADIUS_M = 150
+# Stop fences are reloaded at most this often
+FENCES_TTL_SECONDS = 60
+# Fences of clusters without fixes for this long are dropped (trip over, driver offline)
+IDLE_FENCES_SECONDS = 15 * 60
+DONE_STATUSES = ('collected', 'recycled', 'rejected')
+
+METERS_PER_DEGREE = 111320
+
+
+class StopFences:
+    """Geofences of one cluster's stops in route order"""
+
+    def __init__(self, stops, driver_id=None):
+        self.loaded_at = self.used_at = time.monotonic()
+        self.driver_id = driver_id
+        self.stops = stops
+        for stop in stops:
+            # Bounding box of the departure circle
+            stop['d_lat'] = DEPARTURE_RADIUS_M / METERS_PER_DEGREE
+            stop['d_lng'] = DEPARTURE_RADIUS_M / (METERS_PER_DEGREE * max(math.cos(math.radians(stop['lat'])), 0.01))
+
+    def current_stop(self):
+        """
+        1-based route position the driver is at or heading to (None when all are done).
+
+        Stops passed over without an arrival count as skipped.
+        """
+        for i in range(len(self.stops) - 1, -1, -1):
+            state = self.stops[i]['state']
+            if state == 'arrived':
+                return i + 1
+            if state == 'departed':
+                return i + 2 if i + 1 < len(self.stops) else None
+        return 1 if self.stops else None
+
+    def check(self, lat, lng):
+        """Transitions caused by one fix: list of (event, stop)"""
+        events = []
+        for stop in self.stops:
+            if stop['state'] == 'departed':
+                continue
+            near_box = abs(lat - stop['lat']) <= stop['d_lat'] and abs(lng - stop['lng']) <= stop['d_lng']
+            distance_m = haversine_km(lat, lng, stop['lat'], stop['lng']) * 1000 if near_box else math.inf
+            if stop['state'] == 'pending' and distance_m <= ARRIVAL_RADIUS_M:
+                stop['state'] = 'arrived'
+                events.append(('arrived', stop))
+            elif stop['state'] == 'arrived' and distance_m > DEPARTURE_RADIUS_M:
+                stop['state'] = 'departed'
+                events.append(('departed', stop))
+        return events
+
+
+class GeofenceMonitor:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fences = {}
+        self._swept_at = time.monotonic()
+
+    def _sweep(self):
+        """Drop fences of idle clusters (at most every FENCES_TTL_SECONDS)"""
+        now = time.monotonic()
+        if now - self._swept_at < FENCES_TTL_SECONDS:
+            return
+        with self._lock:
+            self._swept_at = now
+            self._fences = {k: f for k, f in self._fences.items() if now - f.used_at < IDLE_FENCES_SECONDS}
+
+    def forget(self, cluster_id):
+        """Drop a cluster's fences (its trip is over)"""
+        with self._lock:
+            self._fences.pop(str(cluster_id), None)
+
+    def _load(self, cluster_id):
+        fences = self._fences.get(cluster_id)
+        if fences and time.monotonic() - fences.loaded_at < FENCES_TTL_SECONDS:
+            return fences
+
+        cluster = mongo.db.collection_clusters.find_one(
+            {'_id': ObjectId(cluster_id)}, projection('cluster_route')
+        ) if ObjectId.is_valid(cluster_id) else None
+        member_ids = [u['user_id'] for u in cluster.get('users', [])] if cluster else []
+        pickups = {
+            p['_id']: p for p in mongo.db.pickup_requests.find({'_id': {'$in': member_ids}}, projection('pickup_stop'))
+        } if member_ids else {}
+
+        stops = []
+        for pid in member_ids:
+            pickup = pickups.get(pid)
+            if not pickup or pickup.get('latitude') is None or pickup.get('longitude') is None:
+                continue
+            state = pickup.get('stop_status') or 'pending'
+            if pickup.get('status') in DONE_STATUSES:
+                state = 'departed'
+            stops.append({
+                'pickup_id': pid,
+                'user_id': pickup.get('user_id'),
+                'lat': pickup['latitude'],
+                'lng': pickup['longitude'],
+                'state': state,
+            })
+        fences = StopFences(stops, driver_id=cluster.get('driver_id') if cluster else None)
+        with self._lock:
+            self._fences[cluster_id] = fences
+        return fences
+
+    def is_assigned(self, cluster_id, driver_id):
+        """Whether `driver_id` is the cluster's assigned driver (unknown clusters have none)"""
+        fences = self._load(cluster_id)
+        return fences.driver_id is not None and str(fences.driver_id) == str(driver_id)
+
+    def process(self, cluster_id, driver_id, fixes):
+        """
+        Run a batch of fixes through the cluster's fences. Fixes of any other
+        driver than the cluster's own are ignored.
+
+        Returns:
+            dict: events (list of {event, pickup_id, at}) and current_stop
+        """
+        self._sweep()
+        fences = self._load(cluster_id)
+        if fences.driver_id is None or str(fences.driver_id) != str(driver_id):
+            return {'events': [], 'current_stop': None}
+        fences.used_at = time.monotonic()
+        events = []
+        with self._lock:
+            for fix in fixes:
+                for event, stop in fences.check(fix['lat'], fix['lng']):
+                    events.append((event, stop, fix['ts']))
+
+        applied = [e for e in events if self._apply(cluster_id, driver_id, *e)]
+        return {
+            'events': [{'event': event, 'pickup_id': str(stop['pickup_id']), 'at': at} for event, stop, at in applied],
+            'current_stop': fences.current_stop(),
+        }
+
+    def _apply(self, cluster_id, driver_id, event, stop, at):
+        """Persist one transition; False when another worker already recorded it"""
+        # Pickups never reached have no stop_status yet
+        previous = {'$in': [None, 'pending']} if event == 'arrived' else 'arrived'
+        result = mongo.db.pickup_requests.update_one(
+            {'_id': stop['pickup_id'], 'stop_status': previous},
+            {'$set': {'stop_status': event, f'driver_{event}_at': at}}
+        )
+        if not result.modified_count:
+            return False
+
+        if event == 'arrived' and stop.get('user_id'):
+            from routes.notification_routes import create_notification
+            create_notification(
+                recipient_id=str(stop['user_id']),
+                title='Driver Arrived',
+                message='Your pickup driver has arrived at your location.',
+                notification_type='driver_arrived',
+                related_data={'pickup_id': str(stop['pickup_id']), 'cluster_id': cluster_id, 'driver_id': driver_id}
+            )
+        return True
+
+    def next_stop_distance_m(self, cluster_id, lat, lng):
+        """Distance to the stop the driver is at or heading to (None when unknown)"""
+        fences = self._fences.get(cluster_id)
+        current = fences.current_stop() if fences else None
+        if current is None:
+            return None
+        stop = fences.stops[current - 1]
+        return haversine_km(lat, lng, stop['lat'], stop['lng']) * 1000
+
+
+_monitor = GeofenceMonitor()
+
+
+def get_geofence_monitor():
+    return _monitor
@@ -0,0 +1,160 @@
+"""
+Indexes backing the route queries.
+
+`ensure_indexes` is called once at app start-up. create_index is idempotent, so
+re-running it against an already indexed database is cheap. Time-series
+collections are created first, since they cannot be created implicitly by an
+insert. Indexes a newer one supersedes are dropped afterwards.
+"""
+import os
+
+from pymongo.errors import OperationFailure
+
+# Read notifications are deleted this many days after being read (0 keeps them)
+NOTIFICATION_READ_TTL_DAYS = int(os.getenv('NOTIFICATION_READ_TTL_DAYS', '30'))
+
+# Route updates shared by drivers are kept this many days
+ROUTE_HISTORY_TTL_DAYS = int(os.getenv('ROUTE_HISTORY_TTL_DAYS', '14'))
+
+# GPS history is kept this many days
+LOCATION_HISTORY_TTL_DAYS = int(os.getenv('LOCATION_HISTORY_TTL_DAYS', '90'))
+
+# collection -> create_collection options
+TIMESERIES_COLLECTIONS = {
+    'driver_location_history': {
+        'timeseries': {'timeField': 'ts', 'metaField': 'meta', 'granularity': 'seconds'},
+        'expireAfterSeconds': LOCATION_HISTORY_TTL_DAYS * 86400,
+    },
+}
+
+# collection -> list of (keys, options)
+INDEXES = {
+    'users': [
+        # Admin directory: role filter + keyset pagination on _id (the search is a filter on top)
+        ([('role', 1), ('_id', 1)], {}),
+        # Login / registration lookup
+        ([('email', 1)], {}),
+    ],
+    'pickup_requests': [
+        # Recycler queue / history: keyset pagination in (updated_at, _id) order per status
+        ([('status', 1), ('updated_at', -1), ('_id', -1)], {}),
+        # Pending earnings per role
+        ([('user_id', 1), ('created_at', -1)], {}),
+        ([('engineer_id', 1), ('created_at', -1)], {}),
+    ],
+    'collection_clusters': [
+        ([('driver_id', 1)], {}),
+    ],
+    'invoices': [
+        # Invoice list: keyset pagination per recipient
+        ([('recipient_id', 1), ('created_at', -1), ('_id', -1)], {}),
+        ([('recipient_role', 1), ('created_at', -1), ('_id', -1)], {}),
+    ],
+    'hub_valuations': [
+        # Latest snapshot per hub, and the job's "last run" check
+        ([('hub', 1), ('valued_at', -1)], {}),
+        ([('valued_at', -1)], {}),
+    ],
+    'price_history': [
+        # One version per series and date (re-imports upsert); as-of loads read in date order
+        ([('kind', 1), ('name', 1), ('effective_from', 1)], {'unique': True}),
+    ],
+    'driver_location_history': [
+        # Per-driver and per-trip history in time order
+        ([('meta.driver_id', 1), ('ts', 1)], {}),
+        ([('meta.cluster_id', 1), ('ts', 1)], {}),
+    ],
+    'active_routes': [
+        # At most one active route-state document per driver (share-route upserts it)
+        ([('driver_id', 1)], {
+            'name': 'one_active_route_per_driver',
+            'unique': True,
+            'partialFilterExpression': {'status': 'active'}
+        }),
+        # Engineer view of a driver's trips, newest first
+        ([('driver_id', 1), ('timestamp', -1)], {}),
+    ],
+    'route_history': [
+        ([('created_at', 1)], {'name': 'created_at_ttl', 'expireAfterSeconds': ROUTE_HISTORY_TTL_DAYS * 86400}),
+        ([('driver_id', 1), ('created_at', -1)], {}),
+    ],
+    'notifications': [
+        # Feed: newest notifications per recipient, covering the notification_feed projection
+        ([('recipient_id', 1), ('created_at', -1), ('_id', 1), ('read', 1), ('type', 1),
+          ('title', 1), ('message', 1)], {'name': 'notification_feed'}),
+        # Unread filters (mark all read, counter reconciliation)
+        ([('recipient_id', 1), ('read', 1), ('created_at', -1)], {}),
+    ] + ([
+        # Retention: expire read notifications; unread ones never match the partial filter
+        ([('read_at', 1)], {
+            'name': 'read_at_ttl',
+            'expireAfterSeconds': NOTIFICATION_READ_TTL_DAYS * 86400,
+            'partialFilterExpression': {'read': True}
+        }),
+    ] if NOTIFICATION_READ_TTL_DAYS > 0 else []),
+}
+
+# Indexes made redundant by a newer one, dropped by name on start-up
+SUPERSEDED_INDEXES = {
+    # Prefix of the covering notification_feed index
+    'notifications': ['recipient_id_1_created_at_-1'],
+}
+
+# Error code returned when an index exists with different options
+INDEX_OPTIONS_CONFLICT = 85
+# Error code returned when dropping an index that does not exist
+INDEX_NOT_FOUND = 27
+
+
+def ensure_collections(db):
+    """Create the time-series collections that do not exist yet"""
+    existing = set(db.list_collection_names())
+    for collection, options in TIMESERIES_COLLECTIONS.items():
+        if collection in existing:
+            continue
+        try:
+            db.create_collection(collection, **options)
+        except Exception as e:
+            # Servers before MongoDB 5.0 have no time-series support; a plain collection still works
+            print(f"Time-series collection {collection} not created ({e}); using a regular collection")
+
+
+def ensure_indexes(db):
+    """Create all indexes in INDEXES, reporting (not raising) individual failures"""
+    ensure_collections(db)
+    for collection, specs in INDEXES.items():
+        for keys, options in specs:
+            try:
+                db[collection].create_index(keys, **options)
+            except OperationFailure as e:
+                if e.code == INDEX_OPTIONS_CONFLICT and 'expireAfterSeconds' in options:
+                    # TTL changed in config: update the existing index in place
+                    _update_ttl(db, collection, options)
+                else:
+                    print(f"Index creation failed on {collection} {keys}: {e}")
+            except Exception as e:
+                print(f"Index creation failed on {collection} {keys}: {e}")
+    drop_superseded_indexes(db)
+
+
+def drop_superseded_indexes(db):
+    """Drop the indexes in SUPERSEDED_INDEXES (already dropped ones are skipped)"""
+    for collection, names in SUPERSEDED_INDEXES.items():
+        for name in names:
+            try:
+                db[collection].drop_index(name)
+            except OperationFailure as e:
+                if e.code != INDEX_NOT_FOUND:
+                    print(f"Dropping index {name} on {collection} failed: {e}")
+            except Exception as e:
+                print(f"Dropping index {name} on {collection} failed: {e}")
+
+
+def _update_ttl(db, collection, options):
+    try:
+        db.command('collMod', collection, index={
+            'name': options['name'],
+            'expireAfterSeconds': options['expireAfterSeconds']
+        })
+    except Exception as e:
+        print(f"TTL update failed on {collection} {options['name']}: {e}")
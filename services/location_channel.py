@@ -0,0 +1,98 @@
+"""
+Live driver positions pushed to map viewers.
+
+Each driver has one slot holding its latest position and a version number.
+Ingest publishes into the slot once per batch; every viewer stream of that
+driver waits on the slot and, when woken, reads the newest position. Updates
+are coalesced: a slow viewer skips intermediate positions instead of queueing
+them, and N viewers cost N memory reads, not N database reads.
+
+The channel is in-process, like the notification broker: with several workers
+a viewer only sees fixes ingested by its own worker unless a shared channel is
+installed with `set_location_channel()`.
+"""
+import threading
+
+
+class _Slot:
+    def __init__(self, lock):
+        self.changed = threading.Condition(lock)
+        self.version = 0
+        self.position = None
+        self.viewers = 0
+
+
+class LocationChannel:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._slots = {}
+
+    def _slot(self, driver_id):
+        slot = self._slots.get(driver_id)
+        if slot is None:
+            slot = self._slots[driver_id] = _Slot(self._lock)
+        return slot
+
+    def _discard_if_idle(self, driver_id, slot):
+        # A slot nobody watches and that never received a position holds nothing
+        if slot.viewers == 0 and slot.position is None and self._slots.get(driver_id) is slot:
+            del self._slots[driver_id]
+
+    def publish(self, driver_id, position):
+        """Replace the driver's latest position and wake its viewers"""
+        with self._lock:
+            slot = self._slot(str(driver_id))
+            slot.version += 1
+            slot.position = dict(position)
+            slot.changed.notify_all()
+
+    def wait(self, driver_id, after_version, timeout):
+        """
+        Block until the driver has a position newer than `after_version`.
+
+        Returns:
+            tuple: (version, position); position is None on timeout
+        """
+        driver_id = str(driver_id)
+        with self._lock:
+            slot = self._slot(driver_id)
+            slot.changed.wait_for(lambda: slot.version > after_version, timeout)
+            if slot.version > after_version:
+                return slot.version, dict(slot.position)
+            self._discard_if_idle(driver_id, slot)
+            return slot.version, None
+
+    def version(self, driver_id):
+        with self._lock:
+            slot = self._slots.get(str(driver_id))
+            return slot.version if slot else 0
+
+    def add_viewer(self, driver_id):
+        with self._lock:
+            self._slot(str(driver_id)).viewers += 1
+
+    def remove_viewer(self, driver_id):
+        driver_id = str(driver_id)
+        with self._lock:
+            slot = self._slots.get(driver_id)
+            if slot:
+                slot.viewers = max(slot.viewers - 1, 0)
+                self._discard_if_idle(driver_id, slot)
+
+    def viewer_count(self, driver_id):
+        with self._lock:
+            slot = self._slots.get(str(driver_id))
+            return slot.viewers if slot else 0
+
+
+_channel = LocationChannel()
+
+
+def get_location_channel():
+    return _channel
+
+
+def set_location_channel(channel):
+    """Replace the process-wide channel (call once at start-up)"""
+    global _channel
+    _channel = channel
@@ -0,0 +1,189 @@
+"""
+Batched GPS ingestion for driver telemetry.
+
+Driver clients buffer geolocation fixes and post them in batches (JSON or
+msgpack, optionally gzip-compressed) instead of one request per fix. A batch
+is written with one insert_many into the `driver_location_history` time-series
+collection and the driver's latest position is updated once per batch (in the
+position store, which writes it behind to `driver_locations`) and pushed to
+live map viewers. Fixes tagged with a cluster are checked against the
+cluster's stop geofences (arrivals / departures, and the server-side stop
+number) and refresh that cluster's arrival estimates.
+
+Batch body:
+    {"cluster_id": "...", "stop_number": 2,
+     "fixes": [{"t": 1718000000000, "lat": 19.07, "lng": 72.87,
+                "speed": 8.2, "accuracy": 12, "heading": 90}, ...]}
+
+A fix may also be a compact array [t, lat, lng, speed, accuracy, heading]
+(trailing values optional). `t` is epoch milliseconds, epoch seconds or an
+ISO-8601 string.
+"""
+import gzip
+import json
+from datetime import datetime, timezone
+
+from mongo import mongo
+from services.position_store import get_position_store
+from services.location_channel import get_location_channel
+from services.eta import get_eta_engine
+from services.geofence import get_geofence_monitor
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+HISTORY_COLLECTION = 'driver_location_history'
+
+# Largest batch accepted in one request
+MAX_FIXES_PER_BATCH = 500
+
+MSGPACK_TYPES = ('application/msgpack', 'application/x-msgpack')
+COMPACT_FIELDS = ('t', 'lat', 'lng', 'speed', 'accuracy', 'heading')
+
+
+class InvalidBatch(ValueError):
+    """The posted batch cannot be decoded or has no usable fixes"""
+
+
+class ClusterNotAssigned(Exception):
+    """The batch names a cluster the posting driver is not assigned to"""
+
+
+def decode_batch(body, content_type='', content_encoding=''):
+    """Decode a posted batch body into a dict with a `fixes` list"""
+    if 'gzip' in (content_encoding or ''):
+        try:
+            body = gzip.decompress(body)
+        except OSError as e:
+            raise InvalidBatch(f'Invalid gzip body: {e}')
+
+    if (content_type or '').split(';')[0].strip() in MSGPACK_TYPES:
+        if msgpack is None:
+            raise InvalidBatch('msgpack is not installed on the server; send JSON')
+        try:
+            payload = msgpack.unpackb(body, raw=False)
+        except Exception as e:
+            raise InvalidBatch(f'Invalid msgpack body: {e}')
+    else:
+        try:
+            payload = json.loads(body or b'null')
+        except ValueError as e:
+            raise InvalidBatch(f'Invalid JSON body: {e}')
+
+    # A bare list of fixes is accepted too
+    if isinstance(payload, list):
+        payload = {'fixes': payload}
+    if not isinstance(payload, dict) or not isinstance(payload.get('fixes'), list):
+        raise InvalidBatch('Expected an object with a "fixes" list')
+    if len(payload['fixes']) > MAX_FIXES_PER_BATCH:
+        raise InvalidBatch(f'At most {MAX_FIXES_PER_BATCH} fixes per batch')
+    return payload
+
+
+def _parse_time(value):
+    """Epoch ms / epoch s / ISO-8601 -> naive UTC datetime"""
+    if value is None:
+        return datetime.utcnow()
+    if isinstance(value, (int, float)):
+        seconds = value / 1000 if value > 1e11 else value
+        return datetime.fromtimestamp(seconds, tz=timezone.utc).replace(tzinfo=None)
+    parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _optional_float(value):
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def normalize_fixes(raw_fixes):
+    """
+    Validate fixes and return them sorted by time.
+
+    Fixes with missing or out-of-range coordinates or unparseable timestamps
+    are skipped; duplicate timestamps keep the first fix.
+    """
+    fixes = {}
+    for raw in raw_fixes:
+        if isinstance(raw, (list, tuple)):
+            raw = dict(zip(COMPACT_FIELDS, raw))
+        if not isinstance(raw, dict):
+            continue
+        try:
+            lat = float(raw['lat'])
+            lng = float(raw['lng'])
+            ts = _parse_time(raw.get('t', raw.get('ts', raw.get('timestamp'))))
+        except (KeyError, TypeError, ValueError, OverflowError, OSError):
+            continue
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            continue
+        fixes.setdefault(ts, {
+            'ts': ts,
+            'lat': lat,
+            'lng': lng,
+            'speed': _optional_float(raw.get('speed')),
+            'accuracy': _optional_float(raw.get('accuracy')),
+            'heading': _optional_float(raw.get('heading')),
+        })
+    return [fixes[ts] for ts in sorted(fixes)]
+
+
+def ingest_fixes(driver_id, fixes, cluster_id=None, stop_number=None):
+    """
+    Store a batch of normalized fixes and update the driver's latest position.
+
+    Returns:
+        dict: accepted (number of fixes stored), latest (newest fix), stop
+        events detected in the batch and the current stop number
+    """
+    if not fixes:
+        raise InvalidBatch('No valid fixes in batch')
+    # Stops, ETAs and customer notifications of a cluster follow its own driver only
+    if cluster_id and not get_geofence_monitor().is_assigned(cluster_id, driver_id):
+        raise ClusterNotAssigned(f'Cluster {cluster_id} is not assigned to this driver')
+
+    meta = {'driver_id': driver_id, 'cluster_id': cluster_id}
+    mongo.db[HISTORY_COLLECTION].insert_many(
+        [dict(fix, meta=meta) for fix in fixes],
+        ordered=False
+    )
+
+    stops = {'events': [], 'current_stop': None}
+    if cluster_id:
+        try:
+            stops = get_geofence_monitor().process(cluster_id, driver_id, fixes)
+        except Exception as e:
+            print(f"Geofence check failed for cluster {cluster_id}: {e}")
+
+    latest = fixes[-1]
+    position = {
+        'lat': latest['lat'],
+        'lng': latest['lng'],
+        'timestamp': latest['ts'],
+        'speed': latest['speed'],
+        'cluster_id': cluster_id,
+    }
+    # The geofences know which stop the driver is at; the client's number is a fallback
+    if stops['current_stop'] is not None:
+        position['stopNumber'] = stops['current_stop']
+    elif stop_number is not None:
+        position['stopNumber'] = stop_number
+    merged = get_position_store().update(driver_id, position)
+    get_location_channel().publish(driver_id, merged)
+
+    if cluster_id:
+        try:
+            if stops['events']:
+                get_eta_engine().invalidate(cluster_id)
+            get_eta_engine().on_position(cluster_id, merged, fixes)
+        except Exception as e:
+            # Estimates are best effort; never fail the ingest for them
+            print(f"ETA update failed for cluster {cluster_id}: {e}")
+
+    return {'accepted': len(fixes), 'latest': latest, **stops}
@@ -0,0 +1,80 @@
+"""
+Fan-out of notification events to live subscribers (server-sent event streams).
+
+`InProcessBroker` keeps one bounded queue per open stream inside the current
+process. Multi-worker deployments can plug in a shared broker (e.g. Redis
+pub/sub) by implementing `NotificationBroker` and calling `set_broker()` at
+start-up.
+"""
+import queue
+import threading
+
+# Events buffered per stream before a slow client starts losing them
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+class NotificationBroker:
+    """Interface for notification fan-out"""
+
+    def subscribe(self, recipient_id):
+        """Register a stream for `recipient_id` and return its subscription"""
+        raise NotImplementedError
+
+    def unsubscribe(self, recipient_id, subscription):
+        raise NotImplementedError
+
+    def publish(self, recipient_id, event):
+        """Deliver `event` (a JSON-serializable dict) to every stream of `recipient_id`"""
+        raise NotImplementedError
+
+    def has_subscribers(self, recipient_id):
+        raise NotImplementedError
+
+
+class InProcessBroker(NotificationBroker):
+    """Broker delivering events to streams served by this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, recipient_id):
+        subscription = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.setdefault(str(recipient_id), set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, recipient_id, subscription):
+        with self._lock:
+            subs = self._subscribers.get(str(recipient_id))
+            if subs:
+                subs.discard(subscription)
+                if not subs:
+                    del self._subscribers[str(recipient_id)]
+
+    def publish(self, recipient_id, event):
+        with self._lock:
+            subs = list(self._subscribers.get(str(recipient_id), ()))
+        for subscription in subs:
+            try:
+                subscription.put_nowait(event)
+            except queue.Full:
+                # Slow client: drop the event, the next one carries a fresh unread count
+                pass
+
+    def has_subscribers(self, recipient_id):
+        with self._lock:
+            return bool(self._subscribers.get(str(recipient_id)))
+
+
+_broker = InProcessBroker()
+
+
+def get_broker():
+    return _broker
+
+
+def set_broker(broker):
+    """Replace the process-wide broker (call once at start-up)"""
+    global _broker
+    _broker = broker
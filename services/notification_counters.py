@@ -0,0 +1,72 @@
+"""
+Unread notification counters.
+
+One document per recipient (`{_id: recipient_id, unread: n}`) in
+`notification_counters`, so the badge is a single lookup by key instead of a
+count over the notifications collection. The counters are adjusted with `$inc`
+wherever notifications are written or marked read, and a periodic
+reconciliation recomputes them from the notifications themselves to repair
+any drift.
+"""
+from collections import Counter
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+from mongo import mongo
+
+
+def increment_unread(recipient_ids):
+    """Add one unread notification per entry of `recipient_ids` (one bulk write)"""
+    counts = Counter(r for r in recipient_ids if r)
+    if not counts:
+        return
+    now = datetime.utcnow()
+    mongo.db.notification_counters.bulk_write([
+        UpdateOne({'_id': recipient}, {'$inc': {'unread': n}, '$set': {'updated_at': now}}, upsert=True)
+        for recipient, n in counts.items()
+    ], ordered=False)
+
+
+def decrement_unread(recipient_id, n=1):
+    """Remove `n` unread notifications, never going below zero"""
+    if n <= 0:
+        return
+    result = mongo.db.notification_counters.update_one(
+        {'_id': recipient_id, 'unread': {'$gte': n}},
+        {'$inc': {'unread': -n}, '$set': {'updated_at': datetime.utcnow()}}
+    )
+    if not result.modified_count:
+        # Counter had drifted low; clamp it and let reconciliation fix the rest
+        mongo.db.notification_counters.update_one(
+            {'_id': recipient_id},
+            {'$set': {'unread': 0, 'updated_at': datetime.utcnow()}}
+        )
+
+
+def get_unread(recipient_id):
+    counter = mongo.db.notification_counters.find_one({'_id': recipient_id}, {'unread': 1})
+    return max(counter.get('unread', 0), 0) if counter else 0
+
+
+def reconcile_unread_counters():
+    """Recompute every counter from the notifications collection"""
+    pipeline = [
+        {'$match': {'read': False, 'recipient_id': {'$exists': True, '$ne': None}}},
+        {'$group': {'_id': '$recipient_id', 'unread': {'$sum': 1}}}
+    ]
+    now = datetime.utcnow()
+    actual = {row['_id']: row['unread'] for row in mongo.db.notifications.aggregate(pipeline)}
+
+    ops = [
+        UpdateOne({'_id': recipient}, {'$set': {'unread': n, 'updated_at': now}}, upsert=True)
+        for recipient, n in actual.items()
+    ]
+    if ops:
+        mongo.db.notification_counters.bulk_write(ops, ordered=False)
+    # Recipients with nothing unread left
+    reset = mongo.db.notification_counters.update_many(
+        {'_id': {'$nin': list(actual)}, 'unread': {'$ne': 0}},
+        {'$set': {'unread': 0, 'updated_at': now}}
+    )
+    return {'recipients': len(actual), 'reset': reset.modified_count}
@@ -0,0 +1,176 @@
+"""
+Notification outbox: request threads enqueue, background workers persist.
+
+Requests put notification documents on a bounded in-process queue and return
+immediately. A small thread pool drains the queue in batches and hands each
+batch to `persist`: one callable, or a list of steps (e.g. insert_many, then
+the unread counters, then the push to streams) where each step receives the
+previous step's result.
+
+Delivery is at-least-once: every document gets its `_id` when it is enqueued,
+failed batches are retried with backoff from the step that failed (a batch
+whose insert succeeded only re-runs the steps after it), and duplicate-key
+errors on a retried insert mean "already written". Retries are capped at
+`max_attempts` so a bad batch cannot block a worker: a batch that never got
+past its first step is then retried one document at a time, and whatever
+still fails goes to the `dead_letter` callable (counted in `stats()`). When the queue is full the caller persists its own
+document synchronously instead of dropping it (backpressure), and the queue is
+drained on shutdown.
+"""
+import atexit
+import queue
+import threading
+import time
+
+from bson import ObjectId
+
+
+class NotificationOutbox:
+    def __init__(self, persist, max_queue=10000, batch_size=100, flush_interval=0.25,
+                 workers=2, enqueue_timeout=0.05, max_backoff=5.0, max_attempts=8, dead_letter=None):
+        self._steps = list(persist) if isinstance(persist, (list, tuple)) else [persist]
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._workers = workers
+        self._enqueue_timeout = enqueue_timeout
+        self._max_backoff = max_backoff
+        self._max_attempts = max_attempts
+        self._dead_letter = dead_letter
+
+        self._lock = threading.Lock()
+        self._threads = []
+        self._stopping = threading.Event()
+        self._stats = {
+            'enqueued': 0,
+            'persisted': 0,
+            'failed_attempts': 0,
+            'sync_fallbacks': 0,
+            'dead_lettered': 0,
+            'dropped': 0,
+            'high_water': 0,
+        }
+
+    # ---------------- producer side ----------------
+    def enqueue(self, doc):
+        """Queue a document for persistence and return its _id"""
+        doc.setdefault('_id', ObjectId())
+        if self._stopping.is_set():
+            # Workers are gone: write on the caller's thread
+            self._persist_with_retry([doc], attempts=3)
+            return doc['_id']
+
+        self._ensure_started()
+        try:
+            self._queue.put(doc, timeout=self._enqueue_timeout)
+        except queue.Full:
+            # Backpressure: never drop, write on the caller's thread instead
+            self._bump('sync_fallbacks')
+            self._persist_with_retry([doc], attempts=3)
+            return doc['_id']
+
+        depth = self._queue.qsize()
+        with self._lock:
+            self._stats['enqueued'] += 1
+            self._stats['high_water'] = max(self._stats['high_water'], depth)
+        return doc['_id']
+
+    def enqueue_many(self, docs):
+        return [self.enqueue(doc) for doc in docs]
+
+    def stats(self):
+        """Backpressure metrics: current depth, capacity, high-water mark and counters"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['queue_depth'] = self._queue.qsize()
+        stats['capacity'] = self._queue.maxsize
+        stats['running'] = bool(self._threads) and not self._stopping.is_set()
+        return stats
+
+    # ---------------- worker side ----------------
+    def _ensure_started(self):
+        if self._threads:
+            return
+        with self._lock:
+            if not self._threads and not self._stopping.is_set():
+                # Daemon workers so interpreter exit reaches the atexit drain below
+                for i in range(self._workers):
+                    worker = threading.Thread(target=self._run, name=f'notif-outbox-{i}', daemon=True)
+                    worker.start()
+                    self._threads.append(worker)
+                atexit.register(self.shutdown)
+
+    def _run(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=self._flush_interval)
+            except queue.Empty:
+                if self._stopping.is_set():
+                    return
+                continue
+
+            batch = [first]
+            while len(batch) < self._batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._persist_with_retry(batch)
+
+    def _persist_with_retry(self, batch, attempts=None):
+        """
+        Persist a batch, retrying with backoff up to `attempts` (default
+        max_attempts; 3 when shutting down). A retry resumes at the step that
+        failed; a batch that still fails is handed to `_give_up`.
+        """
+        attempts = attempts or self._max_attempts
+        backoff = 0.1
+        attempt = 0
+        step, result = 0, batch
+        while True:
+            attempt += 1
+            try:
+                while step < len(self._steps):
+                    result = self._steps[step](result)
+                    step += 1
+                with self._lock:
+                    self._stats['persisted'] += len(batch)
+                return True
+            except Exception as e:
+                self._bump('failed_attempts')
+                print(f"Notification outbox write failed (attempt {attempt}): {e}")
+                if attempt >= attempts or (self._stopping.is_set() and attempt >= 3):
+                    self._give_up(batch, step, e)
+                    return False
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self._max_backoff)
+
+    def _give_up(self, batch, step, error):
+        """Isolate the failing documents of a batch, then dead-letter what still fails"""
+        if step == 0 and len(batch) > 1:
+            # Nothing was written: one bad document must not sink the rest
+            for doc in batch:
+                self._persist_with_retry([doc], attempts=2)
+            return
+
+        if self._dead_letter is not None:
+            try:
+                self._dead_letter(batch, getattr(self._steps[step], '__name__', str(step)), error)
+                with self._lock:
+                    self._stats['dead_lettered'] += len(batch)
+                return
+            except Exception as e:
+                print(f"Notification outbox dead-letter write failed: {e}")
+        with self._lock:
+            self._stats['dropped'] += len(batch)
+
+    def _bump(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def shutdown(self, timeout=30):
+        """Stop the workers once everything already queued has been persisted"""
+        self._stopping.set()
+        deadline = time.monotonic() + timeout
+        for worker in self._threads:
+            worker.join(max(0, deadline - time.monotonic()))
@@ -0,0 +1,99 @@
+"""
+Notification retention.
+
+Read notifications expire through the TTL index on `read_at` (see
+services/indexes.py). Unread notifications are never deleted outright: once
+they are older than NOTIFICATION_DIGEST_AFTER_DAYS they are rolled up into one
+'digest' notification per recipient, keeping the counts per type, so the
+collection (and the indexes the feed uses) stays small.
+"""
+import os
+from datetime import datetime, timedelta
+
+from mongo import mongo
+from services.notification_counters import decrement_unread
+
+# Unread notifications older than this are compacted into a digest
+NOTIFICATION_DIGEST_AFTER_DAYS = int(os.getenv('NOTIFICATION_DIGEST_AFTER_DAYS', '60'))
+
+
+def backfill_read_at():
+    """Give read notifications written before read_at existed a timestamp so the TTL applies"""
+    result = mongo.db.notifications.update_many(
+        {'read': True, 'read_at': {'$exists': False}},
+        {'$set': {'read_at': datetime.utcnow()}}
+    )
+    return result.modified_count
+
+
+def compact_unread(now=None):
+    """
+    Replace each recipient's old unread notifications with one digest notification.
+
+    Returns:
+        dict: recipients compacted and notifications removed
+    """
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(days=NOTIFICATION_DIGEST_AFTER_DAYS)
+    compactable = {
+        'read': False,
+        'created_at': {'$lt': cutoff},
+        'type': {'$ne': 'digest'},
+        'recipient_id': {'$exists': True, '$ne': None}
+    }
+    # Only counts are grouped; ids are never collected, so a recipient with a
+    # huge backlog cannot push a group past the 16MB document limit
+    pipeline = [
+        {'$match': compactable},
+        {'$group': {
+            '_id': {'recipient_id': '$recipient_id', 'type': '$type'},
+            'count': {'$sum': 1},
+            'oldest': {'$min': '$created_at'},
+            'newest': {'$max': '$created_at'}
+        }},
+        {'$group': {
+            '_id': '$_id.recipient_id',
+            'by_type': {'$push': {'type': '$_id.type', 'count': '$count'}},
+            'count': {'$sum': '$count'},
+            'oldest': {'$min': '$oldest'},
+            'newest': {'$max': '$newest'}
+        }}
+    ]
+
+    recipients = 0
+    removed = 0
+    for group in mongo.db.notifications.aggregate(pipeline, allowDiskUse=True):
+        recipient_id = group['_id']
+        counts = {(row['type'] or 'other'): row['count'] for row in group['by_type']}
+
+        # Write the digest before deleting so a crash in between loses nothing
+        digest = mongo.db.notifications.insert_one({
+            'recipient_id': recipient_id,
+            'title': f"{group['count']} older notifications",
+            'message': ', '.join(f"{n} {t.replace('_', ' ')}" for t, n in sorted(counts.items())),
+            'type': 'digest',
+            'read': False,
+            'related_data': {'counts': counts, 'from': group['oldest'], 'to': group['newest']},
+            'created_at': now
+        })
+        deleted = mongo.db.notifications.delete_many({
+            **compactable,
+            'recipient_id': recipient_id,
+            'created_at': {'$lte': group['newest']}
+        }).deleted_count
+        if not deleted:
+            # Everything was read in the meantime
+            mongo.db.notifications.delete_one({'_id': digest.inserted_id})
+            continue
+
+        # `deleted` unread items replaced by one unread digest
+        decrement_unread(recipient_id, deleted - 1)
+        recipients += 1
+        removed += deleted
+
+    return {'recipients': recipients, 'removed': removed}
+
+
+def run_retention():
+    """Daily retention pass"""
+    return {'read_at_backfilled': backfill_read_at(), **compact_unread()}
@@ -0,0 +1,59 @@
+"""
+Keyset (seek) pagination helpers.
+
+Lists are ordered by (<field> desc, _id desc) and the next page starts after an
+opaque cursor '<field iso timestamp>|<_id>'. Unlike skip/limit, every page is an
+index range scan, so page cost does not grow with collection size.
+"""
+from datetime import datetime
+
+from bson import ObjectId
+
+
+def encode_cursor(doc, field):
+    """Cursor pointing at `doc` (empty timestamp for legacy docs without `field`)"""
+    ts = doc.get(field)
+    return f"{ts.isoformat() if ts else ''}|{doc['_id']}"
+
+
+def cursor_filter(cursor, field):
+    """Filter selecting documents after the cursor in (field desc, _id desc) order"""
+    try:
+        ts_str, id_str = cursor.split('|', 1)
+        last_id = ObjectId(id_str)
+        last_ts = datetime.fromisoformat(ts_str) if ts_str else None
+    except Exception:
+        return {}
+
+    if last_ts is None:
+        # Missing timestamps sort last, so only older _ids without a timestamp remain
+        return {field: None, '_id': {'$lt': last_id}}
+    return {'$or': [
+        {field: {'$lt': last_ts}},
+        {field: last_ts, '_id': {'$lt': last_id}},
+        {field: None}
+    ]}
+
+
+def sort_spec(field):
+    return [(field, -1), ('_id', -1)]
+
+
+def fetch_page(collection, query, field, cursor=None, page_size=25, projection=None):
+    """
+    Fetch one page of `collection`.
+
+    Returns:
+        tuple: (documents, next cursor or None)
+    """
+    if cursor:
+        after = cursor_filter(cursor, field)
+        if after:
+            query = {'$and': [query, after]}
+
+    docs = list(collection.find(query, projection).sort(sort_spec(field)).limit(page_size + 1))
+    next_cursor = None
+    if len(docs) > page_size:
+        docs = docs[:page_size]
+        next_cursor = encode_cursor(docs[-1], field)
+    return docs, next_cursor
@@ -2,6 +2,9 @@ import os
 from datetime import datetime
 from bson import ObjectId
 from mongo import mongo
+from services.recycling_rollup import record_recycled
+from services.projections import projection
+from services.valuation import PAYOUT_SPLITS, split_amount
 
 # Try importing razorpay, handle if not installed
 try:
@@ -66,7 +69,7 @@ class PaymentService:
         Distribute funds: 50% User, 10% Driver, 15% Engineer, 25% Warehouse
         Generate invoices for each.
         """
-        pickup = mongo.db.pickup_requests.find_one({'_id': ObjectId(pickup_id)})
+        pickup = mongo.db.pickup_requests.find_one({'_id': ObjectId(pickup_id)}, projection('pickup_payment'))
         if not pickup:
             return False
 
@@ -77,19 +80,21 @@ class PaymentService:
         # Find driver via cluster
         driver_id = None
         if pickup.get('cluster_id'):
-            cluster = mongo.db.collection_clusters.find_one({'_id': ObjectId(pickup['cluster_id'])})
+            cluster = mongo.db.collection_clusters.find_one({'_id': ObjectId(pickup['cluster_id'])}, {'driver_id': 1})
             if cluster:
                 driver_id = cluster.get('driver_id')
 
-        # 2. Calculate Splits
-        share_user = round(total_amount * 0.50, 2)
-        share_driver = round(total_amount * 0.10, 2)
-        share_engineer = round(total_amount * 0.15, 2)
+        # 2. Calculate Splits (the stored ones when paying the stored amount)
+        valuation = pickup.get('valuation') or {}
+        splits = valuation['splits'] if valuation.get('amount') == total_amount else split_amount(total_amount)
+        share_user = splits['user']
+        share_driver = splits['driver']
+        share_engineer = splits['engineer']
         
         # If driver/engineer missing, add their share to warehouse
-        warehouse_base = 0.25
-        if not driver_id: warehouse_base += 0.10
-        if not engineer_id: warehouse_base += 0.15
+        warehouse_base = PAYOUT_SPLITS['warehouse']
+        if not driver_id: warehouse_base += PAYOUT_SPLITS['driver']
+        if not engineer_id: warehouse_base += PAYOUT_SPLITS['engineer']
         
         share_warehouse = round(total_amount * warehouse_base, 2)
 
@@ -115,18 +120,18 @@ class PaymentService:
 
         # User Invoice
         if user_id:
-            invoices.append(create_invoice(user_id, 'user', share_user, 0.50))
+            invoices.append(create_invoice(user_id, 'user', share_user, PAYOUT_SPLITS['user']))
             # Update user wallet (optional)
             mongo.db.users.update_one({'_id': ObjectId(user_id)}, {'$inc': {'wallet_balance': share_user}})
 
         # Driver Invoice
         if driver_id:
-            invoices.append(create_invoice(driver_id, 'driver', share_driver, 0.10))
+            invoices.append(create_invoice(driver_id, 'driver', share_driver, PAYOUT_SPLITS['driver']))
             mongo.db.users.update_one({'_id': ObjectId(driver_id)}, {'$inc': {'wallet_balance': share_driver}})
 
         # Engineer Invoice
         if engineer_id:
-            invoices.append(create_invoice(engineer_id, 'engineer', share_engineer, 0.15))
+            invoices.append(create_invoice(engineer_id, 'engineer', share_engineer, PAYOUT_SPLITS['engineer']))
             mongo.db.users.update_one({'_id': ObjectId(engineer_id)}, {'$inc': {'wallet_balance': share_engineer}})
 
         # Warehouse Invoice
@@ -139,7 +144,9 @@ class PaymentService:
         # 5. Update Pickup Status
         mongo.db.pickup_requests.update_one(
             {'_id': ObjectId(pickup_id)},
-            {'$set': {'status': 'recycled', 'payment_status': 'paid', 'paid_amount': total_amount}}
+            {'$set': {'status': 'recycled', 'payment_status': 'paid', 'paid_amount': total_amount, 'updated_at': timestamp}}
         )
+        if pickup.get('status') != 'recycled':
+            record_recycled(pickup)
 
         return True
\ No newline at end of file
@@ -0,0 +1,196 @@
+"""
+Latest driver positions served from memory.
+
+Map pages poll a driver's position every few seconds; those reads are served
+from `PositionStore` without touching Mongo. Ingested positions are written
+to the store immediately and flushed to `driver_locations` in the background
+every `flush_interval` seconds (write-behind), so the collection stays the
+durable copy used by batch jobs and by a cold start.
+
+The store keeps its data in a `PositionBackend`. `InProcessBackend` is local to
+the current process, so another worker may be receiving the driver's updates:
+a local entry not refreshed within `flush_interval` is checked against Mongo
+again and the newer position wins. Multi-worker deployments can plug in a
+shared backend (e.g. Redis hashes, `shared = True`) by implementing
+`PositionBackend` and calling `set_position_store(PositionStore(backend=...))`
+at start-up.
+"""
+import atexit
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+from mongo import mongo
+from services.projections import projection
+
+# Seconds an unknown driver is remembered as unknown before Mongo is asked again
+MISS_TTL_SECONDS = 30
+# Unknown driver ids remembered at most (ids come from a public endpoint)
+MAX_MISSES = 10000
+
+
+class PositionBackend:
+    """Interface for the latest-position storage"""
+
+    # True when every worker reads and writes the same positions
+    shared = False
+
+    def get(self, driver_id):
+        """Return the position dict of `driver_id` or None"""
+        raise NotImplementedError
+
+    def set(self, driver_id, position):
+        raise NotImplementedError
+
+
+class InProcessBackend(PositionBackend):
+    """Positions kept in a dict of this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._positions = {}
+
+    def get(self, driver_id):
+        with self._lock:
+            position = self._positions.get(driver_id)
+            return dict(position) if position else None
+
+    def set(self, driver_id, position):
+        with self._lock:
+            self._positions[driver_id] = dict(position)
+
+
+class PositionStore:
+    def __init__(self, backend=None, flush_interval=5.0):
+        self._backend = backend or InProcessBackend()
+        self._flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._dirty = set()
+        self._misses = OrderedDict()
+        self._refreshed = {}  # driver_id -> when this worker last wrote or re-read it
+        self._thread = None
+        self._stopping = threading.Event()
+
+    # ---------------- reads ----------------
+    def get(self, driver_id):
+        """Latest position of a driver (memory first, Mongo only on a cold miss)"""
+        driver_id = str(driver_id)
+        position = self._backend.get(driver_id)
+        if position is not None and (self._backend.shared or self._fresh(driver_id)):
+            return position
+
+        if position is None and self._missed(driver_id):
+            return None
+
+        doc = mongo.db.driver_locations.find_one({'driver_id': driver_id}, projection('driver_position'))
+        if not doc:
+            if position is None:
+                self._remember_miss(driver_id)
+                return None
+        else:
+            doc.pop('_id', None)
+            # Positions not flushed yet are newer than Mongo's copy
+            if position is None or (doc.get('timestamp') or datetime.min) > (position.get('timestamp') or datetime.min):
+                self._backend.set(driver_id, doc)
+                position = doc
+        with self._lock:
+            self._refreshed[driver_id] = time.monotonic()
+        return position
+
+    def _fresh(self, driver_id):
+        refreshed = self._refreshed.get(driver_id)
+        return refreshed is not None and time.monotonic() - refreshed < self._flush_interval
+
+    def _missed(self, driver_id):
+        """Whether `driver_id` was looked up in vain less than MISS_TTL_SECONDS ago"""
+        with self._lock:
+            missed_at = self._misses.get(driver_id)
+            if missed_at is None:
+                return False
+            if time.monotonic() - missed_at < MISS_TTL_SECONDS:
+                return True
+            del self._misses[driver_id]
+            return False
+
+    def _remember_miss(self, driver_id):
+        """Record a miss, dropping expired and then the oldest entries beyond MAX_MISSES"""
+        now = time.monotonic()
+        with self._lock:
+            self._misses.pop(driver_id, None)
+            self._misses[driver_id] = now
+            # Insertion order is miss order, so expired entries are at the front
+            while self._misses:
+                oldest_id, missed_at = next(iter(self._misses.items()))
+                if now - missed_at < MISS_TTL_SECONDS and len(self._misses) <= MAX_MISSES:
+                    break
+                del self._misses[oldest_id]
+
+    # ---------------- writes ----------------
+    def update(self, driver_id, position):
+        """Merge `position` into the driver's latest position; persisted on the next flush"""
+        driver_id = str(driver_id)
+        merged = self._backend.get(driver_id) or {}
+        merged.update(position, driver_id=driver_id)
+        self._backend.set(driver_id, merged)
+        with self._lock:
+            self._misses.pop(driver_id, None)
+            self._refreshed[driver_id] = time.monotonic()
+            self._dirty.add(driver_id)
+        self._ensure_started()
+        return merged
+
+    def flush(self):
+        """Write every position changed since the last flush with one bulk_write"""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        ops = []
+        for driver_id in dirty:
+            position = self._backend.get(driver_id)
+            if position:
+                ops.append(UpdateOne({'driver_id': driver_id}, {'$set': position}, upsert=True))
+        if not ops:
+            return 0
+        try:
+            mongo.db.driver_locations.bulk_write(ops, ordered=False)
+        except Exception as e:
+            print(f"Position flush failed: {e}")
+            with self._lock:
+                self._dirty |= dirty
+            return 0
+        return len(ops)
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None and not self._stopping.is_set():
+                self._thread = threading.Thread(target=self._run, name='position-flush', daemon=True)
+                self._thread.start()
+                atexit.register(self.shutdown)
+
+    def _run(self):
+        while not self._stopping.wait(self._flush_interval):
+            self.flush()
+
+    def shutdown(self):
+        """Stop the flusher and write what is still pending"""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(self._flush_interval + 1)
+        self.flush()
+
+
+_store = PositionStore()
+
+
+def get_position_store():
+    return _store
+
+
+def set_position_store(store):
+    """Replace the process-wide store (call once at start-up)"""
+    global _store
+    _store = store
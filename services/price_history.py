@@ -0,0 +1,244 @@
+"""
+Effective-dated price history and as-of lookups.
+
+Every rate change is kept in `price_history` as {kind, name, effective_from,
+price_per_kg} (kind is 'category' or 'metal'): imported price files, and rates
+set by hand through `update_prices` as a version effective at once. The whole
+history is loaded once into sorted date / price arrays per (kind, name) and
+reloaded together with the price-table snapshot when its version changes. A lookup "what was the rate on
+date d" is a binary search over one series: `bisect` for a single date,
+`numpy.searchsorted` for a batch, so revaluing any number of pickups at their
+own dates needs no query per item. Dates before a series' first entry (or
+names without history) fall back to the current snapshot rate.
+
+Rows imported with a future `effective_from` become the current rate when the
+scheduled `promote_due_prices` finds their date has passed.
+
+Daily price files are CSV with a header of `name,price_per_kg` and optional
+`kind` (default category) and `date` (default: the file's date) columns.
+"""
+import csv
+import threading
+from bisect import bisect_right
+from datetime import datetime, time as dt_time
+
+from pymongo import UpdateOne
+
+from mongo import mongo
+from services.price_tables import bump_version, get_price_tables, update_prices
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+KINDS = ('category', 'metal')
+
+
+class InvalidPriceFile(ValueError):
+    pass
+
+
+def _key(kind, name):
+    # Metals are stored lower-case (see price_tables)
+    return (kind, name.lower() if kind == 'metal' else name)
+
+
+class PriceHistory:
+    """Immutable sorted price series of one price-table version"""
+
+    def __init__(self, version, docs):
+        self.version = version
+        series = {}
+        for doc in sorted(docs, key=lambda d: d['effective_from']):
+            dates, prices = series.setdefault(_key(doc['kind'], doc['name']), ([], []))
+            dates.append(doc['effective_from'])
+            prices.append(float(doc['price_per_kg']))
+        self._series = series
+        self._arrays = {}
+
+    def rate_as_of(self, kind, name, when, default=None):
+        """Rate effective at `when`, `default` when the series starts later"""
+        series = self._series.get(_key(kind, name or ''))
+        if not series:
+            return default
+        index = bisect_right(series[0], when) - 1
+        return series[1][index] if index >= 0 else default
+
+    def _array(self, key):
+        arrays = self._arrays.get(key)
+        if arrays is None:
+            dates, prices = self._series[key]
+            arrays = self._arrays[key] = (np.array(dates, dtype='datetime64[us]'), np.array(prices, dtype=float))
+        return arrays
+
+    def rates_as_of(self, kind, names, whens, defaults):
+        """
+        Vectorized `rate_as_of`.
+
+        Args:
+            names (sequence of str), whens (sequence of datetime): one per item
+            defaults (sequence of float): rate per item when there is no history
+
+        Returns:
+            list of float
+        """
+        if np is None:
+            return [self.rate_as_of(kind, n, w, d) for n, w, d in zip(names, whens, defaults)]
+
+        rates = np.array(defaults, dtype=float)
+        if not len(rates) or not self._series:
+            return rates.tolist()
+        whens = np.array(whens, dtype='datetime64[us]')
+        labels, inverse = np.unique(np.asarray(names, dtype=object).astype(str), return_inverse=True)
+        for label_index, label in enumerate(labels):
+            key = _key(kind, label)
+            if key not in self._series:
+                continue
+            rows = np.nonzero(inverse == label_index)[0]
+            dates, prices = self._array(key)
+            positions = np.searchsorted(dates, whens[rows], side='right') - 1
+            known = positions >= 0
+            rates[rows[known]] = prices[positions[known]]
+        return rates.tolist()
+
+
+_lock = threading.Lock()
+_history = None
+
+
+def get_price_history():
+    """The loaded history, reloaded with the price tables"""
+    global _history
+    version = get_price_tables().version
+    if _history is not None and _history.version == version:
+        return _history
+    if mongo.db is None:
+        return PriceHistory(version, [])
+    with _lock:
+        if _history is None or _history.version != version:
+            _history = PriceHistory(version, mongo.db.price_history.find(
+                {}, {'_id': 0, 'kind': 1, 'name': 1, 'effective_from': 1, 'price_per_kg': 1}
+            ))
+    return _history
+
+
+def parse_price_file(lines, file_date=None):
+    """
+    Rows of a daily price file.
+
+    Args:
+        lines: iterable of CSV lines (an open file)
+        file_date (datetime): effective date of rows without a `date` column
+
+    Returns:
+        list of dict: kind, name, effective_from, price_per_kg
+    """
+    rows = []
+    for number, record in enumerate(csv.DictReader(lines), start=2):
+        try:
+            kind = (record.get('kind') or 'category').strip().lower()
+            name = record['name'].strip()
+            price = float(record['price_per_kg'])
+            if record.get('date'):
+                effective_from = datetime.fromisoformat(record['date'].strip())
+            elif file_date is not None:
+                effective_from = file_date
+            else:
+                raise ValueError('no date')
+        except KeyError as e:
+            raise InvalidPriceFile(f'line {number}: missing column {e}')
+        except (TypeError, ValueError, AttributeError) as e:
+            raise InvalidPriceFile(f'line {number}: {e}')
+        if kind not in KINDS or not name or price < 0:
+            raise InvalidPriceFile(f'line {number}: invalid row')
+        if not isinstance(effective_from, datetime):
+            effective_from = datetime.combine(effective_from, dt_time.min)
+        rows.append({'kind': kind, 'name': _key(kind, name)[1],
+                     'effective_from': effective_from, 'price_per_kg': price})
+    return rows
+
+
+def import_prices(rows, db=None):
+    """
+    Store price rows as history versions (re-importing a file is idempotent).
+
+    Rows that are the newest version of their series and already effective
+    also become the current rate. One price-table version is published for the
+    whole import.
+
+    Returns:
+        dict: imported (rows written) and current (rates made current)
+    """
+    db = db if db is not None else mongo.db
+    if not rows:
+        return {'imported': 0, 'current': 0}
+
+    now = datetime.utcnow()
+    # Rows dated in the future keep imported_at < effective_from until promote_due_prices
+    db.price_history.bulk_write([
+        UpdateOne(
+            {'kind': r['kind'], 'name': r['name'], 'effective_from': r['effective_from']},
+            {'$set': {'price_per_kg': r['price_per_kg'], 'imported_at': now}},
+            upsert=True
+        )
+        for r in rows
+    ], ordered=False)
+
+    imported = {(r['kind'], r['name']) for r in rows}
+    current = {key: price for key, price in _newest_effective(db, imported, now).items() if key in imported}
+    if not _make_current(current, db):
+        bump_version(db)
+    return {'imported': len(rows), 'current': len(current)}
+
+
+def _newest_effective(db, series, now):
+    """Newest rate effective at `now` of each (kind, name) in `series`, history included"""
+    newest = {}
+    for doc in db.price_history.aggregate([
+        {'$match': {'kind': {'$in': list(KINDS)},
+                    'name': {'$in': list({name for kind, name in series})},
+                    'effective_from': {'$lte': now}}},
+        {'$sort': {'effective_from': 1}},
+        {'$group': {'_id': {'kind': '$kind', 'name': '$name'}, 'price_per_kg': {'$last': '$price_per_kg'}}},
+    ]):
+        newest[(doc['_id']['kind'], doc['_id']['name'])] = doc['price_per_kg']
+    return newest
+
+
+def _make_current(rates, db):
+    """Write {(kind, name): rate} as current rates; False when there is nothing to write"""
+    categories = {name: price for (kind, name), price in rates.items() if kind == 'category'}
+    metals = {name: price for (kind, name), price in rates.items() if kind == 'metal'}
+    if not categories and not metals:
+        return False
+    update_prices(categories, metals, db=db, record_history=False)
+    return True
+
+
+def promote_due_prices(db=None, now=None):
+    """
+    Make imported rows whose future `effective_from` has now passed the current
+    rate (run periodically). Each row is promoted once, so a rate set by hand
+    afterwards is not overwritten.
+
+    Returns:
+        int: rates made current
+    """
+    db = db if db is not None else mongo.db
+    now = now or datetime.utcnow()
+    due = {'effective_from': {'$lte': now},
+           'promoted_at': {'$exists': False},
+           # Rows effective when imported were made current by import_prices
+           '$expr': {'$gt': ['$effective_from', '$imported_at']}}
+    ids, series = [], set()
+    for doc in db.price_history.find(due, {'kind': 1, 'name': 1}):
+        ids.append(doc['_id'])
+        series.add((doc['kind'], doc['name']))
+    if not ids:
+        return 0
+
+    current = {key: price for key, price in _newest_effective(db, series, now).items() if key in series}
+    _make_current(current, db)
+    db.price_history.update_many({'_id': {'$in': ids}}, {'$set': {'promoted_at': now}})
+    return len(current)
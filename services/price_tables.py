@@ -0,0 +1,194 @@
+"""
+In-process snapshot of the price tables.
+
+`category_prices` and `metal_prices` are read once into an immutable
+`PriceTables` snapshot that every valuation path shares (inspection pricing,
+hub inventory, payment fallbacks). Writers go through `update_prices`, which
+bumps a version counter in `price_tables`; readers compare that counter at
+most every VERSION_CHECK_SECONDS and reload the whole snapshot when it moved,
+so a valuation never mixes rates of two versions and never queries a price
+per item.
+"""
+import threading
+import time
+from datetime import datetime
+from types import MappingProxyType
+
+from pymongo import ReturnDocument, UpdateOne
+
+from mongo import mongo
+
+VERSION_CHECK_SECONDS = 30
+VERSION_DOC_ID = 'current'
+
+# Every pickup weight (approx_weight, ewaste_weight, final_weight and item
+# weights) is stored in grams, while every rate here is INR per kg: weights go
+# through `weight_kg` before they are multiplied by a rate.
+GRAMS_PER_KG = 1000
+
+# Used until the collections say otherwise (INR per kg)
+DEFAULT_CATEGORY_RATES = {
+    "Laptop": 300,
+    "Desktop PC": 250,
+    "Mobile Devices": 500,
+    "Printer": 100,
+    "Office PCs": 250,
+    "Server Racks": 400,
+    "UPS Batteries": 150,
+    "Washing Machine": 50,
+    "Fridge": 60,
+    "AC": 70
+}
+DEFAULT_CATEGORY_RATE = 100
+# Payment fallback when no engineer price is set: 50 INR/kg
+DEFAULT_FALLBACK_RATE = 50
+
+
+def weight_kg(grams):
+    """A stored weight (grams, possibly missing or a string) in kg"""
+    try:
+        return max(float(grams or 0), 0.0) / GRAMS_PER_KG
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class PriceTables:
+    """Immutable rates of one price-table version (INR per kg)"""
+
+    def __init__(self, version, category_rates, metal_rates):
+        self.version = version
+        self.category_rates = MappingProxyType(dict(category_rates))
+        self.metal_rates = MappingProxyType(dict(metal_rates))
+        self.fallback_rate = self.category_rates.get('default', DEFAULT_FALLBACK_RATE)
+
+    def category_rate(self, category, default=DEFAULT_CATEGORY_RATE):
+        return self.category_rates.get(category, default)
+
+    def metal_rate(self, metal):
+        return self.metal_rates.get((metal or '').lower())
+
+    def value(self, category, weight_kg, metal=None):
+        """Stock value of a weighed lot: metal rate when known, else category rate"""
+        rate = self.metal_rate(metal) if metal else None
+        if rate is None:
+            rate = self.category_rate(category, 0)
+        return weight_kg * rate
+
+
+def _metal_rates(docs):
+    """
+    Rates per metal from both document shapes in use: one document per metal
+    ({metal, price_per_kg}) and market snapshots ({gold_inr_per_gram, ...}),
+    newest snapshot winning.
+    """
+    rates = {}
+    for doc in sorted(docs, key=lambda d: d.get('timestamp') or datetime.min):
+        if doc.get('metal'):
+            rates[doc['metal'].lower()] = float(doc.get('price_per_kg', 0))
+            continue
+        for key, price in doc.items():
+            if key.endswith('_inr_per_kg'):
+                rates[key[:-len('_inr_per_kg')]] = float(price)
+            elif key.endswith('_inr_per_gram'):
+                rates[key[:-len('_inr_per_gram')]] = float(price) * 1000
+    return rates
+
+
+def _current_version():
+    doc = mongo.db.price_tables.find_one({'_id': VERSION_DOC_ID}, {'version': 1})
+    return doc.get('version', 0) if doc else 0
+
+
+def load_price_tables():
+    version = _current_version()
+    category_rates = dict(DEFAULT_CATEGORY_RATES)
+    for doc in mongo.db.category_prices.find({}, {'_id': 0}):
+        rate = doc.get('price_per_kg', doc.get('base_price_per_kg'))
+        if doc.get('category') and rate is not None:
+            category_rates[doc['category']] = float(rate)
+    metal_rates = _metal_rates(mongo.db.metal_prices.find({}, {'_id': 0}))
+    return PriceTables(version, category_rates, metal_rates)
+
+
+_lock = threading.Lock()
+_snapshot = None
+_checked_at = 0.0
+
+
+def get_price_tables():
+    """The current snapshot, reloaded when the stored version has changed"""
+    global _snapshot, _checked_at
+    if mongo.db is None:
+        # Outside the app (scripts, benchmarks): built-in rates only
+        return _snapshot or PriceTables(0, DEFAULT_CATEGORY_RATES, {})
+
+    now = time.monotonic()
+    if _snapshot is not None and now - _checked_at < VERSION_CHECK_SECONDS:
+        return _snapshot
+    with _lock:
+        if _snapshot is None or _current_version() != _snapshot.version:
+            _snapshot = load_price_tables()
+        _checked_at = now
+    return _snapshot
+
+
+def bump_version(db=None):
+    """Publish a new price-table version (after writing price collections directly)"""
+    global _checked_at
+    db = db if db is not None else mongo.db
+    doc = db.price_tables.find_one_and_update(
+        {'_id': VERSION_DOC_ID},
+        {'$inc': {'version': 1}, '$set': {'updated_at': datetime.utcnow()}},
+        upsert=True, return_document=ReturnDocument.AFTER
+    )
+    # This worker sees its own write immediately
+    _checked_at = 0.0
+    return doc['version']
+
+
+def update_prices(categories=None, metals=None, db=None, record_history=True):
+    """
+    Write new rates (INR per kg) and publish them as one new version.
+
+    Args:
+        categories (dict): category -> rate
+        metals (dict): metal -> rate
+        db: database to write to (scripts); the app's by default
+        record_history (bool): also store the rates as price_history versions
+            effective now (False when they come from price_history already)
+
+    Returns:
+        int: the new version
+    """
+    db = db if db is not None else mongo.db
+    now = datetime.utcnow()
+    if record_history:
+        # As-of lookups and later imports read price_history, so a hand-set rate is a version too
+        rows = [('category', category, rate) for category, rate in (categories or {}).items()]
+        rows += [('metal', metal.lower(), rate) for metal, rate in (metals or {}).items()]
+        if rows:
+            db.price_history.bulk_write([
+                UpdateOne(
+                    {'kind': kind, 'name': name, 'effective_from': now},
+                    # imported_at == effective_from: already current, nothing left to promote
+                    {'$set': {'price_per_kg': float(rate), 'imported_at': now, 'source': 'manual'}},
+                    upsert=True
+                )
+                for kind, name, rate in rows
+            ], ordered=False)
+    if categories:
+        db.category_prices.bulk_write([
+            UpdateOne({'category': category},
+                      {'$set': {'price_per_kg': float(rate), 'updated_at': now},
+                       '$unset': {'base_price_per_kg': ''}},
+                      upsert=True)
+            for category, rate in categories.items()
+        ], ordered=False)
+    if metals:
+        db.metal_prices.bulk_write([
+            UpdateOne({'metal': metal.lower()},
+                      {'$set': {'price_per_kg': float(rate), 'timestamp': now}},
+                      upsert=True)
+            for metal, rate in metals.items()
+        ], ordered=False)
+    return bump_version(db)
@@ -0,0 +1,194 @@
+"""
+E-waste valuation.
+
+`calculate_final_price` prices one item; `price_batch` prices any number of
+items in one vectorized pass (the same formula over NumPy arrays), and
+`price_pickups` flattens the items of many pickups into one batch and sums
+them back per pickup, so a whole pickup or a hub's stock costs one call.
+Base rates come from the shared price-table snapshot, or from the price
+history when items are valued as of a past date.
+"""
+from datetime import datetime
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from services.price_history import get_price_history
+from services.price_tables import DEFAULT_CATEGORY_RATE, get_price_tables, weight_kg
+
+# Condition Multipliers
+CONDITION_FACTORS = {
+    "working": 1.5,
+    "repairable": 1.0,
+    "scrap": 0.5
+}
+DEFAULT_CONDITION_FACTOR = 0.5
+
+# Depreciation: 10% per year, max 80%
+DEPRECIATION_PER_YEAR = 0.10
+MAX_DEPRECIATION = 0.80
+
+
+def calculate_final_price(category, weight, condition, age_years, tables=None, as_of=None):
+    """
+    Calculates the estimated value of e-waste.
+
+    Args:
+        category (str): E-Waste type (Laptop, PC, etc.)
+        weight (float): Weight in kg (converted from grams if needed)
+        condition (str): working, repairable, scrap
+        age_years (int): Age of the device
+        tables (PriceTables): rates to use, the current snapshot by default
+        as_of (datetime): value at the rate effective on this date
+    """
+    tables = tables or get_price_tables()
+    base_rate = tables.category_rate(category)
+    if as_of is not None:
+        base_rate = get_price_history().rate_as_of("category", category, as_of, base_rate)
+    condition_factor = CONDITION_FACTORS.get(condition, DEFAULT_CONDITION_FACTOR)
+
+    depreciation = min(age_years * DEPRECIATION_PER_YEAR, MAX_DEPRECIATION)
+    age_factor = 1 - depreciation
+
+    # Formula: Rate * Weight * Condition * AgeFactor
+    estimated_value = base_rate * weight * condition_factor * age_factor
+
+    return {
+        "base_rate": base_rate,
+        "condition_factor": condition_factor,
+        "age_factor": round(age_factor, 2),
+        "estimated_value": round(estimated_value, 2),
+        "currency": "INR"
+    }
+
+
+def _lookup(keys, table, default):
+    """Map an array of labels through a dict, one dict lookup per distinct label"""
+    labels, inverse = np.unique(np.asarray(keys, dtype=object).astype(str), return_inverse=True)
+    return np.array([table.get(label, default) for label in labels], dtype=float)[inverse]
+
+
+def price_batch(categories, weights, conditions, ages, tables=None, as_of=None):
+    """
+    Price many items at once.
+
+    Args:
+        categories, conditions (sequence of str): one entry per item
+        weights (sequence of float): weights in kg
+        ages (sequence of int): ages in years
+        tables (PriceTables): rates to use, the current snapshot by default
+        as_of (sequence of datetime): per-item valuation dates (None = current rates)
+
+    Returns:
+        dict: items (same fields as calculate_final_price, minus currency),
+              total_value and currency
+    """
+    tables = tables or get_price_tables()
+    if np is None:
+        dates = as_of if as_of is not None else [None] * len(categories)
+        items = [calculate_final_price(c, w, k, a, tables, d)
+                 for c, w, k, a, d in zip(categories, weights, conditions, ages, dates)]
+        for item in items:
+            item.pop("currency")
+        return {"items": items, "total_value": round(sum(i["estimated_value"] for i in items), 2), "currency": "INR"}
+
+    if not len(categories):
+        return {"items": [], "total_value": 0, "currency": "INR"}
+
+    base_rates = _lookup(categories, tables.category_rates, DEFAULT_CATEGORY_RATE)
+    if as_of is not None:
+        base_rates = np.array(get_price_history().rates_as_of("category", categories, as_of, base_rates))
+    condition_factors = _lookup(conditions, CONDITION_FACTORS, DEFAULT_CONDITION_FACTOR)
+    age_factors = 1 - np.minimum(np.asarray(ages, dtype=float) * DEPRECIATION_PER_YEAR, MAX_DEPRECIATION)
+    values = np.round(base_rates * np.asarray(weights, dtype=float) * condition_factors * age_factors, 2)
+
+    items = [
+        {"base_rate": rate, "condition_factor": factor, "age_factor": age, "estimated_value": value}
+        for rate, factor, age, value in zip(
+            base_rates.tolist(), condition_factors.tolist(), np.round(age_factors, 2).tolist(), values.tolist()
+        )
+    ]
+    return {"items": items, "total_value": round(float(values.sum()), 2), "currency": "INR"}
+
+
+def _pickup_items(pickup, condition, age_years):
+    """
+    (category, weight_kg, condition, age) rows of one pickup.
+
+    A weighed pickup (`final_weight`) spreads its measured weight over the
+    items in proportion to their estimated weights.
+    """
+    items = [i for i in pickup.get("items") or [] if i.get("type")]
+    final_weight = pickup.get("final_weight")
+    if not items:
+        grams = final_weight if final_weight is not None else (pickup.get("approx_weight") or pickup.get("ewaste_weight"))
+        return [(pickup.get("ewaste_type"), weight_kg(grams), condition, age_years)]
+
+    estimates = [weight_kg(i.get("weight")) for i in items]
+    total = sum(estimates)
+    if final_weight is not None and total:
+        weights = [w / total * weight_kg(final_weight) for w in estimates]
+    else:
+        weights = estimates
+    return [
+        (i["type"], w, i.get("condition") or condition, i.get("age_years", age_years))
+        for i, w in zip(items, weights)
+    ]
+
+
+def price_pickups(pickups, condition="scrap", age_years=0, tables=None, as_of_field=None):
+    """
+    Value whole pickups in one batch.
+
+    Items without their own condition / age use the given defaults. With
+    `as_of_field` (e.g. 'inspected_at') each pickup is valued at the rates
+    effective on that date; pickups without it use current rates.
+
+    Returns:
+        list of float: estimated value per pickup, in input order
+    """
+    rows, owners, dates = [], [], []
+    now = datetime.utcnow()
+    for index, pickup in enumerate(pickups):
+        for row in _pickup_items(pickup, condition, age_years):
+            rows.append(row)
+            owners.append(index)
+            if as_of_field:
+                dates.append(pickup.get(as_of_field) or now)
+    if not rows:
+        return [0.0] * len(pickups)
+
+    categories, weights, conditions, ages = zip(*rows)
+    priced = price_batch(categories, weights, conditions, ages, tables, dates if as_of_field else None)
+    values = [item["estimated_value"] for item in priced["items"]]
+    if np is None:
+        totals = [0.0] * len(pickups)
+        for owner, value in zip(owners, values):
+            totals[owner] += value
+        return [round(t, 2) for t in totals]
+    return np.round(np.bincount(owners, weights=values, minlength=len(pickups)), 2).tolist()
+
+
+def price_stock(pickups, tables=None):
+    """
+    Stock value of weighed pickups in one vectorized pass: final weight in kg
+    times the metal rate when the pickup has a known metal type, else the
+    category rate (0 for unknown categories).
+
+    Returns:
+        list of float: value per pickup, in input order
+    """
+    tables = tables or get_price_tables()
+    if np is None:
+        return [round(tables.value(p.get("ewaste_type"), weight_kg(p.get("final_weight")), p.get("metal_type")), 2)
+                for p in pickups]
+    if not pickups:
+        return []
+
+    weights = np.array([weight_kg(p.get("final_weight")) for p in pickups])
+    category_rates = _lookup([p.get("ewaste_type") for p in pickups], tables.category_rates, 0)
+    metal_rates = _lookup([(p.get("metal_type") or "").lower() for p in pickups], tables.metal_rates, np.nan)
+    rates = np.where(np.isnan(metal_rates), category_rates, metal_rates)
+    return np.round(weights * rates, 2).tolist()
@@ -0,0 +1,106 @@
+"""
+Named field projections for every Mongo read in the blueprints.
+
+Pickup documents carry item lists, free-text descriptions and image arrays, and
+user documents carry password hashes and wallet balances, but each view only
+renders a handful of fields. Routes ask for a projection by view name instead of
+fetching whole documents. `measure_projection_savings.py` reports the bytes
+transferred per page with and without these projections.
+"""
+
+
+def _fields(*names):
+    return {name: 1 for name in names}
+
+
+PROJECTIONS = {
+    # ---- pickup_requests ----
+    # Pickup card on the driver / user dashboards
+    'pickup_card': _fields('user_name', 'ewaste_type', 'ewaste_weight', 'approx_weight', 'area',
+                           'address', 'status', 'created_at', 'engineer_price'),
+    # Pickup card on the engineer dashboard: the first item (thumbnail) and the item
+    # count instead of every item image; a $project stage, as it computes fields
+    'engineer_pickup_card': dict(
+        _fields('user_name', 'ewaste_type', 'ewaste_weight', 'approx_weight', 'area', 'address', 'status'),
+        items={'$slice': [{'$ifNull': ['$items', []]}, 1]},
+        item_count={'$size': {'$ifNull': ['$items', []]}},
+    ),
+    # User's own request list (shows the per-item breakdown)
+    'pickup_request_row': _fields('ewaste_type', 'approx_weight', 'area', 'status', 'created_at',
+                                  'engineer_price', 'items'),
+    # Stop on a route map
+    'route_waypoint': _fields('latitude', 'longitude', 'address', 'phone_number'),
+    # Inputs of the clustering engines and centroid calculations
+    'pickup_geo': _fields('latitude', 'longitude', 'approx_weight', 'ewaste_weight'),
+    # ETA / stop tracking of an active cluster
+    'pickup_stop': _fields('latitude', 'longitude', 'status', 'stop_status', 'user_id'),
+    # Member line of a cluster on the warehouse dashboard
+    'cluster_member': _fields('user_name', 'address', 'ewaste_type'),
+    # Warehouse / hub inventory row
+    'inventory_row': _fields('user_name', 'ewaste_type', 'status', 'final_weight', 'approx_weight',
+                             'ewaste_weight', 'final_quality', 'collected_at', 'items', 'metal_type',
+                             'address', 'area', 'updated_at', 'estimated_value', 'valued_price_version',
+                             'valued_revision'),
+    # Inputs of the stock revaluation job
+    'pickup_stock_value': _fields('cluster_id', 'ewaste_type', 'metal_type', 'final_weight', 'approx_weight',
+                                  'ewaste_weight', 'estimated_value', 'valued_price_version',
+                                  'valued_revision'),
+    # Inputs of batch pricing
+    'pickup_valuation': _fields('ewaste_type', 'items', 'final_weight', 'approx_weight', 'ewaste_weight',
+                                'inspected_at'),
+    # Recycler queue and history
+    'recycler_item': _fields('ewaste_type', 'approx_weight', 'area', 'updated_at'),
+    # Engineer inspection page
+    'pickup_inspection': _fields('user_name', 'address', 'area', 'ewaste_type', 'approx_weight',
+                                 'final_weight', 'items', 'inspection_status', 'rejection_reason'),
+    # Payment amount, split and invoice description
+    'pickup_payment': _fields('user_id', 'user_name', 'engineer_id', 'cluster_id', 'ewaste_type', 'status',
+                              'engineer_price', 'final_weight', 'approx_weight', 'ewaste_weight', 'valuation'),
+    # Inputs of the stored payable amount
+    'pickup_valuation_inputs': _fields('engineer_price', 'final_weight', 'approx_weight'),
+    # Pending-earnings row on the invoices page
+    'pickup_pending_earning': _fields('ewaste_type', 'area', 'status', 'created_at', 'updated_at',
+                                      'engineer_price', 'final_weight', 'approx_weight', 'valuation'),
+    # Recipient of a pickup notification
+    'pickup_owner': _fields('user_id'),
+    # Track-order lookup
+    'pickup_cluster_ref': _fields('cluster_id'),
+
+    # ---- users ----
+    # Staff roster entry (assignment pickers, workforce panels)
+    'roster_entry': _fields('name', 'role', 'available_tomorrow'),
+    # Display name only
+    'user_name': _fields('name'),
+    # Admin user directory
+    'user_directory': _fields('name', 'email', 'role', 'mobile'),
+    # Login check (the only read that needs the password hash)
+    'user_login': _fields('email', 'password', 'role', 'name'),
+    # Engineer availability settings
+    'user_availability': _fields('available_tomorrow'),
+
+    # ---- collection_clusters ----
+    # Cluster card on dashboards (members are needed to look up pickups)
+    'cluster_card': _fields('status', 'engineer_id', 'driver_id', 'doctor_id', 'destination', 'anchor_location',
+                            'users', 'user_count', 'total_weight', 'scheduled_for', 'estimated_duration_minutes',
+                            'route_distance_km', 'route_summary', 'created_at'),
+    # Route map / assignment: anchor plus member ids
+    'cluster_route': _fields('anchor_location', 'users', 'driver_id', 'scheduled_for', 'route_distance_km',
+                             'estimated_duration_minutes'),
+    # Hub inventory lookup
+    'cluster_ref': _fields('_id'),
+
+    # ---- invoices ----
+    'invoice_row': _fields('invoice_number', 'created_at', 'description', 'percentage', 'amount'),
+
+    # ---- notifications ----
+    # Every field is in the (recipient_id, created_at, ...) index, so the feed query is covered
+    'notification_feed': _fields('title', 'message', 'type', 'read', 'created_at'),
+
+    # ---- driver_locations ----
+    'driver_position': _fields('driver_id', 'lat', 'lng', 'stopNumber', 'timestamp', 'speed', 'cluster_id'),
+}
+
+
+def projection(name):
+    """Return a copy of the named projection (raises KeyError for unknown views)"""
+    return dict(PROJECTIONS[name])
@@ -0,0 +1,83 @@
+"""
+Running totals of recycled pickups.
+
+The recycler dashboard shows these totals instead of listing the ever-growing
+recycled history. The single rollup document is maintained with `$inc` when a
+pickup is recycled and can be rebuilt from scratch with one aggregation.
+Increments only apply to a rollup that was built from the full history
+(`rebuilt_at` set); otherwise the rollup is rebuilt instead, so the first
+recycled pickup never creates a document that counts only itself.
+"""
+from datetime import datetime
+
+from mongo import mongo
+
+ROLLUP_ID = 'recycled'
+
+
+def _weight(pickup):
+    weight = pickup.get('final_weight') or pickup.get('approx_weight') or pickup.get('ewaste_weight') or 0
+    try:
+        return float(weight)
+    except (ValueError, TypeError):
+        return 0
+
+
+def _type_key(ewaste_type):
+    # Field names cannot contain '.' or start with '$'
+    return (ewaste_type or 'Unknown').replace('.', '_').lstrip('$') or 'Unknown'
+
+
+def record_recycled(pickup):
+    """Add a pickup that just moved to 'recycled' (already stored as such) to the rollup"""
+    weight = _weight(pickup)
+    result = mongo.db.recycling_rollup.update_one(
+        {'_id': ROLLUP_ID, 'rebuilt_at': {'$exists': True}},
+        {
+            '$inc': {
+                'count': 1,
+                'total_weight': weight,
+                f"by_type.{_type_key(pickup.get('ewaste_type'))}": 1
+            },
+            '$set': {'updated_at': datetime.utcnow()}
+        }
+    )
+    if not result.matched_count:
+        # No complete rollup yet: build it, this pickup included
+        rebuild_rollup()
+
+
+def rebuild_rollup():
+    """Recompute the rollup from all recycled pickups"""
+    pipeline = [
+        {'$match': {'status': 'recycled'}},
+        {'$group': {
+            '_id': '$ewaste_type',
+            'count': {'$sum': 1},
+            'weight': {'$sum': {'$ifNull': ['$final_weight', {'$ifNull': ['$approx_weight', '$ewaste_weight']}]}}
+        }}
+    ]
+    by_type = {}
+    count = 0
+    total_weight = 0
+    for row in mongo.db.pickup_requests.aggregate(pipeline):
+        key = _type_key(row['_id'])
+        by_type[key] = by_type.get(key, 0) + row['count']
+        count += row['count']
+        total_weight += row['weight'] or 0
+
+    rollup = {
+        '_id': ROLLUP_ID,
+        'count': count,
+        'total_weight': total_weight,
+        'by_type': by_type,
+        'updated_at': datetime.utcnow(),
+        'rebuilt_at': datetime.utcnow()
+    }
+    mongo.db.recycling_rollup.replace_one({'_id': ROLLUP_ID}, rollup, upsert=True)
+    return rollup
+
+
+def get_rollup():
+    """Return the rollup, building it on first use (or if it was never built from the full history)"""
+    return mongo.db.recycling_rollup.find_one({'_id': ROLLUP_ID, 'rebuilt_at': {'$exists': True}}) or rebuild_rollup()
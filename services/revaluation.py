@@ -0,0 +1,136 @@
+"""
+Revaluation of warehouse stock.
+
+Hub stock is every pickup of a cluster delivered to a hub. The job streams
+those pickups in batches, values each batch with the vectorized
+`price_stock`, writes changed `estimated_value`s back with one bulk_write per
+batch and stores one valuation snapshot per hub in `hub_valuations`, so the
+inventory pages read stored figures instead of pricing on every request.
+"""
+import os
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from mongo import mongo
+from services.price_tables import GRAMS_PER_KG, get_price_tables, weight_kg
+from services.pricing_engine import price_stock
+from services.projections import projection
+
+REVALUATION_BATCH_SIZE = int(os.getenv('REVALUATION_BATCH_SIZE', '1000'))
+# A full revaluation runs at least this often even when prices did not change
+REVALUATION_MAX_AGE_HOURS = 24
+# Bumped when the way stock is valued changes, so stored values of an older
+# revision are recomputed even if prices did not move (2: final_weight in grams)
+STOCK_VALUE_REVISION = 2
+DELIVERED_STATUSES = ['delivered', 'completed']
+
+
+def _batches(cursor, size):
+    batch = []
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def stock_weight(pickup):
+    """Weight in grams counted in hub totals: measured weight, else the estimate"""
+    grams = pickup.get('final_weight')
+    if grams is None:
+        grams = pickup.get('approx_weight', pickup.get('ewaste_weight'))
+    return weight_kg(grams) * GRAMS_PER_KG
+
+
+def is_current(pickup, tables):
+    """True when the pickup's stored estimated_value was computed with these prices"""
+    return ('estimated_value' in pickup
+            and pickup.get('valued_price_version') == tables.version
+            and pickup.get('valued_revision') == STOCK_VALUE_REVISION)
+
+
+def revalue_stock(batch_size=REVALUATION_BATCH_SIZE):
+    """
+    Re-price all hub stock at the current rates.
+
+    Returns:
+        dict: pickups valued, updated (values that changed), hubs snapshotted
+              and the price version used
+    """
+    tables = get_price_tables()
+    now = datetime.utcnow()
+    hubs = {
+        str(c['_id']): c['destination']
+        for c in mongo.db.collection_clusters.find(
+            {'status': {'$in': DELIVERED_STATUSES}, 'destination': {'$nin': [None, '']}}, {'destination': 1}
+        )
+    }
+    totals = {}
+    valued = updated = 0
+    # Pickups reference their cluster by string or by ObjectId (analyze_routes)
+    cluster_ids = list(hubs) + [ObjectId(i) for i in hubs]
+    cursor = mongo.db.pickup_requests.find(
+        {'cluster_id': {'$in': cluster_ids}}, projection('pickup_stock_value')
+    ).batch_size(batch_size)
+
+    for batch in _batches(cursor, batch_size):
+        values = price_stock(batch, tables)
+        ops = []
+        for pickup, value in zip(batch, values):
+            hub = totals.setdefault(hubs[str(pickup['cluster_id'])], {
+                'total_pickups': 0, 'total_weight': 0, 'total_estimated_value': 0, 'category_breakdown': {}
+            })
+            category = pickup.get('ewaste_type', 'Unknown')
+            hub['total_pickups'] += 1
+            hub['total_weight'] += stock_weight(pickup)
+            hub['total_estimated_value'] += value
+            hub['category_breakdown'][category] = hub['category_breakdown'].get(category, 0) + 1
+            if pickup.get('estimated_value') != value or not is_current(pickup, tables):
+                ops.append(UpdateOne({'_id': pickup['_id']}, {'$set': {
+                    'estimated_value': value, 'valued_at': now, 'valued_price_version': tables.version,
+                    'valued_revision': STOCK_VALUE_REVISION
+                }}))
+        if ops:
+            mongo.db.pickup_requests.bulk_write(ops, ordered=False)
+        valued += len(batch)
+        updated += len(ops)
+
+    if totals:
+        mongo.db.hub_valuations.insert_many([
+            dict(
+                hub=hub,
+                valued_at=now,
+                price_version=tables.version,
+                revision=STOCK_VALUE_REVISION,
+                total_pickups=t['total_pickups'],
+                total_weight=round(t['total_weight'], 2),
+                total_estimated_value=round(t['total_estimated_value'], 2),
+                # Category names may contain dots, which are not valid field names
+                category_breakdown=[{'category': k, 'count': v} for k, v in t['category_breakdown'].items()],
+            )
+            for hub, t in totals.items()
+        ])
+    return {'pickups': valued, 'updated': updated, 'hubs': len(totals), 'price_version': tables.version}
+
+
+def revaluation_due(now=None):
+    """
+    True when prices or the valuation revision changed since the last snapshot,
+    or it is older than REVALUATION_MAX_AGE_HOURS
+    """
+    now = now or datetime.utcnow()
+    last = mongo.db.hub_valuations.find_one({}, {'valued_at': 1, 'price_version': 1, 'revision': 1},
+                                            sort=[('valued_at', -1)])
+    if not last:
+        return True
+    return (last.get('price_version') != get_price_tables().version
+            or last.get('revision') != STOCK_VALUE_REVISION
+            or now - last['valued_at'] > timedelta(hours=REVALUATION_MAX_AGE_HOURS))
+
+
+def latest_hub_valuation(hub):
+    return mongo.db.hub_valuations.find_one({'hub': hub}, {'_id': 0}, sort=[('valued_at', -1)])
@@ -0,0 +1,45 @@
+"""
+Short-lived cache of driver identity and engineer rosters.
+
+Drivers post route updates every few minutes; the driver's name and the
+engineers assigned to them hardly ever change, so they are read once and
+kept for ROSTER_TTL_SECONDS instead of being queried on every post.
+"""
+import threading
+import time
+
+from bson import ObjectId
+
+from mongo import mongo
+from services.projections import projection
+
+ROSTER_TTL_SECONDS = 300
+
+_lock = threading.Lock()
+_cache = {}
+
+
+def _cached(key, load):
+    entry = _cache.get(key)
+    if entry and time.monotonic() - entry[0] < ROSTER_TTL_SECONDS:
+        return entry[1]
+    value = load()
+    with _lock:
+        _cache[key] = (time.monotonic(), value)
+    return value
+
+
+def driver_name(driver_id):
+    def load():
+        driver = mongo.db.users.find_one({'_id': ObjectId(driver_id)}, projection('user_name'))
+        return driver.get('name', 'Unknown') if driver else 'Unknown'
+    return _cached(('name', driver_id), load)
+
+
+def assigned_engineer_ids(driver_id):
+    """Ids (as strings) of the engineers the driver is assigned to"""
+    def load():
+        return [str(e['_id']) for e in mongo.db.users.find(
+            {'role': 'engineer', 'assigned_drivers': driver_id}, {'_id': 1}
+        )]
+    return _cached(('engineers', driver_id), load)
@@ -0,0 +1,66 @@
+"""
+Server-directed location sampling.
+
+The ingest response tells the driver app how often to record a fix
+(`interval_s`), how far the driver must have moved for a fix to be worth
+recording (`min_distance_m`) and how often to upload the buffered batch
+(`batch_interval_s`). The numbers follow how much a new fix would tell us:
+little while parked, a lot when closing in on a stop (geofence precision) or
+when someone is watching the driver live.
+"""
+from services.geo import haversine_km
+from services.geofence import get_geofence_monitor
+from services.location_channel import get_location_channel
+
+MIN_INTERVAL_S = 5
+MAX_INTERVAL_S = 60
+# Below this speed (m/s) the driver counts as parked
+PARKED_SPEED_MS = 1.0
+HIGHWAY_SPEED_MS = 15.0
+# Within this distance of the next stop, sample for arrival detection
+APPROACH_DISTANCE_M = 300
+
+
+def _speed_ms(fixes):
+    """Reported speed of the newest fix, else derived from the last two fixes"""
+    latest = fixes[-1]
+    if latest.get('speed') is not None:
+        return latest['speed']
+    if len(fixes) < 2:
+        return None
+    prev = fixes[-2]
+    seconds = (latest['ts'] - prev['ts']).total_seconds()
+    if seconds <= 0:
+        return None
+    return haversine_km(prev['lat'], prev['lng'], latest['lat'], latest['lng']) * 1000 / seconds
+
+
+def next_sampling(driver_id, cluster_id, fixes):
+    """
+    Sampling parameters for the driver's next fixes.
+
+    Returns:
+        dict: interval_s, min_distance_m and batch_interval_s
+    """
+    latest = fixes[-1]
+    speed = _speed_ms(fixes)
+    viewers = get_location_channel().viewer_count(driver_id)
+    to_stop = get_geofence_monitor().next_stop_distance_m(cluster_id, latest['lat'], latest['lng']) if cluster_id else None
+
+    parked = speed is not None and speed < PARKED_SPEED_MS
+    if to_stop is not None and to_stop <= APPROACH_DISTANCE_M and not parked:
+        # Arrival detection needs dense fixes whoever is watching
+        interval, min_distance = MIN_INTERVAL_S, 10
+    else:
+        if parked:
+            interval, min_distance = MAX_INTERVAL_S, 25
+        elif speed is not None and speed >= HIGHWAY_SPEED_MS:
+            interval, min_distance = 15, 200
+        else:
+            interval, min_distance = 10, 50
+        # Live viewers want a smoother marker; nobody watching tolerates coarser fixes
+        interval = interval / 2 if viewers else interval * 2
+        interval = int(min(max(interval, MIN_INTERVAL_S), MAX_INTERVAL_S))
+    batch_interval = 5 if viewers else min(max(interval * 3, 10), 120)
+
+    return {'interval_s': interval, 'min_distance_m': min_distance, 'batch_interval_s': batch_interval}
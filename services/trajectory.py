@@ -0,0 +1,179 @@
+"""
+Driver trajectories rebuilt from the GPS history.
+
+The raw fixes of a cluster's trip (`driver_location_history`) are split into
+segments wherever the driver stopped reporting for a while, each segment is
+simplified with Douglas-Peucker and encoded as a Google polyline. Distances
+are measured on the raw fixes, so simplification never changes the
+kilometres reported.
+
+When a trip completes or its cluster is delivered, `save_trajectory` stores
+the trajectory in `trajectories` (and the kilometres driven on the cluster),
+which keeps replay possible after the raw history has expired.
+"""
+import math
+from datetime import datetime
+
+from bson import ObjectId
+
+from mongo import mongo
+from services.geo import haversine_km
+from services.location_ingest import HISTORY_COLLECTION
+
+# Points closer than this to the simplified line are dropped
+SIMPLIFY_TOLERANCE_M = 15
+# A silence longer than this starts a new segment
+SEGMENT_GAP_SECONDS = 300
+FINISHED_STATUSES = ('delivered', 'completed')
+
+METERS_PER_DEGREE = 111320
+
+
+def _offset_m(origin, point):
+    """Local planar (x, y) offset in metres of `point` from `origin`"""
+    x = (point[1] - origin[1]) * METERS_PER_DEGREE * math.cos(math.radians(origin[0]))
+    y = (point[0] - origin[0]) * METERS_PER_DEGREE
+    return x, y
+
+
+def _distance_to_segment_m(point, start, end):
+    px, py = _offset_m(start, point)
+    ex, ey = _offset_m(start, end)
+    length_sq = ex * ex + ey * ey
+    if length_sq == 0:
+        return math.hypot(px, py)
+    t = max(0.0, min(1.0, (px * ex + py * ey) / length_sq))
+    return math.hypot(px - t * ex, py - t * ey)
+
+
+def douglas_peucker(points, tolerance_m=SIMPLIFY_TOLERANCE_M):
+    """
+    Simplify a list of (lat, lng) points.
+
+    Returns:
+        list: indices of the points kept (first and last always included)
+    """
+    if len(points) < 3:
+        return list(range(len(points)))
+
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    # Iterative to stay clear of the recursion limit on long trips
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        max_dist = 0
+        index = None
+        for i in range(first + 1, last):
+            dist = _distance_to_segment_m(points[i], points[first], points[last])
+            if dist > max_dist:
+                max_dist = dist
+                index = i
+        if index is not None and max_dist > tolerance_m:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return [i for i, kept in enumerate(keep) if kept]
+
+
+def _encode_value(value):
+    value = ~(value << 1) if value < 0 else value << 1
+    chunks = []
+    while value >= 0x20:
+        chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+        value >>= 5
+    chunks.append(chr(value + 63))
+    return ''.join(chunks)
+
+
+def encode_polyline(points, precision=5):
+    """Encode (lat, lng) points in the Google polyline format"""
+    factor = 10 ** precision
+    result = []
+    prev_lat = prev_lng = 0
+    for lat, lng in points:
+        lat_i = int(round(lat * factor))
+        lng_i = int(round(lng * factor))
+        result.append(_encode_value(lat_i - prev_lat))
+        result.append(_encode_value(lng_i - prev_lng))
+        prev_lat, prev_lng = lat_i, lng_i
+    return ''.join(result)
+
+
+def _split_segments(fixes):
+    segments = []
+    current = []
+    for fix in fixes:
+        if current and (fix['ts'] - current[-1]['ts']).total_seconds() > SEGMENT_GAP_SECONDS:
+            segments.append(current)
+            current = []
+        current.append(fix)
+    if current:
+        segments.append(current)
+    return segments
+
+
+def _summarize(fixes):
+    points = [(f['lat'], f['lng']) for f in fixes]
+    kept = douglas_peucker(points)
+    start = fixes[0]['ts']
+    distance = sum(haversine_km(*points[i - 1], *points[i]) for i in range(1, len(points)))
+    return {
+        'start': start,
+        'end': fixes[-1]['ts'],
+        'raw_points': len(points),
+        'points': len(kept),
+        'distance_km': round(distance, 3),
+        'polyline': encode_polyline([points[i] for i in kept]),
+        # Seconds since segment start for each kept point, for replay
+        'offsets': [int((fixes[i]['ts'] - start).total_seconds()) for i in kept],
+    }
+
+
+def build_trajectory(cluster_id):
+    """Compute the trajectory of a cluster's trip from the raw GPS history"""
+    fixes = list(mongo.db[HISTORY_COLLECTION].find(
+        {'meta.cluster_id': cluster_id},
+        {'_id': 0, 'ts': 1, 'lat': 1, 'lng': 1}
+    ).sort('ts', 1))
+
+    segments = [_summarize(seg) for seg in _split_segments(fixes)]
+    return {
+        'cluster_id': cluster_id,
+        'segments': segments,
+        'distance_km': round(sum(s['distance_km'] for s in segments), 3),
+        'raw_points': len(fixes),
+        'points': sum(s['points'] for s in segments),
+        'computed_at': datetime.utcnow(),
+    }
+
+
+def save_trajectory(cluster_id):
+    """Build a finished trip's trajectory and store it (call when the trip completes or is delivered)"""
+    cluster_id = str(cluster_id)
+    trajectory = build_trajectory(cluster_id)
+    if trajectory['segments']:
+        mongo.db.trajectories.replace_one({'_id': cluster_id}, dict(trajectory, _id=cluster_id), upsert=True)
+        # Actual kilometres driven, next to the planned route
+        mongo.db.collection_clusters.update_one(
+            {'_id': ObjectId(cluster_id)},
+            {'$set': {'actual_distance_km': trajectory['distance_km']}}
+        )
+    return trajectory
+
+
+def get_trajectory(cluster_id, cluster_status=None):
+    """
+    Trajectory of a cluster: stored copy for finished trips, computed otherwise.
+
+    A finished trip without a stored copy (finished before trajectories were
+    saved on completion) is saved on this request.
+    """
+    stored = mongo.db.trajectories.find_one({'_id': cluster_id})
+    if stored:
+        stored.pop('_id', None)
+        return stored
+
+    if cluster_status in FINISHED_STATUSES:
+        return save_trajectory(cluster_id)
+    return build_trajectory(cluster_id)
@@ -0,0 +1,21 @@
+"""
+Case-insensitive prefix search of the admin user directory.
+
+Users carry lower-cased copies of their name and email (`name_lower`,
+`email_lower`), written on registration and by
+`migrate_user_search_fields.py` for older accounts. The search lower-cases the
+query and matches an anchored prefix on those fields, so the match ignores
+case.
+"""
+import re
+
+
+def search_fields(name, email):
+    """Lower-cased search copies of a user's name and email"""
+    return {'name_lower': (name or '').lower(), 'email_lower': (email or '').lower()}
+
+
+def prefix_filter(search):
+    """Filter matching users whose name or email starts with `search`, ignoring case"""
+    prefix = {'$regex': '^' + re.escape(search.lower())}
+    return {'$or': [{'name_lower': prefix}, {'email_lower': prefix}]}
@@ -0,0 +1,113 @@
+"""
+Payable amount of a pickup and its payout split.
+
+The amount is the engineer's price when one is set, otherwise the weight at the
+price tables' fallback rate with a floor of FALLBACK_MIN_AMOUNT. It is computed
+when the pickup is created, priced by the engineer or weighed, and stored on
+the pickup as `valuation` together with each role's share, so payment, invoice
+and earnings views read the stored figures instead of recomputing them.
+
+A weight-based valuation depends on the price tables: `refresh_valuations`
+(a scheduled job) recomputes unpaid ones stored under an older price-table
+version. Once a pickup is paid its valuation is frozen at the amount paid.
+"""
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from mongo import mongo
+from services.price_tables import get_price_tables, weight_kg
+from services.projections import projection
+
+# Payout split of every recycled pickup
+PAYOUT_SPLITS = {'user': 0.50, 'driver': 0.10, 'engineer': 0.15, 'warehouse': 0.25}
+
+# Floor of the weight-based amount (INR)
+FALLBACK_MIN_AMOUNT = 100
+
+REFRESH_BATCH_SIZE = 1000
+
+
+def _number(value):
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def split_amount(amount, splits=PAYOUT_SPLITS):
+    """Each role's share of an amount"""
+    return {role: round(amount * share, 2) for role, share in splits.items()}
+
+
+def compute_valuation(pickup, tables=None):
+    """
+    Valuation of a pickup from its engineer_price / final_weight / approx_weight.
+
+    Returns:
+        dict: amount, source ('engineer_price' or 'weight'), splits, price_version and valued_at
+    """
+    tables = tables or get_price_tables()
+    price = _number(pickup.get('engineer_price'))
+    if price > 0:
+        amount, source = price, 'engineer_price'
+    else:
+        weight = weight_kg(pickup.get('final_weight') or pickup.get('approx_weight'))
+        amount, source = max(weight * tables.fallback_rate, FALLBACK_MIN_AMOUNT), 'weight'
+    amount = round(amount, 2)
+    return {
+        'amount': amount,
+        'source': source,
+        'splits': split_amount(amount),
+        'price_version': tables.version,
+        'valued_at': datetime.utcnow(),
+    }
+
+
+def store_valuation(pickup_id):
+    """Recompute and store a pickup's valuation (call after its price or weight changed)"""
+    pickup = mongo.db.pickup_requests.find_one({'_id': ObjectId(pickup_id)}, projection('pickup_valuation_inputs'))
+    if not pickup:
+        return None
+    valuation = compute_valuation(pickup)
+    mongo.db.pickup_requests.update_one({'_id': pickup['_id']}, {'$set': {'valuation': valuation}})
+    return valuation
+
+
+def get_valuation(pickup):
+    """The stored valuation of a loaded pickup; computed and stored if it has none yet"""
+    if pickup.get('valuation'):
+        return pickup['valuation']
+    return store_valuation(pickup['_id'])
+
+
+def _refresh_filter(version):
+    """Unpaid pickups without a valuation or with a weight-based one of another price version"""
+    return {
+        'payment_status': {'$ne': 'paid'},
+        '$or': [
+            {'valuation': {'$exists': False}},
+            {'valuation.source': 'weight', 'valuation.price_version': {'$ne': version}},
+        ],
+    }
+
+
+def refresh_valuations(batch_size=REFRESH_BATCH_SIZE):
+    """Store missing valuations and recompute stale weight-based ones (paid pickups are left as paid)"""
+    tables = get_price_tables()
+    stale = _refresh_filter(tables.version)
+    count = 0
+    ops = []
+    for pickup in mongo.db.pickup_requests.find(stale, projection('pickup_valuation_inputs')).batch_size(batch_size):
+        # Same filter on write, so a pickup paid meanwhile keeps its valuation
+        ops.append(UpdateOne(dict(stale, _id=pickup['_id']),
+                             {'$set': {'valuation': compute_valuation(pickup, tables)}}))
+        if len(ops) == batch_size:
+            mongo.db.pickup_requests.bulk_write(ops, ordered=False)
+            count += len(ops)
+            ops = []
+    if ops:
+        mongo.db.pickup_requests.bulk_write(ops, ordered=False)
+        count += len(ops)
+    return count